@@ -0,0 +1,454 @@
+"""
+@package    FaidxGenome
+@brief      **Indexed random access to plain or BGZF compressed fasta files**
+Sequences are not loaded in memory. A samtools faidx compatible index (.fai) gives the offset and
+line layout of each sequence, and slices are read with seek and read. BGZF compressed files
+(bgzip) are accessed through a .gzi index of the compressed blocks. Both indexes are created next
+to the fasta file if missing or older than the fasta file. Reads go through a small LRU cache of
+file blocks so that the memory used is bounded whatever the size of the genome. Records mimick the
+part of the Biopython SeqRecord interface used by Reference. This module require the Third party
+packages numpy and Biopython.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from bisect import bisect_right
+from collections import OrderedDict
+from struct import unpack
+import gzip
+import zlib
+import os
+from os import path
+
+# Third party packages
+import numpy as np
+from Bio.SeqRecord import SeqRecord
+
+# Local packages
+from PackedGenome import PackedSeq
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Size of the blocks read in plain fasta files
+PLAIN_BLOCK_SIZE = 65536
+## Maximal number of decompressed or read blocks kept in the LRU cache of a file
+CACHE_BLOCKS = 256
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class BlockFile(object):
+    """
+    @class BlockFile
+    @brief Random access to the uncompressed content of a plain or BGZF file through an LRU cache
+    of blocks. Plain files are read by blocks of PLAIN_BLOCK_SIZE bytes and BGZF files by BGZF
+    blocks. The file is reopened in each process so that forked workers never share a file
+    position.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, fp, blocks=None, cache_blocks=CACHE_BLOCKS):
+        """
+        @param fp Path of the file (string)
+        @param blocks Compressed and uncompressed start offsets of the BGZF blocks as returned by
+        read_gzi, or None for a plain file (tuple of numpy arrays)
+        @param cache_blocks Maximal number of blocks in the cache (int)
+        """
+        self.fp = fp
+        self.cache_blocks = cache_blocks
+        # Block offsets as lists for fast bisection
+        self.cstarts, self.ustarts = [offsets.tolist() for offsets in blocks] if blocks else (None, None)
+        self.cache = OrderedDict()
+        self.hits = self.misses = 0
+        self.handle = None
+        self.pid = None
+
+    def __repr__(self):
+        return "{}\nFile : {}\nCached blocks : {}\nHits : {}\nMisses : {}\n".format(
+            self.__str__(), self.fp, len(self.cache), self.hits, self.misses)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def read(self, offset, size):
+        """
+        @param offset Offset in the uncompressed content of the file (int)
+        @param size Number of bytes to read (int)
+        @return The uncompressed bytes, shorter than size at the end of the file (string)
+        """
+        end = offset + size
+        chunks = []
+        while offset < end:
+            block_start, data = self._block(offset)
+            if not data:
+                break
+            chunks.append(data[offset-block_start:end-block_start])
+            offset = block_start + len(data)
+        return "".join(chunks)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _block(self, offset):
+        """
+        Return the block containing an offset from the cache or from the file
+        @param offset Offset in the uncompressed content of the file (int)
+        @return The uncompressed start offset and the content of the block (tuple)
+        """
+        if self.ustarts is None:
+            i = offset // PLAIN_BLOCK_SIZE
+        else:
+            i = bisect_right(self.ustarts, offset) - 1
+
+        if i in self.cache:
+            self.hits += 1
+            block = self.cache.pop(i)
+        else:
+            self.misses += 1
+            block = self._load(i)
+            if len(self.cache) >= self.cache_blocks:
+                self.cache.popitem(last=False)
+        self.cache[i] = block
+        return block
+
+    def _load(self, i):
+        """
+        Read and decompress the block i
+        @param i Index of the block (int)
+        @return The uncompressed start offset and the content of the block (tuple)
+        """
+        if self.pid != os.getpid():
+            self.handle = open(self.fp, "rb")
+            self.pid = os.getpid()
+
+        if self.ustarts is None:
+            self.handle.seek(i * PLAIN_BLOCK_SIZE)
+            return i * PLAIN_BLOCK_SIZE, self.handle.read(PLAIN_BLOCK_SIZE)
+
+        self.handle.seek(int(self.cstarts[i]))
+        block = self.handle.read(bgzf_block_size(self.handle.read(18)) - 18)
+        # Raw deflate data between the 18 bytes header and the 8 bytes footer (CRC32 and ISIZE)
+        return int(self.ustarts[i]), zlib.decompress(block[:-8], -15)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class FaidxGenome(object):
+    """
+    @class FaidxGenome
+    @brief Give access to the sequences of an indexed fasta file as FaidxRecord objects. Bases are
+    read only when a slice is requested.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, fasta_path, cache_blocks=CACHE_BLOCKS):
+        """
+        Load or create the indexes of the fasta file
+        @param fasta_path Path of a plain or BGZF compressed fasta file (string)
+        @param cache_blocks Maximal number of blocks in the cache (int)
+        @exception IOError Raise if the file is gzip compressed but not in BGZF format
+        """
+        self.fasta_path = fasta_path
+        blocks = None
+
+        if is_bgzf(fasta_path):
+            gzi_path = fasta_path + ".gzi"
+            if _up_to_date(fasta_path, gzi_path):
+                blocks = read_gzi(gzi_path)
+            else:
+                blocks = build_gzi(fasta_path)
+                _try_write(write_gzi, gzi_path, blocks)
+        elif is_gzip(fasta_path):
+            raise IOError("{} is gzip compressed but not in BGZF format. Recompress it with bgzip \
+to use indexed access".format(fasta_path))
+
+        fai_path = fasta_path + ".fai"
+        if _up_to_date(fasta_path, fai_path):
+            entries = read_fai(fai_path)
+        else:
+            entries = build_fai(fasta_path)
+            _try_write(write_fai, fai_path, entries)
+
+        self.file = BlockFile(fasta_path, blocks, cache_blocks)
+        ## List of FaidxRecord in the order of the fasta file
+        self.records = [FaidxRecord(self, *entry) for entry in entries]
+
+    def __repr__(self):
+        return "{}\nFile : {}\nNumber of contigs : {}\n".format(
+            self.__str__(), self.fasta_path, len(self.records))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_records(self):
+        return self.records
+
+    def to_dict(self):
+        """
+        @return A dictionnary of FaidxRecord indexed by contig name
+        """
+        return {record.id : record for record in self.records}
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def read(self, offset, size):
+        """
+        @param offset Offset in the uncompressed fasta file (int)
+        @param size Number of bytes to read (int)
+        @return The uncompressed bytes (string)
+        """
+        return self.file.read(offset, size)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class FaidxRecord(object):
+    """
+    @class FaidxRecord
+    @brief Sequence of a FaidxGenome. Slicing the record read the requested bases and return a
+    Biopython SeqRecord, as would do slicing the SeqRecord parsed from the fasta file.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, genome, name, length, offset, line_bases, line_width):
+        """
+        @param genome FaidxGenome containing the sequence
+        @param name Name of the sequence (string)
+        @param length Number of bases of the sequence (int)
+        @param offset Offset of the first base in the uncompressed fasta file (int)
+        @param line_bases Number of bases per line (int)
+        @param line_width Number of bytes per line including the end of line (int)
+        """
+        self.genome = genome
+        self.id = self.name = self.description = name
+        self.annotations = {}
+        self.length = length
+        self.offset = offset
+        self.line_bases = line_bases
+        self.line_width = line_width
+
+        ## Seq like object allowing to slice the record sequence
+        self.seq = PackedSeq(self)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "{}\nID: {}\nIndexed sequence of {} bases\n".format(
+            self.__str__(), self.id, self.length)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __getitem__(self, index):
+        """
+        Read a slice of the sequence in a SeqRecord like Biopython slicing of a SeqRecord
+        @param index A slice object with a step of 1
+        @return A SeqRecord object containing the sequence
+        """
+        return SeqRecord(self.seq[index], id=self.id, name=self.name, description=self.description)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def fetch(self, start, end):
+        """
+        Read the bases between start and end
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return The sequence with its original case (string)
+        """
+        start = max(0, start)
+        end = min(self.length, end)
+        if end <= start:
+            return ""
+
+        first = self._file_offset(start)
+        last = self._file_offset(end - 1) + 1
+        return self.genome.read(first, last - first).translate(None, "\r\n")
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _file_offset(self, pos):
+        """
+        @param pos Position along the sequence (int)
+        @return Offset of the base in the uncompressed fasta file (int)
+        """
+        return self.offset + (pos // self.line_bases) * self.line_width + pos % self.line_bases
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def import_faidx(fasta_path):
+    """
+    Open an indexed fasta file
+    @param fasta_path Path of a plain or BGZF compressed fasta file (string)
+    @return A list of FaidxRecord in the order of the fasta file
+    """
+    print("\tOpening indexed fasta file")
+    return FaidxGenome(fasta_path).get_records()
+
+def is_gzip(fp):
+    """
+    @param fp Path of the file to verify (string)
+    @return True if the file starts with the gzip magic number (bool)
+    """
+    with open(fp, "rb") as handle:
+        return handle.read(2) == "\x1f\x8b"
+
+def is_bgzf(fp):
+    """
+    @param fp Path of the file to verify (string)
+    @return True if the file starts with a BGZF block header (bool)
+    """
+    with open(fp, "rb") as handle:
+        try:
+            bgzf_block_size(handle.read(18))
+            return True
+        except IOError:
+            return False
+
+def bgzf_block_size(header):
+    """
+    @param header First 18 bytes of a BGZF block (string)
+    @return The total size of the block read in the BC extra subfield (int)
+    @exception IOError Raise if the header is not a BGZF block header
+    """
+    if (len(header) < 18 or header[:4] != "\x1f\x8b\x08\x04" or unpack("<H", header[10:12])[0] != 6
+        or header[12:14] != "BC"):
+        raise IOError("Invalid BGZF block header")
+    return unpack("<H", header[16:18])[0] + 1
+
+def build_gzi(fp):
+    """
+    List the BGZF blocks of a file by reading their headers and footers only
+    @param fp Path of a BGZF file (string)
+    @return Numpy arrays of compressed and uncompressed start offsets of the blocks (tuple)
+    """
+    print("\tIndexing BGZF blocks of {}".format(fp))
+    cstarts = []
+    ustarts = []
+    coffset = uoffset = 0
+    file_size = path.getsize(fp)
+
+    with open(fp, "rb") as handle:
+        while coffset < file_size:
+            handle.seek(coffset)
+            size = bgzf_block_size(handle.read(18))
+            # Uncompressed size (ISIZE) in the last 4 bytes of the block
+            handle.seek(coffset + size - 4)
+            cstarts.append(coffset)
+            ustarts.append(uoffset)
+            uoffset += unpack("<I", handle.read(4))[0]
+            coffset += size
+
+    return np.array(cstarts, dtype=np.uint64), np.array(ustarts, dtype=np.uint64)
+
+def read_gzi(gzi_path):
+    """
+    Read a gzi index (htslib format : number of entries followed by pairs of compressed and
+    uncompressed offsets, the first block being implicit)
+    @param gzi_path Path of the gzi file (string)
+    @return Numpy arrays of compressed and uncompressed start offsets of the blocks (tuple)
+    """
+    with open(gzi_path, "rb") as handle:
+        data = np.frombuffer(handle.read(), dtype="<u8")
+    pairs = data[1:1+2*int(data[0])].reshape(-1, 2)
+    return (np.concatenate(([0], pairs[:,0])).astype(np.uint64),
+        np.concatenate(([0], pairs[:,1])).astype(np.uint64))
+
+def write_gzi(gzi_path, blocks):
+    """
+    Write a gzi index readable by htslib
+    @param gzi_path Path of the gzi file (string)
+    @param blocks Numpy arrays of compressed and uncompressed start offsets of the blocks (tuple)
+    """
+    cstarts, ustarts = blocks
+    pairs = np.column_stack((cstarts[1:], ustarts[1:])).astype("<u8")
+    with open(gzi_path, "wb") as handle:
+        handle.write(np.array([len(pairs)], dtype="<u8").tostring() + pairs.tostring())
+
+def build_fai(fasta_path):
+    """
+    Create a faidx index of a plain or BGZF compressed fasta file by reading it line by line
+    @param fasta_path Path of the fasta file (string)
+    @return A list of entries : name, length, offset, line bases and line width (list of list)
+    @exception IOError Raise if lines of a sequence other than the last one have different lengths
+    """
+    print("\tIndexing sequences of {}".format(fasta_path))
+    handle = gzip.open(fasta_path, "rb") if is_gzip(fasta_path) else open(fasta_path, "rb")
+    entries = []
+    offset = 0
+    # True once a line shorter than the others was found in the current sequence
+    last_line = False
+
+    for line in handle:
+        if line.startswith(">"):
+            entries.append([line[1:].split()[0], 0, offset + len(line), 0, 0])
+            last_line = False
+
+        elif entries:
+            entry = entries[-1]
+            bases = len(line.rstrip("\r\n"))
+            if bases and last_line:
+                raise IOError("Lines of different lengths in sequence {} of {}. The file can not be \
+indexed".format(entry[0], fasta_path))
+            if not entry[3]:
+                entry[3], entry[4] = bases, len(line)
+            elif bases != entry[3] or len(line) != entry[4]:
+                last_line = True
+            entry[1] += bases
+
+        offset += len(line)
+
+    handle.close()
+    return entries
+
+def read_fai(fai_path):
+    """
+    @param fai_path Path of a faidx index (string)
+    @return A list of entries : name, length, offset, line bases and line width (list of list)
+    """
+    with open(fai_path, "r") as handle:
+        return [[fields[0]] + [int(val) for val in fields[1:5]]
+            for fields in (line.rstrip("\n").split("\t") for line in handle) if len(fields) >= 5]
+
+def write_fai(fai_path, entries):
+    """
+    Write a faidx index readable by samtools
+    @param fai_path Path of the faidx index (string)
+    @param entries List of entries : name, length, offset, line bases and line width (list of list)
+    """
+    with open(fai_path, "w") as handle:
+        for entry in entries:
+            handle.write("\t".join(str(val) for val in entry) + "\n")
+
+def _up_to_date(fasta_path, index_path):
+    """
+    @return True if the index file exists and is more recent than the fasta file (bool)
+    """
+    return path.isfile(index_path) and path.getmtime(index_path) >= path.getmtime(fasta_path)
+
+def _try_write(write_function, index_path, data):
+    """
+    Write an index next to the fasta file under a temporary name. Indexes are facultative if the
+    directory is not writable
+    @param write_function Function writing the index (function)
+    @param index_path Path of the index (string)
+    @param data Data to write
+    """
+    tmp = "{}.{}.tmp".format(index_path, os.getpid())
+    try:
+        write_function(tmp, data)
+        os.rename(tmp, index_path)
+    except (IOError, OSError):
+        pass
@@ -11,6 +11,15 @@ QualGenerator to form an enhanced SeqRecord object ready to be exported in fastq
 * [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
 """
 
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Third party packages
+from Bio.SeqIO.QualityIO import solexa_quality_from_phred, SANGER_SCORE_OFFSET, SOLEXA_SCORE_OFFSET
+
+# Local packages
+from Reference import ReferenceJunctions
+from RandomStream import DEFAULT_STREAM
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class FastqGenerator(object):
     """
@@ -21,15 +30,28 @@ class FastqGenerator(object):
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, slicer, qualgen):
+    def __init__(self, slicer, qualgen, qual_scale="fastq-sanger", rng=None):
         """
         Initiate object with references to instances of SlicePicker and QualGenerator
         @param slicer   Instance of SlicePicker(Pair or Single)
         @param qualgen  Instance of QualGenerator
+        @param qual_scale Quality scale of quality strings of raw reads (fastq-sanger, fastq-solexa,
+        fastq-illumina) (string)
+        @param rng RandomStream shared by the sources, slicer and qualgen, reseeded at the beginning
+        of each block of reads (default = DEFAULT_STREAM)
         """
+        # Random stream
+        self.rng = rng or DEFAULT_STREAM
         # Store link to SlicePicker and QualGenerator object
         self.slicer = slicer
         self.qualgen = qualgen
+        # Characters encoding PHRED values in the quality scale
+        self.qual_scale = qual_scale
+        self.qual_chars = phred_chars(qual_scale)
+        # Translation table converting raw PHRED bytes in characters of the quality scale
+        self.qual_table = phred_table(qual_scale)
+        # Number of the first read of each source name for short numeric read ids (see set_offsets)
+        self.offsets = None
 
     def __repr__(self):
         return "{}\n QualGenerator :\n{}\nSlicePicker :\n{}\n".format(
@@ -48,6 +70,155 @@ class FastqGenerator(object):
     def get_qualgen(self):
         return self.qualgen
 
+    def get_qual_scale(self):
+        return self.qual_scale
+
+    def get_offsets(self):
+        return self.offsets
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def set_offsets(self, offsets):
+        """
+        Identify reads by short numeric ids, the number of a read in its source added to the
+        number of the first read of the source in the whole dataset (see read_offsets)
+        @param offsets Number of the first read of each source name, or None to use descriptive
+        read ids (dict)
+        """
+        self.offsets = offsets
+
+    def seed_block(self, source, block):
+        """
+        Reseed the random stream for a block of reads of a source. The reads of the block then only
+        depend on the seed of the stream, the name of the source and the block number, whatever the
+        blocks generated before.
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @param block Number of the block in the source (int)
+        """
+        self.rng.reseed(source.getName(), block)
+
+    def iter_blocks(self, source_list, n=None, block_size=1000, shard=(1, 1)):
+        """
+        Lazily generate blocks of reads from a list of sources with generate_block. Only one block
+        is held in memory at a time.
+        @param source_list List of [source, number of reads] with source an instance of
+        ReferenceGenome or ReferenceJunctions (list)
+        @param n Maximal number of reads (or read pairs) to generate from all sources, split between
+        sources in proportion to their number of reads (see scale_counts), by default all the reads
+        requested in source_list (int)
+        @param block_size Number of reads (or read pairs) generated at once. The random stream is
+        reseeded at the beginning of each block (int)
+        @param shard Tuple of the shard number i and the number of shards N, to generate only the
+        ith of N contiguous parts of the reads (see shard_ranges)
+        @return A generator of tuples containing the source, the number of the first read of the
+        block in the source, the number of digits of read numbers in the source and the list of
+        RawRead (or RawRead pairs) of the block
+        """
+        # Reduce the numbers of reads of all sources to n reads, keeping their proportions
+        scaled = scale_counts(source_list, n) if n is not None else source_list
+
+        for source_idx, first, nread in shard_ranges(scaled, shard, block_size):
+            source = scaled[source_idx][0]
+            id_len = len(str(source_list[source_idx][1]))
+
+            for block_start in xrange(first, first + nread, block_size):
+                self.seed_block(source, block_start // block_size)
+                yield source, block_start, id_len, self.generate_block(source,
+                    min(block_size, first + nread - block_start))
+
+    def iter_reads(self, source_list, n=None, batch_size=None, block_size=1000, shard=(1, 1)):
+        """
+        Lazily generate reads from a list of sources as tuples of identifier, sequence and quality
+        strings, for a direct use by another program without writing fastq files. Reads are
+        generated by blocks so that memory usage is bounded by the block and batch sizes.
+        @param source_list List of [source, number of reads] with source an instance of
+        ReferenceGenome or ReferenceJunctions (list)
+        @param n Maximal number of reads (or read pairs) to generate from all sources, split between
+        sources in proportion to their number of reads (see scale_counts), by default all the reads
+        requested in source_list (int)
+        @param batch_size If given, reads are yielded by lists of at most batch_size reads (int)
+        @param block_size Number of reads (or read pairs) generated at once (int)
+        @param shard Tuple of the shard number i and the number of shards N (see shard_ranges)
+        @return A generator of reads as (id, seq, qual) tuples, or pairs of tuples in pair end mode,
+        or of lists of reads if batch_size is given
+        """
+        batch = []
+        for source, first, id_len, reads in self.iter_blocks(source_list, n, block_size, shard):
+            records = self._block_records(reads, first, id_len)
+            if not batch_size:
+                for record in records:
+                    yield record
+                continue
+
+            batch.extend(records)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+
+        if batch:
+            yield batch
+
+    def raw_record(self, read, i, id_len):
+        """
+        Convert a RawRead into a tuple ready to be written in fastq format
+        @param read RawRead object with a quality string
+        @param i Num of the read (integer)
+        @param id_len Max number of digit
+        @return A tuple containing the read identifier, sequence and quality strings
+        """
+        if self.offsets is not None:
+            return (str(self.offsets[read.source.getName()] + i), read.seq, read.qual)
+        return (read_id(i, id_len, read.source, read.refseq, read.start, read.end, self.slicer.read_len),
+            read.seq, read.qual)
+
+    def record_formatter(self, source, id_len):
+        """
+        Precompute the fastq record template of a source, with the source name, the zero padding of
+        read numbers and the constant part of the origin description already formated. The
+        returned function formats a read with a single string interpolation, the output being
+        identical to raw_record (see read_id).
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @param id_len Max number of digit
+        @return A function formating a RawRead and its number in a fastq record (function)
+        """
+        # Short numeric ids do not describe the origin of reads
+        if self.offsets is not None:
+            offset = self.offsets[source.getName()]
+            return lambda read, i: "@%d\n%s\n+\n%s\n" % (i + offset, read.seq, read.qual)
+
+        prefix = "@{}|%0{}d|".format(source.getName().replace("%", "%%"), id_len)
+
+        # The origin of junction reads is described by the source
+        if isinstance(source, ReferenceJunctions):
+            template = prefix + "1|%s\n%s\n+\n%s\n"
+            coord = source.origin_coord
+            return lambda read, i: template % (
+                i, coord(read.refseq, read.start, read.end), read.seq, read.qual)
+
+        template = prefix + "0|1-{}=%s:%d-%d\n%s\n+\n%s\n".format(self.slicer.read_len)
+        return lambda read, i: template % (
+            i, read.refseq.id, read.start, read.end, read.seq, read.qual)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _qual_strings(self, n):
+        """
+        @param n Number of quality strings to generate (int)
+        @return A list of n quality strings generated by qualgen in a single batch and encoded in
+        the quality scale (list of string)
+        """
+        length = self.qualgen.get_length()
+        # Translate the raw bytes of the whole batch matrix at once and split them in strings of
+        # read length
+        buf = self.qualgen.qual_scores(n).tostring().translate(self.qual_table)
+        return [buf[i:i+length] for i in xrange(0, n*length, length)]
+
+    def _qual_string(self):
+        """
+        @return A quality string generated by qualgen encoded in the quality scale (string)
+        """
+        return str(bytearray(self.qualgen.qual_score())).translate(self.qual_table)
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class FastqGeneratorSingle(FastqGenerator):
     """
@@ -78,6 +249,71 @@ class FastqGeneratorSingle(FastqGenerator):
 
         return read
 
+    def generate_raw (self, source):
+        """
+        Raw read counterpart of generate_fastq. Ask a single RawRead to source with slicer and add
+        a quality string generated with qualgen
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @return A RawRead object including an encoded quality string
+        """
+        # Ask a RawRead slice to a reference sequence source
+        try:
+            read = self.slicer.pick_raw(source)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Add an encoded quality string the RawRead
+        read.qual = self._qual_string()
+
+        return read
+
+    def generate_block (self, source, n):
+        """
+        Block counterpart of generate_raw. Ask n RawRead to source with slicer and add quality
+        strings generated by qualgen in a single batch
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @param n Number of reads to generate (int)
+        @return A list of RawRead objects including an encoded quality string
+        """
+        # Ask n RawRead slices to a reference sequence source
+        try:
+            reads = self.slicer.pick_block(source, n)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Add encoded quality strings the RawReads
+        for read, qual in zip(reads, self._qual_strings(n)):
+            read.qual = qual
+
+        return reads
+
+    def format_block (self, reads, first, id_len, interleave=False):
+        """
+        Format a block of reads generated by generate_block in fastq text
+        @param reads List of RawRead generated by generate_block
+        @param first Number of the first read of the block in its source (int)
+        @param id_len Max number of digit
+        @param interleave Unused in single end mode (bool)
+        @return A list containing the fastq text of the block (list of string)
+        """
+        if not reads:
+            return [""]
+        fmt = self.record_formatter(reads[0].source, id_len)
+        return ["".join([fmt(read, i) for i, read in enumerate(reads, first)])]
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _block_records(self, reads, first, id_len):
+        """
+        @param reads List of RawRead generated by generate_block
+        @param first Number of the first read of the block in its source (int)
+        @param id_len Max number of digit
+        @return A list of (id, seq, qual) tuples
+        """
+        return [self.raw_record(read, i, id_len) for i, read in enumerate(reads, first)]
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class FastqGeneratorPair(FastqGenerator):
     """
@@ -110,3 +346,198 @@ class FastqGeneratorPair(FastqGenerator):
 
         return read1, read2
 
+    def generate_raw (self, source):
+        """
+        Raw read counterpart of generate_fastq. Ask a pair of RawRead to source with slicer and add
+        quality strings generated with qualgen to both reads
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @return A pair of RawRead objects including an encoded quality string
+        """
+        # Ask a RawRead slice to a reference sequence source
+        try:
+            read1, read2 = self.slicer.pick_raw(source)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Add an encoded quality string the RawReads
+        read1.qual = self._qual_string()
+        read2.qual = self._qual_string()
+
+        return read1, read2
+
+    def generate_block (self, source, n):
+        """
+        Block counterpart of generate_raw. Ask n RawRead pairs to source with slicer and add
+        quality strings generated by qualgen in a single batch
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @param n Number of read pairs to generate (int)
+        @return A list of RawRead pairs including an encoded quality string (list of tuples)
+        """
+        # Ask n RawRead pairs to a reference sequence source
+        try:
+            pairs = self.slicer.pick_block(source, n)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Add encoded quality strings the RawReads
+        quals = self._qual_strings(2*n)
+        for i, (read1, read2) in enumerate(pairs):
+            read1.qual = quals[2*i]
+            read2.qual = quals[2*i+1]
+
+        return pairs
+
+    def format_block (self, pairs, first, id_len, interleave=False):
+        """
+        Format a block of read pairs generated by generate_block in fastq text
+        @param pairs List of RawRead pairs generated by generate_block
+        @param first Number of the first read pair of the block in its source (int)
+        @param id_len Max number of digit
+        @param interleave If True R1 and R2 records are interleaved in a single text (bool)
+        @return A list containing the R1 and R2 fastq texts of the block, or the interleaved text
+        (list of string)
+        """
+        if not pairs:
+            return [""] if interleave else ["", ""]
+        fmt = self.record_formatter(pairs[0][0].source, id_len)
+        if interleave:
+            return ["".join([fmt(read1, i) + fmt(read2, i)
+                for i, (read1, read2) in enumerate(pairs, first)])]
+        return ["".join([fmt(read1, i) for i, (read1, read2) in enumerate(pairs, first)]),
+            "".join([fmt(read2, i) for i, (read1, read2) in enumerate(pairs, first)])]
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _block_records(self, pairs, first, id_len):
+        """
+        @param pairs List of RawRead pairs generated by generate_block
+        @param first Number of the first read pair of the block in its source (int)
+        @param id_len Max number of digit
+        @return A list of pairs of (id, seq, qual) tuples
+        """
+        return [(self.raw_record(read1, i, id_len), self.raw_record(read2, i, id_len))
+            for i, (read1, read2) in enumerate(pairs, first)]
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def shard_ranges(source_list, shard=(1, 1), block_size=1000):
+    """
+    Split the blocks of reads of all sources laid end to end in N contiguous shards and return the
+    ranges of reads of the shard i. Since blocks of reads only depend on the seed, the source and
+    the block number, the concatenation of shards 1 to N is identical to the complete dataset.
+    @param source_list List of [source, number of reads] (list)
+    @param shard Tuple of the shard number i (from 1 to N) and the number of shards N
+    @param block_size Number of reads in a block (int)
+    @return A list of ranges as [source index, first read, number of reads]
+    """
+    i, n_shard = shard
+    n_blocks = [(nread + block_size - 1) // block_size for source, nread in source_list]
+    total = sum(n_blocks)
+    shard_start, shard_end = (i-1) * total // n_shard, i * total // n_shard
+
+    ranges = []
+    offset = 0
+    for source_idx, (source, nread) in enumerate(source_list):
+        # Blocks of the source overlapping the shard
+        start = max(shard_start, offset) - offset
+        end = min(shard_end, offset + n_blocks[source_idx]) - offset
+        if start < end:
+            first = start * block_size
+            ranges.append([source_idx, first, min(end * block_size, nread) - first])
+        offset += n_blocks[source_idx]
+
+    return ranges
+
+def scale_counts(source_list, n):
+    """
+    Scale the numbers of reads of sources to a total of n reads, keeping their proportions as the
+    frequencies of the configuration file. Reads left by rounding down are given to the sources with
+    the largest remainders, so that exactly n reads are generated if n is lower than the total
+    @param source_list List of [source, number of reads] (list)
+    @param n Total number of reads (int)
+    @return A list of [source, number of reads] (list)
+    """
+    total = sum([nread for source, nread in source_list])
+    if n >= total:
+        return [[source, nread] for source, nread in source_list]
+
+    counts = [nread * n // total for source, nread in source_list]
+    remainders = [nread * n % total for source, nread in source_list]
+    for i in sorted(range(len(counts)), key=lambda i: -remainders[i])[:n - sum(counts)]:
+        counts[i] += 1
+    return [[source, count] for (source, nread), count in zip(source_list, counts)]
+
+def read_offsets(source_list):
+    """
+    Number the reads of all sources laid end to end, whatever the shard generated, so that the
+    numeric id of a read is uniq in the whole dataset
+    @param source_list List of [source, number of reads] (list)
+    @return The number of the first read of each source name (dict)
+    """
+    offsets = {}
+    total = 0
+    for source, nread in source_list:
+        offsets[source.getName()] = total
+        total += nread
+    return offsets
+
+def read_id(i, id_len, source, refseq, start, end, read_len):
+    """
+    Generate an identifier indicating from where the read was sampled. The id
+    contains the name of the source an uniq numeric identifier, a bolean set to
+    True is the original sequence is a junction and a description of the origin
+    sequence by read positions. Example: 1-75=Bact:330-405 means that bases
+    position 1 to 75 from the read originates from positions 333-405 from bact
+    reference sequences.
+    @param  i   Num of the read (integer)
+    @param  id_len Max number of digit
+    @param  source Reference object from which the read was sampled
+    @param  refseq Sequence of the source from which the read was sampled
+    @param  start Start position of the read along refseq (integer)
+    @param  end End position of the read along refseq (integer)
+    @param  read_len Lenght of the reads (integer)
+    @return A descriptive and uniq string.
+    """
+    # Add source name
+    id_string = "{}".format(source.getName())
+    # Add an uniq numeric identifier per source with zero padding
+    id_string += "|{0:0{1}}".format(i, id_len)
+
+    # If the source is a junction coordinate along original references are asked
+    # to the source reference junction in which the read was sampled
+    if isinstance (source, ReferenceJunctions):
+        id_string += "|1|{}".format(source.origin_coord(refseq, start, end))
+    # Just enter strored coordinates if the reference is a ReferenceGenome obj
+    else:
+        id_string += "|0|1-{}={}:{}-{}".format(read_len, refseq.id, start, end)
+
+    return id_string
+
+def phred_chars(qual_scale):
+    """
+    List the characters encoding PHRED values from 0 to 62 in a fastq quality scale, identical to
+    the encoding used by Biopython SeqIO to write SeqRecord objects.
+    @param qual_scale fastq-sanger, fastq-solexa or fastq-illumina (string)
+    @return A list of characters indexed by PHRED value
+    """
+    if qual_scale == "fastq-sanger":
+        return [chr(min(126, q + SANGER_SCORE_OFFSET)) for q in range(63)]
+    if qual_scale == "fastq-illumina":
+        return [chr(q + SOLEXA_SCORE_OFFSET) for q in range(63)]
+    if qual_scale == "fastq-solexa":
+        return [chr(min(126, int(round(solexa_quality_from_phred(q))) + SOLEXA_SCORE_OFFSET))
+            for q in range(63)]
+    raise ValueError("Invalid quality scale {}".format(qual_scale))
+
+
+def phred_table(qual_scale):
+    """
+    Create a translation table converting bytes of raw PHRED values (0 to 62) in the characters
+    encoding them in a fastq quality scale (see phred_chars). Other bytes are unchanged.
+    @param qual_scale fastq-sanger, fastq-solexa or fastq-illumina (string)
+    @return A translation table usable with str.translate (string)
+    """
+    chars = phred_chars(qual_scale)
+    return "".join(chars) + "".join([chr(i) for i in range(len(chars), 256)])
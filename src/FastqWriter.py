@@ -0,0 +1,358 @@
+"""
+@package    FastqWriter
+@brief      **Output layer writing fastq text in plain, gzip, BGZF or named pipe files**
+Each writer owns a thread consuming a bounded queue of data blocks, so that the compression of
+several output files (R1 and R2) run concurrently and overlap with read generation. The zlib
+compression releases the GIL. The BGZF writer compresses independent blocks of at most 64 kb in a
+pool of threads and produces a seekable gzip file readable by any gzip decompressor. Records are
+accumulated in a RecordBuffer and given to the writers by blocks of several MB. The queues of the
+writers record their depth, to show if the compression is the bottleneck of a run.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from threading import Thread
+from multiprocessing.pool import ThreadPool
+from struct import pack
+import gzip
+import zlib
+import os
+
+# Local packages
+from Pipeline import StatQueue
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Maximal number of data blocks waiting in the queue of a writer
+QUEUE_SIZE = 64
+## Maximal size of uncompressed data in a BGZF block
+BGZF_BLOCK_SIZE = 65280
+## Empty BGZF block marking the end of a BGZF file
+BGZF_EOF = "1f8b08040000000000ff0600424302001b0003000000000000000000".decode("hex")
+## Size of the buffer of a RecordBuffer written at once in its file handle
+FLUSH_SIZE = 4194304
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class FastqWriter(object):
+    """
+    @class FastqWriter
+    @brief Base class of writers. Data given to write() are queued and written by a dedicated
+    thread in the file opened by _open(). NOT intended to be instanciated.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, path):
+        """
+        Open the output file and start the writing thread
+        @param path Path of the output file (string)
+        """
+        self.path = path
+        self.handle = self._open(path)
+        self.queue = StatQueue(path, "write", "compress " + os.path.basename(path), QUEUE_SIZE)
+        self.error = None
+        self.thread = Thread(target=self._run, name="Writer {}".format(path))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __repr__(self):
+        return "{}\nFile : {}\n".format(self.__str__(), self.path)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_path(self):
+        return self.path
+
+    def get_queue_stats(self):
+        """
+        @return The depth and waiting statistics of the queue of the writer (dict)
+        """
+        return self.queue.stats()
+
+    def set_producer(self, producer):
+        """
+        Name the step of the run giving data to the writer, "write" by default
+        @param producer Name of the step putting data in the queue of the writer (string)
+        """
+        self.queue.producer = producer
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def write(self, data):
+        """
+        Queue data to be written by the writing thread. Block if the queue is full
+        @param data Text to write (string)
+        @exception IOError Raise if the writing thread failed
+        """
+        if self.error:
+            raise self.error
+        if data:
+            self.queue.put(data)
+
+    def close(self):
+        """
+        Wait for the writing thread to write all queued data and close the output file
+        @exception IOError Raise if the writing thread failed
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _run(self):
+        """
+        Writing thread loop consuming the queue until None is received
+        """
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self._write(data)
+            self._close()
+
+        except (IOError, OSError, zlib.error) as E:
+            self.error = IOError("Error while writing {} : {}".format(self.path, E))
+            # Consume the queue to unblock the main thread
+            while data is not None:
+                data = self.queue.get()
+
+    def _open(self, path):
+        return open(path, "wb")
+
+    def _write(self, data):
+        self.handle.write(data)
+
+    def _close(self):
+        self.handle.close()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class PlainWriter(FastqWriter):
+    """
+    @class PlainWriter
+    @brief Write uncompressed text
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    pass
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class PipeWriter(FastqWriter):
+    """
+    @class PipeWriter
+    @brief Write uncompressed text in a named pipe created if needed, allowing to stream reads
+    directly in another program (for instance an aligner). Opening the pipe blocks until a reader
+    opens the other side.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _open(self, path):
+        if not os.path.exists(path):
+            os.mkfifo(path)
+        print ("\tWaiting for a reader on named pipe {}".format(path))
+        return open(path, "wb")
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class GzipWriter(FastqWriter):
+    """
+    @class GzipWriter
+    @brief Write gzip compressed text at a given compression level
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, path, level=6):
+        """
+        @param path Path of the output file (string)
+        @param level Compression level from 1 (fast) to 9 (small) (int)
+        """
+        self.level = level
+        super(GzipWriter, self).__init__(path)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _open(self, path):
+        return gzip.open(path, "wb", self.level)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class BgzfWriter(FastqWriter):
+    """
+    @class BgzfWriter
+    @brief Write BGZF compressed text. Data are cut in blocks compressed independently as gzip
+    members with a BC extra field giving the block size (SAM/BAM specification). Blocks are
+    compressed in parallel by a pool of threads and written in order.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, path, level=6, threads=1):
+        """
+        @param path Path of the output file (string)
+        @param level Compression level from 1 (fast) to 9 (small) (int)
+        @param threads Number of threads compressing blocks (int)
+        """
+        self.level = level
+        self.threads = threads
+        self.pool = ThreadPool(threads) if threads > 1 else None
+        self.buffer = []
+        self.buffer_len = 0
+        super(BgzfWriter, self).__init__(path)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _write(self, data):
+        """
+        Buffer data until enough blocks are available for all compression threads
+        """
+        self.buffer.append(data)
+        self.buffer_len += len(data)
+        if self.buffer_len >= BGZF_BLOCK_SIZE * self.threads:
+            self._flush(final=False)
+
+    def _flush(self, final):
+        """
+        Compress and write the complete blocks of the buffer. The incomplete last block is kept in
+        the buffer unless final is True
+        @param final Write the incomplete last block (bool)
+        """
+        data = "".join(self.buffer)
+        n_full = len(data) // BGZF_BLOCK_SIZE
+        end = len(data) if final else n_full * BGZF_BLOCK_SIZE
+
+        blocks = [data[i:i+BGZF_BLOCK_SIZE] for i in xrange(0, end, BGZF_BLOCK_SIZE)]
+        if self.pool:
+            compressed = self.pool.map(self._compress_block, blocks)
+        else:
+            compressed = [self._compress_block(block) for block in blocks]
+        self.handle.write("".join(compressed))
+
+        self.buffer = [data[end:]]
+        self.buffer_len = len(data) - end
+
+    def _compress_block(self, block):
+        """
+        Compress a block of data in a BGZF block
+        @param block Uncompressed data of at most BGZF_BLOCK_SIZE bytes (string)
+        @return The BGZF block (string)
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(block) + compressor.flush()
+        # gzip header with a BC extra subfield containing the total block size minus 1
+        header = pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(deflated) + 25)
+        return header + deflated + pack("<II", zlib.crc32(block) & 0xffffffff, len(block))
+
+    def _close(self):
+        self._flush(final=True)
+        self.handle.write(BGZF_EOF)
+        self.handle.close()
+        if self.pool:
+            self.pool.close()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class RecordBuffer(object):
+    """
+    @class RecordBuffer
+    @brief Accumulate fastq text in a preallocated buffer and write it in a file handle (writer,
+    StringIO or standard output) by blocks of several MB, instead of one write per record or per
+    block of reads.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, handle, size=FLUSH_SIZE):
+        """
+        @param handle Writable file handle (FastqWriter or file like object)
+        @param size Size of the buffer in bytes (int)
+        """
+        self.handle = handle
+        self.size = size
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.pos = 0
+
+    def __repr__(self):
+        return "{}\nHandle : {}\nBuffered : {}/{}\n".format(
+            self.__str__(), self.handle, self.pos, self.size)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_handle(self):
+        return self.handle
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def write(self, data):
+        """
+        Copy data in the buffer, writing the buffer in the handle first if data does not fit in.
+        Data larger than the buffer are directly written in the handle
+        @param data Text to write (string)
+        """
+        end = self.pos + len(data)
+        if end > self.size:
+            self.flush()
+            if len(data) >= self.size:
+                self.handle.write(data)
+                return
+            end = len(data)
+
+        self.view[self.pos:end] = data
+        self.pos = end
+
+    def flush(self):
+        """
+        Write the content of the buffer in the handle
+        """
+        if self.pos:
+            self.handle.write(self.view[:self.pos].tobytes())
+            self.pos = 0
+
+    def close(self):
+        """
+        Write the content of the buffer and close the handle
+        """
+        self.flush()
+        self.handle.close()
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def open_writer(path, compression="gzip", level=6, threads=1):
+    """
+    Open a writer for the requested compression backend. ".gz" is added to the path of compressed
+    outputs.
+    @param path Path of the output file without compression extension (string)
+    @param compression Output backend : plain, gzip, bgzf or pipe (string)
+    @param level Compression level from 1 (fast) to 9 (small) (int)
+    @param threads Number of threads compressing blocks in bgzf mode (int)
+    @return An instance of FastqWriter
+    """
+    if compression == "gzip":
+        return GzipWriter(path + ".gz", level)
+    if compression == "bgzf":
+        return BgzfWriter(path + ".gz", level, threads)
+    if compression == "pipe":
+        return PipeWriter(path)
+    if compression == "plain":
+        return PlainWriter(path)
+    raise ValueError("Invalid compression backend {}".format(compression))
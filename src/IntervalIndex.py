@@ -0,0 +1,442 @@
+"""
+@package    IntervalIndex
+@brief      **Index of the reads overlapping a locus of the host or virus sequences**
+The location of each read (or of each part of the reads overlapping a junction) along the host
+and virus sequences is written in a temporary file in the same pass as the fastq files. At the end
+of the run, locations are sorted by source, sequence and start position, and written with a linear
+index giving, for each window of 16 kb of a sequence, the first location that can overlap it.
+Sorted locations are stored by column (read numbers, starts, ends and mates), so that the reads
+overlapping a region are found with a lookup in the linear index and a binary search in the
+memory mapped start positions, whatever the number of reads.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from struct import pack, unpack, calcsize
+import json
+import mmap
+import os
+
+# Third party packages
+import numpy as np
+
+# Local packages
+from Reference import ReferenceJunctions
+from TruthAlignment import contig_table
+from ReadIndex import MATES
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Magic string identifying an interval index file
+MAGIC = "ISISRIVX"
+## Version of the interval index format
+VERSION = 1
+## Default extension of interval index files
+EXTENSION = ".isisivx"
+## Size of the windows of the linear index (16 kb), the smallest bins of TruthAlignment.reg2bin
+WINDOW_SHIFT = 14
+## File header : magic, version, window shift, size of the json name table, number of groups
+## (source and sequence), number of windows and number of locations
+HEADER_FMT = "<8sIIQQQQ"
+## Unsorted location written during the run. Group is the source index multiplied by the number
+## of sequences plus the sequence index
+TMP_DTYPE = np.dtype([("group", "<u4"), ("start", "<u4"), ("end", "<u4"), ("mate", "u1"),
+    ("pad", "V3"), ("read", "<u8")])
+## Columns of the sorted locations, written one after the other. The group of a location is given
+## by its position
+COLUMNS = [("read", "<u8"), ("start", "<u4"), ("end", "<u4"), ("mate", "u1")]
+## Locations of a source on a sequence : first location, number of locations, first window of the
+## linear index and number of windows
+GROUP_DTYPE = np.dtype([("source", "<u4"), ("contig", "<u4"), ("first", "<u8"), ("count", "<u8"),
+    ("window", "<u8"), ("nwindow", "<u8")])
+## Number of locations copied at once in the sorted file
+SORT_CHUNK = 1 << 20
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class IntervalIndexFormatter(object):
+    """
+    @class IntervalIndexFormatter
+    @brief Format the locations of RawRead objects along the host and virus sequences in unsorted
+    records, and sort them in an interval index file once all reads are written. Reads overlapping
+    a junction have a location per side of the junction overlapped. Sequence indexes are those of
+    the truth alignment header (see TruthAlignment.contig_table).
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, refs, sources, offsets=None):
+        """
+        @param refs List of ReferenceGenome containing the sequences of genome sources (list)
+        @param sources List of the sources of reads, ReferenceGenome or ReferenceJunctions (list)
+        @param offsets Number of the first read of each source name when reads have short numeric
+        ids, or None to record read numbers in their source (dict)
+        """
+        self.offsets = offsets
+        self.contigs = contig_table(refs)
+        self.contig_ids = {(ref_name, name): i for i, (ref_name, name, length) in enumerate(self.contigs)}
+        self.source_names = [source.getName() for source in sources]
+        self.source_ids = {name: i for i, name in enumerate(self.source_names)}
+        # Sequence indexes of the contigs of each side of junction sources, created on demand
+        self.junction_contigs = {}
+
+    def __repr__(self):
+        return "{}\nSources : {}\nSequences : {}\n".format(
+            self.__str__(), ", ".join(self.source_names), len(self.contigs))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def header(self):
+        """
+        @return The header of the temporary file of unsorted locations, empty (string)
+        """
+        return ""
+
+    def format_reads(self, reads, first, id_len=None):
+        """
+        Format the unsorted locations of a block of single end reads
+        @param reads List of RawRead from the same source
+        @param first Number of the first read of the block in the source (int)
+        @param id_len Accepted for compatibility with TruthAlignment
+        @return The locations of the block (string)
+        """
+        if not reads:
+            return ""
+        numbers = np.arange(first, first + len(reads), dtype=np.uint64) + self._offset(reads[0].source)
+        return self._records(reads, numbers, np.zeros(len(reads), dtype=np.uint8))
+
+    def format_pairs(self, pairs, first, id_len=None):
+        """
+        Format the unsorted locations of a block of read pairs, R1 followed by R2
+        @param pairs List of RawRead pairs from the same source
+        @param first Number of the first read pair of the block in the source (int)
+        @param id_len Accepted for compatibility with TruthAlignment
+        @return The locations of the block (string)
+        """
+        if not pairs:
+            return ""
+        numbers = np.arange(first, first + len(pairs), dtype=np.uint64) + self._offset(pairs[0][0].source)
+        return self._records([read for pair in pairs for read in pair], np.repeat(numbers, 2),
+            np.tile(np.array([MATES["R1"], MATES["R2"]], dtype=np.uint8), len(pairs)))
+
+    def write_index(self, tmp_path, path):
+        """
+        Sort the locations of a temporary file by source, sequence and start position and write
+        them with their linear index in an interval index file. The temporary file is removed. The
+        sort needs about 20 bytes of memory per location
+        @param tmp_path Path of the temporary file of unsorted locations (string)
+        @param path Path of the interval index file (string)
+        """
+        nrecord = os.path.getsize(tmp_path) // TMP_DTYPE.itemsize
+        tmp = np.memmap(tmp_path, dtype=TMP_DTYPE, mode="r") if nrecord else np.zeros(0, dtype=TMP_DTYPE)
+
+        # The temporary file does not depend on the number of workers, nor does the sort order
+        key = (tmp["group"].astype(np.uint64) << np.uint64(32)) | tmp["start"]
+        order = np.argsort(key, kind="quicksort")
+        del key
+        # Groups start where the group of sorted locations changes
+        sorted_groups = tmp["group"][order]
+        group_firsts = np.flatnonzero(np.diff(sorted_groups)) + 1
+        if nrecord:
+            group_firsts = np.insert(group_firsts, 0, 0)
+        group_ids = sorted_groups[group_firsts]
+        group_counts = np.diff(np.append(group_firsts, nrecord))
+        del sorted_groups
+        ends = tmp["end"][order]
+
+        # The window w of a group starts at the first location ending after the start of w
+        groups = np.zeros(len(group_ids), dtype=GROUP_DTYPE)
+        linear = []
+        nwindow = 0
+        for i, (group, first, count) in enumerate(zip(group_ids, group_firsts, group_counts)):
+            source, contig = divmod(int(group), len(self.contigs))
+            n = (self.contigs[contig][2] >> WINDOW_SHIFT) + 1
+            max_end = np.maximum.accumulate(ends[first:first+count])
+            window_starts = np.arange(n, dtype=np.uint64) << np.uint64(WINDOW_SHIFT)
+            linear.append(np.searchsorted(max_end, window_starts, side="right").astype(np.uint64))
+            groups[i] = (source, contig, first, count, nwindow, n)
+            nwindow += n
+
+        names = json.dumps({"sources": self.source_names,
+            "contigs": [[ref_name, name, length] for ref_name, name, length in self.contigs]})
+        offset = calcsize(HEADER_FMT) + len(names)
+        header = pack(HEADER_FMT, MAGIC, VERSION, WINDOW_SHIFT, len(names), len(groups), nwindow, nrecord)
+
+        with open(path, "wb") as handle:
+            handle.write((header + names).ljust(offset + (-offset % 8), "\0"))
+            handle.write(groups.tostring())
+            for window in linear:
+                handle.write(window.tostring())
+            # Ends are already sorted, other columns are loaded one at a time and copied in the sort
+            # order by chunks
+            for field, dtype in COLUMNS:
+                if field == "end":
+                    handle.write(ends.tostring())
+                    continue
+                column = np.array(tmp[field])
+                for start in range(0, nrecord, SORT_CHUNK):
+                    handle.write(column[order[start:start+SORT_CHUNK]].tostring())
+                del column
+
+        del tmp, ends
+        os.remove(tmp_path)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _offset(self, source):
+        """
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @return The number added to the read numbers of the source (int)
+        """
+        return self.offsets[source.getName()] if self.offsets is not None else 0
+
+    def _records(self, reads, numbers, mates):
+        """
+        @param reads List of RawRead from the same source
+        @param numbers Read number of each read (numpy array)
+        @param mates Mate number of each read (numpy array)
+        @return The unsorted locations of the reads (string)
+        """
+        source = reads[0].source
+        group_base = self.source_ids[source.getName()] * len(self.contigs)
+        start = np.array([read.start for read in reads], dtype=np.int64)
+        end = np.array([read.end for read in reads], dtype=np.int64)
+
+        if not isinstance(source, ReferenceJunctions):
+            name = source.getName()
+            contig = np.array([self.contig_ids[(name, read.refseq.id)] for read in reads], dtype=np.uint32)
+            return _tmp_records(group_base + contig, start, end, numbers, mates)
+
+        # Part of each read along each side of its junction, located along the original sequence
+        index = np.array([read.refseq.index for read in reads], dtype=np.int64)
+        half_len = source.half_len
+        parts = []
+        for side in (0, 1):
+            side_start = start if side == 0 else np.maximum(start, half_len)
+            side_end = np.minimum(end, half_len) if side == 0 else end
+            keep = side_start < side_end
+            i = index[keep]
+            side_start = side_start[keep] - side * half_len
+            side_end = side_end[keep] - side * half_len
+            location = source.location[side, i].astype(np.int64)
+            ref_start = np.where(source.forward[side, i], location + side_start, location + half_len - side_end)
+            contig = self._junction_contigs(source)[side][source.contig[side, i]]
+            parts.append(_tmp_records(group_base + contig, ref_start, ref_start + side_end - side_start,
+                numbers[keep], mates[keep]))
+        return "".join(parts)
+
+    def _junction_contigs(self, source):
+        """
+        @param source Instance of ReferenceJunctions
+        @return For each side of the junctions, the sequence indexes of the contigs of the side
+        (tuple of numpy array)
+        """
+        if source.getName() not in self.junction_contigs:
+            self.junction_contigs[source.getName()] = tuple(
+                np.array([self.contig_ids[(source.refs[side].getName(), name)]
+                    for name in source.contig_names[side]], dtype=np.uint32) for side in (0, 1))
+        return self.junction_contigs[source.getName()]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class IntervalIndex(object):
+    """
+    @class IntervalIndex
+    @brief Memory map an interval index file and find the reads overlapping a region of a host or
+    virus sequence
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, path):
+        """
+        Memory map the interval index file and parse its header
+        @param path Path of an interval index file (string)
+        @exception IOError Raise if the file is not a valid interval index file
+        """
+        self.path = path
+
+        with open(path, "rb") as handle:
+            ## Read only memory map of the whole file
+            self.mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        size = calcsize(HEADER_FMT)
+        if len(self.mm) < size:
+            raise IOError("{} is not a valid interval index file".format(path))
+        magic, version, self.window_shift, names_len, ngroup, nwindow, nrecord = unpack(HEADER_FMT, self.mm[:size])
+        if magic != MAGIC or version != VERSION:
+            raise IOError("{} is not a valid interval index file".format(path))
+
+        names = json.loads(self.mm[size:size+names_len])
+        self.source_names = [str(name) for name in names["sources"]]
+        self.contigs = [(str(ref_name), str(name), length) for ref_name, name, length in names["contigs"]]
+        ## Sequence indexes of each sequence name, with and without the name of its reference
+        self.contig_ids = {}
+        for i, (ref_name, name, length) in enumerate(self.contigs):
+            self.contig_ids.setdefault(name, []).append(i)
+            self.contig_ids.setdefault("{}:{}".format(ref_name, name), []).append(i)
+
+        # Groups, linear index and locations are numpy views on the memory map
+        offset = size + names_len
+        offset += -offset % 8
+        self.groups = np.frombuffer(self.mm, dtype=GROUP_DTYPE, count=ngroup, offset=offset)
+        offset += ngroup * GROUP_DTYPE.itemsize
+        self.linear = np.frombuffer(self.mm, dtype="<u8", count=nwindow, offset=offset)
+        offset += nwindow * 8
+        ## Columns of the locations
+        self.columns = {}
+        for field, dtype in COLUMNS:
+            self.columns[field] = np.frombuffer(self.mm, dtype=dtype, count=nrecord, offset=offset)
+            offset += nrecord * np.dtype(dtype).itemsize
+        self.nrecord = nrecord
+
+    def __repr__(self):
+        return "{}\nFile : {}\nLocations : {}\n".format(self.__str__(), self.path, self.nrecord)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __len__(self):
+        return self.nrecord
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_source_names(self):
+        return self.source_names
+
+    def get_contigs(self):
+        return self.contigs
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def query(self, contig, start, end, sources=None):
+        """
+        Find the reads overlapping a region. The name of a sequence can be prefixed by the name of
+        its reference (for instance host:chr1) if several references have a sequence with this name
+        @param contig Name of the sequence (string)
+        @param start Start position of the region, 0-based (int)
+        @param end End position of the region, excluded (int)
+        @param sources Names of the sources of reads to search, or None for all sources (list)
+        @return A list of (source name, read number, mate, start, end) tuples, sorted by source
+        and start position (list)
+        @exception ValueError Raise if the sequence is not in the index
+        """
+        if contig not in self.contig_ids:
+            raise ValueError("Sequence {} is not in {}".format(contig, self.path))
+        start = max(start, 0)
+        if start >= end:
+            return []
+
+        # Groups of the sequence and of the requested sources
+        selected = np.in1d(self.groups["contig"], self.contig_ids[contig])
+        if sources:
+            selected &= np.in1d(self.groups["source"],
+                [i for i, name in enumerate(self.source_names) if name in sources])
+
+        hits = []
+        for group in self.groups[selected]:
+            source = self.source_names[group["source"]]
+            first, count = int(group["first"]), int(group["count"])
+            window = start >> self.window_shift
+            # Locations before the first one of the window of start end before the region
+            lo = int(self.linear[int(group["window"]) + window]) if window < group["nwindow"] else count
+            # The key has the type of the start column, which would otherwise be copied to be cast
+            hi = max(lo, int(np.searchsorted(self.columns["start"][first:first+count],
+                np.uint32(min(end, 0xffffffff)), side="left")))
+            # Candidates start before the end of the region, and overlap it if they end after its start
+            columns = [self.columns[field][first+lo:first+hi] for field in ("read", "mate", "start", "end")]
+            overlap = columns[3] > start
+            hits.extend([(source,) + hit for hit in zip(*[column[overlap].tolist() for column in columns])])
+        return hits
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def parse_region(region):
+    """
+    @param region Region as sequence[:start[-end]] with 1-based positions and optional thousands
+    separators (for instance chr7:1,234,567-1,234,667) (string)
+    @return A tuple of the sequence name, the 0-based start and the excluded end of the region
+    @exception ValueError Raise if the positions are not valid
+    """
+    contig, sep, positions = region.rpartition(":")
+    positions = positions.replace(",", "")
+    # A region without positions is the whole sequence
+    if not sep or not positions.replace("-", "").isdigit():
+        return region, 0, 2**32
+    start, sep, end = positions.partition("-")
+    start = int(start)
+    end = int(end) if end else start
+    if start < 1 or end < start:
+        raise ValueError("Invalid region {}".format(region))
+    return contig, start - 1, end
+
+def _tmp_records(group, start, end, numbers, mates):
+    """
+    @param group Group of each location (numpy array)
+    @param start Start position of each location (numpy array)
+    @param end End position of each location (numpy array)
+    @param numbers Read number of each location (numpy array)
+    @param mates Mate number of each location (numpy array)
+    @return The unsorted locations (string)
+    """
+    records = np.zeros(len(group), dtype=TMP_DTYPE)
+    records["group"] = group
+    records["start"] = start
+    records["end"] = end
+    records["read"] = numbers
+    records["mate"] = mates
+    return records.tostring()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~MAIN FUNCTION~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    import optparse
+    import signal
+    import sys
+
+    # Exit quietly when the output is piped in a program closing it early (for instance head)
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    usage_string = "%prog reads{} sequence[:start[-end]] [...] [-s source]".format(EXTENSION)
+    optparser = optparse.OptionParser(usage = usage_string)
+    optparser.add_option('-s', '--source', dest="sources", action="append",
+        help= "Facultative option to search only the reads of a source (can be repeated)")
+    options, args = optparser.parse_args()
+
+    if len(args) < 2:
+        optparser.error("An interval index file and at least one region are required")
+    try:
+        index = IntervalIndex(args[0])
+    except IOError as E:
+        sys.stderr.write("{}\n".format(E))
+        exit (1)
+
+    # Positions are 1-based and inclusive as in regions. Invalid regions are reported on the
+    # standard error and the other regions are still queried
+    status = 0
+    print ("source\tread\tmate\tsequence\tstart\tend")
+    for arg in args[1:]:
+        try:
+            contig, start, end = parse_region(arg)
+            hits = index.query(contig, start, end, options.sources)
+        except ValueError as E:
+            sys.stderr.write("{}\n".format(E))
+            status = 1
+            continue
+
+        for source, read, mate, read_start, read_end in hits:
+            print ("{}\t{}\t{}\t{}\t{}\t{}".format(source, read, mate, contig, read_start + 1, read_end))
+
+    exit (status)
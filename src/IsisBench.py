@@ -0,0 +1,348 @@
+"""
+@package    IsisBench
+@brief      **Benchmark of read generation on synthetic genomes**
+Synthetic host and viral genomes of configurable size, number of contigs, fraction of soft masked
+(lowercase) bases and fraction of N bases are generated from a seed, so that the same genomes are
+used by all versions. Isis is run on them in single and pair end mode through IsisMain.py with the
+--profile option, for each requested engine and number of workers. The reads per second and output
+bytes per second (from the end of the startup to the end of the run), startup time, peak memory and
+the time of each stage are saved in a json file that can be compared with the results of another
+version to detect regressions.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from time import time, strftime
+import ConfigParser
+import subprocess
+import platform
+import json
+import glob
+import sys
+import os
+from os import path
+
+# Third party packages
+import numpy as np
+
+# Local packages
+from ReferenceCache import parse_size
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Directory containing IsisMain.py and the template configuration file
+SRC_DIR = path.dirname(path.abspath(__file__))
+## Compared metrics of a benchmark case associated with True if higher values are better
+METRICS = {"reads_per_sec": True, "output_bytes_per_sec": True, "startup": False, "max_rss_kb": False}
+## Mean length of soft masked and N runs in synthetic genomes
+MASK_RUN = 300
+N_RUN = 100
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def synthetic_genome(fasta_path, size, contigs=1, mask_frac=0, n_frac=0, seed=0, line_len=60):
+    """
+    Write a random genome in a fasta file. Soft masked and N bases are grouped in runs as in real
+    assemblies, so the fractions obtained are close to but lower than the requested ones
+    @param fasta_path Path of the fasta file (string)
+    @param size Total number of bases (int)
+    @param contigs Number of contigs of similar length (int)
+    @param mask_frac Fraction of soft masked bases (float)
+    @param n_frac Fraction of N bases (float)
+    @param seed Seed of the random generator (int)
+    @param line_len Number of bases per line (int)
+    @return The path of the fasta file
+    """
+    rng = np.random.RandomState(seed)
+    bounds = np.linspace(0, size, contigs + 1).astype(np.int64)
+
+    with open(fasta_path, "w") as fasta:
+        for i in range(contigs):
+            length = int(bounds[i+1] - bounds[i])
+            seq = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.randint(0, 4, length)]
+            # Lowercase runs then N runs at random positions
+            for frac, run, value in ((mask_frac, MASK_RUN, None), (n_frac, N_RUN, ord("N"))):
+                for start in rng.randint(0, length, int(frac * length / run)):
+                    if value is None:
+                        seq[start:start+run] |= 0x20
+                    else:
+                        seq[start:start+run] = value
+
+            text = seq.tostring()
+            fasta.write(">contig_{}\n".format(i+1))
+            fasta.write("".join([text[j:j+line_len] + "\n" for j in range(0, length, line_len)]))
+
+    return fasta_path
+
+def write_conf(conf_path, read_num, engine, workers, seed, repeats=True, compression="gzip"):
+    """
+    Write a configuration file derived from the template Conf.txt, without graphical output
+    and sampling report
+    @param conf_path Path of the configuration file (string)
+    @param read_num Number of reads (int)
+    @param engine Read generation engine (string)
+    @param workers Number of worker processes (int)
+    @param seed Seed of random generators (int)
+    @param repeats Allow soft masked bases in reads (bool)
+    @param compression Output backend (string)
+    @return The path of the configuration file
+    """
+    config = ConfigParser.RawConfigParser()
+    config.read(path.join(SRC_DIR, "Conf.txt"))
+
+    for name, value in (("read_num", read_num), ("engine", engine), ("workers", workers),
+        ("seed", seed), ("repeats", repeats), ("ambiguous", False), ("graph", False),
+        ("report", False)):
+        config.set("General", name, value)
+    config.set("Output", "compression", compression)
+
+    with open(conf_path, "w") as conf:
+        config.write(conf)
+    return conf_path
+
+def run_case(prefix, host, virus, conf, pair, workers, seed):
+    """
+    Run IsisMain.py with profiling in a child process and collect its measures
+    @param prefix Output prefix of the run (string)
+    @param host Path of the host fasta file (string)
+    @param virus Path of the viral fasta file (string)
+    @param conf Path of the configuration file (string)
+    @param pair Pair end mode if True, else single end mode (bool)
+    @param workers Number of worker processes (int)
+    @param seed Seed of random generators (int)
+    @return A dictionnary of the measures of the run (dict)
+    @exception RuntimeError if the run did not complete
+    """
+    cmd = [sys.executable, path.join(SRC_DIR, "IsisMain.py"), "-H", host, "-V", virus, "-C", conf,
+        "-o", prefix, "-p" if pair else "-s", "-t", str(workers), "--seed", str(seed), "--profile"]
+
+    # Remove the outputs of previous runs of the case, so that a failed run cannot be measured
+    # from them (the exit status of IsisMain is not significant)
+    outputs = glob.glob(prefix + ".fastq*") + glob.glob(prefix + "_R[12].fastq*")
+    for fp in outputs + glob.glob(prefix + "_profile.json"):
+        os.remove(fp)
+
+    with open(prefix + ".log", "w") as log:
+        start = time()
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        # The resource usage of the child includes its peak memory
+        usage = os.wait4(proc.pid, 0)[2]
+        wall = time() - start
+
+    if not path.isfile(prefix + "_profile.json") or path.getmtime(prefix + "_profile.json") < start:
+        raise RuntimeError("The run failed, see {}.log".format(prefix))
+    with open(prefix + "_profile.json") as handle:
+        profile = json.load(handle)
+
+    # Startup is the time spent before the profiler started, importing sequences and creating junctions
+    reads = sum(source["reads"] for source in profile["sources"])
+    startup = wall - profile["wall"] + sum(profile["stages"].get(name, {}).get("wall", 0)
+        for name in ("import_seq", "create_junctions"))
+    gen_wall = wall - startup
+    out_bytes = profile["stages"].get("write", {}).get("items", 0)
+    outputs = glob.glob(prefix + ".fastq*") + glob.glob(prefix + "_R[12].fastq*")
+    file_bytes = sum(path.getsize(fp) for fp in outputs)
+
+    return {"reads": reads,
+        "wall": wall,
+        "startup": startup,
+        "reads_per_sec": reads / gen_wall if gen_wall else None,
+        "output_bytes": out_bytes,
+        "output_bytes_per_sec": out_bytes / gen_wall if gen_wall else None,
+        "file_bytes": file_bytes,
+        "max_rss_kb": usage.ru_maxrss,
+        "cpu": usage.ru_utime + usage.ru_stime,
+        "stages": profile["stages"],
+        "counters": profile["counters"]}
+
+def run_bench(work_dir, modes=("single", "pair"), engines=("block", "raw"), workers=(1,),
+    read_num=100000, host_size=10000000, host_contigs=10, virus_size=10000, mask_frac=0.1,
+    n_frac=0.01, repeats=True, compression="gzip", repeat=1, seed=1):
+    """
+    Generate the synthetic genomes if needed and run all the benchmark cases. Each case is run
+    repeat times and the fastest run is kept
+    @param work_dir Directory of genomes and runs (string)
+    @param modes Read modes among single and pair (list of string)
+    @param engines Read generation engines (list of string)
+    @param workers Numbers of worker processes (list of int)
+    @param read_num Number of reads per run (int)
+    @param host_size Number of bases of the host genome (int)
+    @param host_contigs Number of contigs of the host genome (int)
+    @param virus_size Number of bases of the viral genome (int)
+    @param mask_frac Fraction of soft masked bases in genomes (float)
+    @param n_frac Fraction of N bases in genomes (float)
+    @param repeats Allow soft masked bases in reads (bool)
+    @param compression Output backend (string)
+    @param repeat Number of runs per case (int)
+    @param seed Seed of genomes and random generators (int)
+    @return The benchmark results (dict)
+    """
+    if not path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    params = {"read_num": read_num, "host_size": host_size, "host_contigs": host_contigs,
+        "virus_size": virus_size, "mask_frac": mask_frac, "n_frac": n_frac, "repeats": repeats,
+        "compression": compression, "repeat": repeat, "seed": seed}
+
+    # Genomes are named after their parameters to be reused by the next benchmarks
+    genomes = []
+    for name, size, contigs in (("host", host_size, host_contigs), ("virus", virus_size, 1)):
+        fasta_path = path.join(work_dir, "{}_{}_{}_{}_{}_{}.fa".format(
+            name, size, contigs, mask_frac, n_frac, seed))
+        if not path.isfile(fasta_path):
+            print ("Generating {}".format(fasta_path))
+            synthetic_genome(fasta_path + ".tmp", size, contigs, mask_frac, n_frac,
+                seed + len(genomes))
+            os.rename(fasta_path + ".tmp", fasta_path)
+        genomes.append(fasta_path)
+
+    cases = {}
+    for engine in engines:
+        for nworker in workers:
+            conf = write_conf(path.join(work_dir, "bench_conf.txt"), read_num, engine, nworker,
+                seed, repeats, compression)
+            for mode in modes:
+                key = "{}/{}/t{}".format(mode, engine, nworker)
+                prefix = path.join(work_dir, key.replace("/", "_"))
+                runs = [run_case(prefix, genomes[0], genomes[1], conf, mode == "pair", nworker, seed)
+                    for i in range(repeat)]
+                cases[key] = min(runs, key=lambda run: run["wall"])
+                print ("{:<24}{:>12.0f} reads/s{:>10.1f} MB/s{:>8.2f} s startup{:>10} kB".format(
+                    key, cases[key]["reads_per_sec"], cases[key]["output_bytes_per_sec"] / 1e6,
+                    cases[key]["startup"], cases[key]["max_rss_kb"]))
+
+    return {"date": strftime("%Y-%m-%d %H:%M:%S"), "revision": _revision(),
+        "python": platform.python_version(), "machine": platform.machine(),
+        "params": params, "cases": cases}
+
+def compare_bench(baseline, results, tolerance=0.1):
+    """
+    Compare the metrics of the cases common to 2 benchmark results
+    @param baseline Reference benchmark results (dict)
+    @param results New benchmark results (dict)
+    @param tolerance Relative degradation above which a metric is a regression (float)
+    @return The lines of the comparison and the list of regressed metrics as "case:metric"
+    (tuple)
+    """
+    lines = ["{:<24}{:<24}{:>14}{:>14}{:>10}".format("case", "metric", "baseline", "new", "ratio")]
+    regressions = []
+    if baseline["params"] != results["params"]:
+        lines.append("Warning : the benchmarks were run with different parameters")
+
+    for key in sorted(set(baseline["cases"]) & set(results["cases"])):
+        for metric, higher in sorted(METRICS.items()):
+            old, new = baseline["cases"][key][metric], results["cases"][key][metric]
+            if not old or new is None:
+                continue
+            ratio = float(new) / old
+            # A regression is a lower value of a metric to maximize or a higher one of a metric to minimize
+            worse = ratio < 1 - tolerance if higher else ratio > 1 + tolerance
+            if worse:
+                regressions.append("{}:{}".format(key, metric))
+            lines.append("{:<24}{:<24}{:>14.2f}{:>14.2f}{:>10.2f}{}".format(
+                key, metric, old, new, ratio, "  REGRESSION" if worse else ""))
+
+    return lines, regressions
+
+def _revision():
+    """
+    @return The git revision of the source directory or None if not available (string)
+    """
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                cwd=SRC_DIR, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#~~~~~~~MAIN~~~~~~~#
+
+if __name__ == '__main__':
+
+    import optparse
+
+    usage_string = "%prog run [-d work_dir] [-o results.json] [--compare baseline.json] [options] | compare baseline.json results.json"
+    optparser = optparse.OptionParser(usage = usage_string)
+    hstr = "Directory of synthetic genomes and runs (default = isis_bench)"
+    optparser.add_option( '-d', '--work-dir', dest="work_dir", default="isis_bench", help=hstr)
+    hstr = "Path of the json result file (default = bench_<revision>.json in the work directory)"
+    optparser.add_option( '-o', '--output', dest="output", help=hstr)
+    hstr = "Benchmark results to compare with after the run"
+    optparser.add_option( '--compare', dest="compare", help=hstr)
+    hstr = "Relative degradation of a metric reported as a regression (default = 0.1)"
+    optparser.add_option( '--tolerance', dest="tolerance", type="float", default=0.1, help=hstr)
+    hstr = "Comma separated read modes (default = single,pair)"
+    optparser.add_option( '--modes', dest="modes", default="single,pair", help=hstr)
+    hstr = "Comma separated read generation engines (default = block,raw)"
+    optparser.add_option( '--engines', dest="engines", default="block,raw", help=hstr)
+    hstr = "Comma separated numbers of worker processes (default = 1)"
+    optparser.add_option( '--workers', dest="workers", default="1", help=hstr)
+    hstr = "Number of reads per run (default = 100000)"
+    optparser.add_option( '--reads', dest="reads", type="int", default=100000, help=hstr)
+    hstr = "Size of the host genome (default = 10M)"
+    optparser.add_option( '--host-size', dest="host_size", default="10M", help=hstr)
+    hstr = "Number of contigs of the host genome (default = 10)"
+    optparser.add_option( '--host-contigs', dest="host_contigs", type="int", default=10, help=hstr)
+    hstr = "Size of the viral genome (default = 10K)"
+    optparser.add_option( '--virus-size', dest="virus_size", default="10K", help=hstr)
+    hstr = "Fraction of soft masked bases in genomes (default = 0.1)"
+    optparser.add_option( '--mask-frac', dest="mask_frac", type="float", default=0.1, help=hstr)
+    hstr = "Fraction of N bases in genomes (default = 0.01)"
+    optparser.add_option( '--n-frac', dest="n_frac", type="float", default=0.01, help=hstr)
+    hstr = "Exclude soft masked bases from reads (repeats = False)"
+    optparser.add_option( '--no-repeats', dest="repeats", action="store_false", default=True, help=hstr)
+    hstr = "Output backend : plain, gzip or bgzf (default = gzip)"
+    optparser.add_option( '--compression', dest="compression", default="gzip", help=hstr)
+    hstr = "Number of runs per case, the fastest is kept (default = 1)"
+    optparser.add_option( '--repeat', dest="repeat", type="int", default=1, help=hstr)
+    hstr = "Seed of genomes and random generators (default = 1)"
+    optparser.add_option( '--seed', dest="seed", type="int", default=1, help=hstr)
+    options, args = optparser.parse_args()
+
+    if not args or args[0] not in ("run", "compare"):
+        optparser.error("A command among run and compare is required")
+
+    if args[0] == "compare":
+        if len(args) != 3:
+            optparser.error("A baseline and a result json files are required")
+        with open(args[1]) as handle:
+            baseline = json.load(handle)
+        with open(args[2]) as handle:
+            results = json.load(handle)
+
+    else:
+        try:
+            sizes = parse_size(options.host_size), parse_size(options.virus_size)
+        except ValueError:
+            optparser.error("Invalid genome size")
+        baseline = None
+        if options.compare:
+            with open(options.compare) as handle:
+                baseline = json.load(handle)
+
+        results = run_bench(options.work_dir, options.modes.split(","), options.engines.split(","),
+            [int(n) for n in options.workers.split(",")], options.reads, sizes[0],
+            options.host_contigs, sizes[1], options.mask_frac, options.n_frac, options.repeats,
+            options.compression, options.repeat, options.seed)
+
+        output = options.output or path.join(options.work_dir,
+            "bench_{}.json".format(results["revision"] or strftime("%Y%m%d_%H%M%S")))
+        with open(output, "w") as handle:
+            json.dump(results, handle, indent=1, sort_keys=True)
+        print ("Benchmark results written in {}".format(output))
+
+    if baseline:
+        lines, regressions = compare_bench(baseline, results, options.tolerance)
+        for line in lines:
+            print (line)
+        if regressions:
+            print ("{} regression(s) : {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
@@ -87,6 +87,15 @@ class IsisConf(object):
         self.d.update (self._get_bool("General", "ambiguous"))
         self.d.update (self._get_bool("General", "graph"))
         self.d.update (self._get_bool("General", "report"))
+        self.d.update (self._get_int("General", "workers", 1, None, default=1))
+        self.d.update (self._get_str("General", "engine", ["block", "raw", "seqrecord"], default="block"))
+        self.d.update (self._get_int("General", "seed", 0, None, default=0))
+        self.d.update (self._get_str("General", "storage", ["auto", "faidx"], default="auto"))
+        # Command line number of threads and seed overwrite the values from the conf file
+        if self.d["threads"]:
+            self.d["workers"] = self.d["threads"]
+        if self.d["cl_seed"] is not None:
+            self.d["seed"] = self.d["cl_seed"]
 
         #~FREQUENCY SECTION~#
         freq_host = self._get_float ("Frequency", "freq_host", 0, 1).values()[0]
@@ -121,11 +130,20 @@ class IsisConf(object):
         self.d.update (self._get_int ("Sonication","sonic_mode", self.d["sonic_min"], None))
         self.d.update (self._get_int ("Sonication","sonic_max", self.d["sonic_mode"], None))
         self.d.update (self._get_int ("Sonication","sonic_certainty", 5, 50))
+        self.d.update (self._get_path ("Sonication","frag_len_hist", default=""))
 
          #~QUALITY SECTION~#
         self.d.update (self._get_str ( "Quality", "qual_scale", ["fastq-sanger", "fastq-solexa", "fastq-illumina"]))
         self.d.update (self._get_str ( "Quality", "qual_range", ["very-good", "good", "medium", "bad", "very-bad"]))
 
+        #~OUTPUT SECTION~#
+        self.d.update (self._get_str ("Output", "compression", ["gzip", "bgzf", "plain", "pipe"], default="gzip"))
+        self.d.update (self._get_int ("Output", "compression_level", 1, 9, default=6))
+        self.d.update (self._get_int ("Output", "compression_threads", 1, None, default=1))
+        self.d.update (self._get_str ("Output", "truth", ["none", "bam", "sam"], default="none"))
+        self.d.update (self._get_str ("Output", "read_ids", ["full", "short"], default="full"))
+        self.d.update (self._get_bool("Output", "read_intervals", default=False))
+
         #~~~Check third party dependencies~~~#
         print "\tChecking third party dependencies"
 
@@ -135,6 +153,12 @@ class IsisConf(object):
         except ImportError:
             raise IsisConfException ("Biopython package is required")
 
+        try:
+            find_module('numpy')
+            print("\t\tnumpy package is available")
+        except ImportError:
+            raise IsisConfException ("numpy package is required")
+
         if self.d["graph"]:
             try:
                 find_module('matplotlib')
@@ -178,9 +202,15 @@ class IsisConf(object):
         * Configuration file path
         * Sequencing mode : pair or single
         * Basename for output files
+        * Number of worker processes
+        * Seed of the random generators
+        * Shard of reads to generate
+        * Prefix of the junction catalogue files
+        * Reference cache directory
+        * Profiling mode
         """
         # Usage and version strings
-        usage_string = "%prog -H Host_genome.fa[.gz] -V Viral_genome.fa[.gz] -C Conf_file.txt [-o Output_prefix] [-p |-s]"
+        usage_string = "%prog -H Host_genome.fa[.gz] -V Viral_genome.fa[.gz] -C Conf_file.txt [-o Output_prefix] [-p |-s] [-t Threads] [--seed Seed] [--shard i/N] [--catalogue Prefix] [--cache Dir] [--profile]"
         version_string = program_name + program_version
         optparser = optparse.OptionParser(usage = usage_string, version = version_string)
 
@@ -191,12 +221,24 @@ class IsisConf(object):
         optparser.add_option( '-V', '--virus_genome', dest="vg", help=hstr)
         hstr = "Path of the configuration text file"
         optparser.add_option( '-C', '--conf_file', dest="conf", help=hstr)
-        hstr = "Facultative option to indicate the name of the output prefix (default = out)"
+        hstr = "Facultative option to indicate the name of the output prefix, or - to stream reads on the standard output (default = out)"
         optparser.add_option( '-o', '--output', default="out", dest="output", help=hstr)
         htr = "Single end mode overwriten if -p option is also indicated"
         optparser.add_option( '-s', '--single', dest="single", action='store_true', help=hstr)
         hstr = "Pair end mode incompatible with -s option (default mode)"
         optparser.add_option( '-p', '--pair', dest="pair", action='store_true', help=hstr)
+        hstr = "Facultative option to indicate the number of worker processes generating reads (overwrite workers from conf file)"
+        optparser.add_option( '-t', '--threads', dest="threads", type="int", help=hstr)
+        hstr = "Facultative option to indicate the seed of random generators (overwrite seed from conf file)"
+        optparser.add_option( '--seed', dest="seed", type="int", help=hstr)
+        hstr = "Facultative option to generate only the shard i of N of the reads (for instance 2/4). Shards 1 to N generated with the same seed can be concatenated to obtain the complete dataset"
+        optparser.add_option( '--shard', dest="shard", default="1/1", help=hstr)
+        hstr = "Facultative option to indicate the prefix of junction catalogue files. Junctions are loaded from the catalogue if it was created from the same references and parameters, or else created and saved in the catalogue"
+        optparser.add_option( '--catalogue', dest="catalogue", help=hstr)
+        hstr = "Facultative option to indicate a reference cache directory. Fasta files are compiled once in the cache and memory mapped at the next runs (see ReferenceCache.py to build, list and evict entries)"
+        optparser.add_option( '--cache', dest="cache", help=hstr)
+        hstr = "Facultative option to measure the wall and CPU time of each stage of the run. A report is printed and written in Output_prefix_profile.json"
+        optparser.add_option( '--profile', dest="profile", action="store_true", default=False, help=hstr)
 
         # Parse arg and return a dictionnary_like object of options
         options, args = optparser.parse_args()
@@ -206,7 +248,13 @@ class IsisConf(object):
                     'virus_genome' : self._check_file (options.vg, "virus_genome "),
                     'conf_file' : self._check_file (options.conf, "conf_file"),
                     'basename' : options.output,
-                    'pair' : self._check_mode (options.single, options.pair)}
+                    'pair' : self._check_mode (options.single, options.pair),
+                    'threads' : self._check_threads (options.threads),
+                    'cl_seed' : self._check_seed (options.seed),
+                    'shard' : self._check_shard (options.shard),
+                    'catalogue' : options.catalogue,
+                    'cache' : options.cache,
+                    'profile' : options.profile}
 
         return arg_dict
 
@@ -242,8 +290,45 @@ class IsisConf(object):
             raise IsisConfException ("-p and -s are incompatible options")
         return False if single else True
 
+    def _check_threads (self, threads):
+        """
+        Verify the number of worker processes requested from command line. If the value is not a
+        positive integer an IsisConfException is raised
+        @param threads Number of threads or None if the option was not indicated
+        @return The number of threads or None
+        """
+        if threads is not None and threads < 1:
+            raise IsisConfException ("-t value must be greater than 0")
+        return threads
+
+    def _check_seed (self, seed):
+        """
+        Verify the seed requested from command line. If the value is negative an IsisConfException
+        is raised
+        @param seed Seed or None if the option was not indicated
+        @return The seed or None
+        """
+        if seed is not None and seed < 0:
+            raise IsisConfException ("--seed value must be positive")
+        return seed
+
+    def _check_shard (self, shard):
+        """
+        Verify the shard requested from command line. If the value is not of the form i/N with
+        1 <= i <= N an IsisConfException is raised
+        @param shard Shard string
+        @return A tuple containing the shard number i and the number of shards N
+        """
+        try:
+            i, n = [int(val) for val in shard.split("/")]
+        except ValueError:
+            raise IsisConfException ("--shard value must be of the form i/N")
+        if not 1 <= i <= n:
+            raise IsisConfException ("--shard value must verify 1 <= i <= N")
+        return i, n
+
 
-    def _get_int(self, section, name, min=None, max=None):
+    def _get_int(self, section, name, min=None, max=None, default=None):
         """
         Import an integer from self.config dict and verify its value. If an error occur, an
         IsisConfException is raised.
@@ -251,6 +336,7 @@ class IsisConf(object):
         @param name Name of the option (string)
         @param min Minimal value (integer)
         @param max Maximal value (integer)
+        @param default Value returned if the option or its section is absent from the conf file (integer)
         @return An integer within the requested range
         """
         try:
@@ -266,14 +352,18 @@ class IsisConf(object):
 
         # Handle ConfigFileParser errors
         except ConfigParser.NoOptionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Option {} was not found in conf file.".format(name))
         except ConfigParser.NoSectionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Section {} was not found in conf file.".format(section))
         except ValueError:
             raise IsisConfException ("{} value is not a valid integer".format(name))
 
 
-    def _get_float(self, section, name, min=None, max=None):
+    def _get_float(self, section, name, min=None, max=None, default=None):
         """
         Import an float from self.config dict and verify its value. If an error occur, an
         IsisConfException is raised.
@@ -281,6 +371,7 @@ class IsisConf(object):
         @param name Name of the option (string)
         @param min Minimal value (float)
         @param max Maximal value (float)
+        @param default Value returned if the option or its section is absent from the conf file (float)
         @return A float within the requested range
         """
         try:
@@ -296,19 +387,24 @@ class IsisConf(object):
 
         # Handle ConfigFileParser errors
         except ConfigParser.NoOptionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Option {} was not found in conf file.".format(name))
         except ConfigParser.NoSectionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Section {} was not found in conf file.".format(section))
         except ValueError:
             raise IsisConfException ("{} value is not a valid float".format(name))
 
 
-    def _get_bool(self, section, name):
+    def _get_bool(self, section, name, default=None):
         """
         Import a boolean from self.config dict and verify its value. If an error occur, an
         IsisConfException is raised
         @param section Name of the section in the configuration file where the option is (string)
         @param name Name of the option (string)
+        @param default Value returned if the option or its section is absent from the conf file (bool)
         @return A valid boolean value
         """
         try:
@@ -318,20 +414,49 @@ class IsisConf(object):
 
         # Handle ConfigFileParser errors
         except ConfigParser.NoOptionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Option {} was not found in conf file.".format(name))
         except ConfigParser.NoSectionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Section {} was not found in conf file.".format(section))
         except ValueError:
             raise IsisConfException ("{} value is not a valid boolean".format(name))
 
 
-    def _get_str (self, section, name, allowed):
+    def _get_path (self, section, name, default=None):
+        """
+        Import a file path from self.config dict and verify that the file is readable. An empty
+        value is returned as is. If an error occur, an IsisConfException is raised
+        @param section Name of the section in the configuration file where the option is (string)
+        @param name Name of the option (string)
+        @param default Value returned if the option or its section is absent from the conf file (string)
+        @return A valid path or an empty string
+        """
+        try:
+            # Parse file with RawConfigParser
+            val = self.config.get (section, name).strip()
+            return {name : self._check_file (val, name) if val else val}
+
+        # Handle ConfigFileParser errors
+        except ConfigParser.NoOptionError:
+            if default is not None:
+                return {name : default}
+            raise IsisConfException ("Option {} was not found in conf file.".format(name))
+        except ConfigParser.NoSectionError:
+            if default is not None:
+                return {name : default}
+            raise IsisConfException ("Section {} was not found in conf file.".format(section))
+
+    def _get_str (self, section, name, allowed, default=None):
         """
         Import an string from self.config dict and verify that its value is in the list of
         autorized entries. If an error occur, an IsisConfException is raised
         @param section Name of the section in the configuration file where the option is (string)
         @param name Name of the option (string)
         @param allowed List of allowed entries (list of string)
+        @param default Value returned if the option or its section is absent from the conf file (string)
         @return A valid string
         """
         try:
@@ -345,8 +470,12 @@ class IsisConf(object):
 
         # Handle ConfigFileParser errors
         except ConfigParser.NoOptionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Option {} was not found in conf file.".format(name))
         except ConfigParser.NoSectionError:
+            if default is not None:
+                return {name : default}
             raise IsisConfException ("Section {} was not found in conf file.".format(section))
         except ValueError:
             raise IsisConfException ("{} value is not a valid float".format(name))
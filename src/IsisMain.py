@@ -11,7 +11,10 @@ documentation or with -h option :
 * -V virus/vector genome fasta file path
 * -H host genome fasta file path
 * -C Configuration file path
-* (-o outupt name)
+* (-o outupt name, or - to stream reads on the standard output)
+* (-t number of worker processes)
+* (--seed seed of the random generators)
+* (--shard i/N part of the reads to generate)
 
 @copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
 @author     Adrien Leger - 2014
@@ -25,15 +28,26 @@ documentation or with -h option :
 #~~~~~~~GLOBAL IMPORTS~~~~~~~#
 
 # Standard library packages
-import gzip
+import sys
+from multiprocessing import Pool
+from time import time
+from cStringIO import StringIO
 
 # Local packages
 from IsisConf import IsisConf, IsisConfException
 from Reference import ReferenceGenome as RefGen
 from Reference import ReferenceJunctions as RefJun
-from SlicePicker import SlicePickerSingle, SlicePickerPair
+from SlicePicker import SlicePickerSingle, SlicePickerPair, import_frag_hist
 from QualGenerator import QualGenerator
-from FastqGenerator import FastqGeneratorSingle, FastqGeneratorPair
+from FastqGenerator import FastqGeneratorSingle, FastqGeneratorPair, read_id, read_offsets, shard_ranges
+from FastqWriter import open_writer, RecordBuffer, BgzfWriter
+from RandomStream import RandomStream
+from Statistics import CoverageAccumulator, LengthHistogram
+from Profiler import Profiler
+from Pipeline import Pipeline
+from TruthAlignment import TruthAlignment, raw_from_record
+from ReadIndex import ReadIndexFormatter, EXTENSION as READ_INDEX_EXTENSION
+from IntervalIndex import IntervalIndexFormatter, EXTENSION as INTERVAL_INDEX_EXTENSION
 
 
 #~~~~~~~FUNCTIONS FOR SINGLE END MODE~~~~~~~#
@@ -48,54 +62,166 @@ def IsisSingle():
     * MUT_FREQ  Frequency of single nucleotide mutation to be randomly
     introduced in reads (float)
     * QUAL_RANGE Range of quality for reads (string)
+    * RNG Random stream shared by all objects (RandomStream)
     """
     # Instantiate accessory classes
-    slicer = SlicePickerSingle (READ_LEN, REPEATS, AMBIGUOUS, MUT_FREQ)
-    qualgen = QualGenerator (READ_LEN, QUAL_RANGE)
-    fastgen = FastqGeneratorSingle (slicer, qualgen)
+    slicer = SlicePickerSingle (READ_LEN, REPEATS, AMBIGUOUS, MUT_FREQ, rng=RNG)
+    qualgen = QualGenerator (READ_LEN, QUAL_RANGE, rng=RNG)
+    fastgen = FastqGeneratorSingle (slicer, qualgen, QUAL_SCALE, rng=RNG)
+    fastgen.set_offsets (READ_OFFSETS)
+
+    # Record the stages of the run if profiling is requested
+    if PROFILE:
+        instrument_run (fastgen)
 
     # Write fastq file for all source in source_list
-    write_fastq_single (fastgen)
+    if STREAM:
+        write_fastq_stream (fastgen)
+    else:
+        write_fastq_single (fastgen)
 
+    PROFILER.count ("rejected_slices", slicer.get_rejected())
     return 1
 
 def write_fastq_single (fastgen):
     """
-    Write the requested number of single end reads per reference in a fastq.gz
+    Write the requested number of single end reads per reference in a fastq(.gz)
     file. Need global parameters to be executed correctly.
     * BASENAME  basename for the name of the output file (string)
-    * QUAL_SCALE Quality scale in which fastq quality string will be converted
-    (sanger, illumina, solexa...) (string)
+    * COMPRESSION Output backend : plain, gzip, bgzf or pipe (string)
+    * COMPRESSION_LEVEL Compression level from 1 to 9 (integer)
+    * COMPRESSION_THREADS Number of threads compressing each bgzf output (integer)
     * SOURCE_LIST   List containing source sublists with a reference to an
     instance of ReferenceGenome or ReferenceJunction and the requested number of
     reads to be generated (list)
     @param  fastgen Instance of FastqGenerator
     """
     try:
-        f = gzip.open (BASENAME + ".fastq.gz", 'w')
-
-        for source, nread in SOURCE_LIST:
-            print ("\tWritting {} read(s) in Fastq file from {}".format (nread, source.getName()))
-            # Calculate the number of digits in nread for read id
-            id_len = len (str (nread))
-
-            for i in range (nread):
-                # Ask a read to the source throught fastgen
-                read = fastgen.generate_fastq (source)
-                # Generate a uniq identifier
-                read.id = generate_id (i, id_len, read.annotations)
-                # Write the fastq formated read
-                f.write (read.format (QUAL_SCALE))
-
-                # Add read coverage over junction to JUN_COV list if the source is a junction
-                if GRAPH and isinstance (source, RefJun):
-                    update_jun_cov (read.annotations["location"][0], read.annotations["location"][1])
-        f.close()
+        f = RecordBuffer (open_writer (BASENAME + ".fastq", COMPRESSION, COMPRESSION_LEVEL, COMPRESSION_THREADS))
+        # Sidecar files (truth alignments, read index) are written in the same pass, after the fastq file
+        handles = [f] + open_sidecars ()
+        write_sources (fastgen, handles)
+        for f in handles:
+            f.close()
+        PROFILER.add_queues ([f.get_handle().get_queue_stats() for f in handles])
+        index_intervals ()
 
     except IOError as E:
         print (E)
         exit (0)
 
+def write_reads_single (fastgen, source, first, nread, id_len, handles):
+    """
+    Write a range of single end reads sampled in a source in the given file handle. Need global
+    parameters to be executed correctly.
+    * QUAL_SCALE Quality scale in which fastq quality string will be converted
+    (sanger, illumina, solexa...) (string)
+    @param  fastgen Instance of FastqGeneratorSingle
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing a writable file handle, followed by the handles of SIDECARS
+    """
+    f = handles[0]
+
+    for i in range (first, first + nread):
+        # Reseed the random stream at the beginning of each block
+        if i % BLOCK_SIZE == 0:
+            fastgen.seed_block (source, i // BLOCK_SIZE)
+        # Ask a read to the source throught fastgen
+        read = fastgen.generate_fastq (source)
+        # Generate a uniq identifier
+        read.id = generate_id (i, id_len, read.annotations)
+        # Write the fastq formated read
+        f.write (read.format (QUAL_SCALE))
+        # Write the true alignment and the read index record of the read
+        if SIDECARS:
+            raw = raw_from_record (read, fastgen.qual_table)
+            for f_sidecar, sidecar in zip (handles[1:], SIDECARS):
+                f_sidecar.write (sidecar.format_reads ([raw], i, id_len))
+
+        # Add read coverage over junction to JUN_COV if the source is a junction
+        if GRAPH and isinstance (source, RefJun):
+            update_jun_cov (read.annotations["location"][0], read.annotations["location"][1])
+
+def write_raw_single (fastgen, source, first, nread, id_len, handles):
+    """
+    Raw read counterpart of write_reads_single. Reads are generated as RawRead objects and
+    formated in fastq without creating SeqRecord objects. The output is identical to
+    write_reads_single for a given random state. Need global parameters to be executed correctly.
+    @param  fastgen Instance of FastqGeneratorSingle
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing a writable file handle, followed by the handles of SIDECARS
+    """
+    f = handles[0]
+    jun_graph = GRAPH and isinstance (source, RefJun)
+    # Fastq record template of the source
+    fmt = fastgen.record_formatter (source, id_len)
+
+    for i in range (first, first + nread):
+        # Reseed the random stream at the beginning of each block
+        if i % BLOCK_SIZE == 0:
+            fastgen.seed_block (source, i // BLOCK_SIZE)
+        # Ask a read to the source throught fastgen and write it as a fastq record
+        read = fastgen.generate_raw (source)
+        f.write (fmt (read, i))
+        # Write the true alignment and the read index record of the read
+        for f_sidecar, sidecar in zip (handles[1:], SIDECARS):
+            f_sidecar.write (sidecar.format_reads ([read], i, id_len))
+
+        # Add read coverage over junction to JUN_COV if the source is a junction
+        if jun_graph:
+            update_jun_cov (read.start, read.end)
+
+
+def write_block_single (fastgen, source, first, nread, id_len, handles):
+    """
+    Block counterpart of write_raw_single. Reads are generated by blocks of BLOCK_SIZE reads with
+    a single batch of quality strings and each block is written at once. Need global parameters
+    to be executed correctly.
+    * BLOCK_SIZE Number of reads generated in a block (integer)
+    @param  fastgen Instance of FastqGeneratorSingle
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing a writable file handle, followed by the handles of SIDECARS
+    """
+    for block_start in range (first, first + nread, BLOCK_SIZE):
+        # Ask a block of reads to the source throught fastgen with a reseeded random stream
+        fastgen.seed_block (source, block_start // BLOCK_SIZE)
+        reads = fastgen.generate_block (source, min (BLOCK_SIZE, first + nread - block_start))
+
+        # Write all the fastq (and sidecar) records of the block at once
+        for f, text in zip (handles, format_block_single (fastgen, source, block_start, id_len, reads)):
+            f.write (text)
+
+def format_block_single (fastgen, source, first, id_len, reads):
+    """
+    Format a block of single end reads in fastq and add them to the graphical statistics. Need
+    global parameters to be executed correctly.
+    * GRAPH Activate graphical output (bool)
+    * SIDECARS Formaters of the truth alignment, read index and read interval records (list)
+    @param  fastgen Instance of FastqGeneratorSingle
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the block in the source (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  reads List of RawRead of the block
+    @return A list containing the fastq text of the block, followed by its records in each of
+    SIDECARS
+    """
+    texts = fastgen.format_block (reads, first, id_len)
+    texts.extend ([sidecar.format_reads (reads, first, id_len) for sidecar in SIDECARS])
+
+    # Add read coverage over junction to JUN_COV if the source is a junction
+    if GRAPH and isinstance (source, RefJun):
+        JUN_COV.add_block ([read.start for read in reads], [read.end for read in reads])
+
+    return texts
 
 #~~~~~~~FUNCTIONS FOR PAIR END MODE~~~~~~~#
 
@@ -113,102 +239,473 @@ def IsisPair():
     * SONIC_MODE Modal size of sonication fragments (integer)
     * SONIC_MAX Maximal size of sonication fragments (integer)
     * SONIC_CERTAINTY Thickness of the sonication peak (integer)
+    * FRAG_HIST Empirical fragment length histogram or None (FragmentHistogram)
+    * RNG Random stream shared by all objects (RandomStream)
     """
     # Instantiate accessory classes
-    slicer = SlicePickerPair (READ_LEN, SONIC_MIN, SONIC_MODE, SONIC_MAX, SONIC_CERTAINTY, REPEATS, AMBIGUOUS, MUT_FREQ)
-    qualgen = QualGenerator (READ_LEN, QUAL_RANGE)
-    fastgen = FastqGeneratorPair (slicer, qualgen)
+    slicer = SlicePickerPair (READ_LEN, SONIC_MIN, SONIC_MODE, SONIC_MAX, SONIC_CERTAINTY, REPEATS, AMBIGUOUS, MUT_FREQ, rng=RNG, frag_hist=FRAG_HIST)
+    qualgen = QualGenerator (READ_LEN, QUAL_RANGE, rng=RNG)
+    fastgen = FastqGeneratorPair (slicer, qualgen, QUAL_SCALE, rng=RNG)
+    fastgen.set_offsets (READ_OFFSETS)
+
+    # Record the stages of the run if profiling is requested
+    if PROFILE:
+        instrument_run (fastgen)
 
     # Write paired fastq files for all source in source_list
-    write_fastq_pair (fastgen)
+    if STREAM:
+        write_fastq_stream (fastgen)
+    else:
+        write_fastq_pair (fastgen)
 
+    PROFILER.count ("rejected_slices", slicer.get_rejected())
     return 1
 
 def write_fastq_pair (fastgen):
     """
-    Write the requested number of pair end reads per reference in a fastq.gz
-    file. Need global parameters to be executed correctly.
+    Write the requested number of pair end reads per reference in fastq(.gz)
+    files. Need global parameters to be executed correctly.
     * BASENAME  basename for the name of the output file (string)
-    * QUAL_SCALE Quality scale in which fastq quality string will be converted
-    (sanger, illumina, solexa...) (string)
+    * COMPRESSION Output backend : plain, gzip, bgzf or pipe (string)
+    * COMPRESSION_LEVEL Compression level from 1 to 9 (integer)
+    * COMPRESSION_THREADS Number of threads compressing each bgzf output (integer)
     * SOURCE_LIST   List containing source sublists with a reference to an
     instance of ReferenceGenome or ReferenceJunction and the requested number of
     reads to be generated (list)
     @param  fastgen Instance of FastqGenerator
     """
     try:
-        f1 = gzip.open(BASENAME + "_R1.fastq.gz", 'w')
-        f2 = gzip.open(BASENAME + "_R2.fastq.gz", 'w')
+        # R1 and R2 writers compress their data concurrently in their own threads
+        f1 = RecordBuffer (open_writer (BASENAME + "_R1.fastq", COMPRESSION, COMPRESSION_LEVEL, COMPRESSION_THREADS))
+        f2 = RecordBuffer (open_writer (BASENAME + "_R2.fastq", COMPRESSION, COMPRESSION_LEVEL, COMPRESSION_THREADS))
+        # Sidecar files (truth alignments, read index) are written in the same pass, after the fastq files
+        handles = [f1, f2] + open_sidecars ()
+        write_sources (fastgen, handles)
+        for f in handles:
+            f.close()
+        PROFILER.add_queues ([f.get_handle().get_queue_stats() for f in handles])
+        index_intervals ()
 
-        for source, nread in SOURCE_LIST:
-            print ("\tWritting {} read(s) in Fastq file from {}".format(nread, source.getName()))
-            # Calculate the number of digits in nread for read id
-            id_len = len(str(nread))
-
-            for i in range (nread):
-                # Ask a read to the source throught fastgen
-                read1, read2 = fastgen.generate_fastq(source)
-                # Uniq read identifier
-                read1.id = generate_id(i, id_len, read1.annotations)
-                read2.id = generate_id(i, id_len, read2.annotations)
-                # Write the fastq formated read
-                f1.write(read1.format(QUAL_SCALE))
-                f2.write(read2.format(QUAL_SCALE))
-
-                # Add "sonication" fragment lenght to the FRAG_LEN list
-                if GRAPH:
-                    update_frag_len (read1.annotations["frag_len"])
-                    # Add read coverage over junction to JUN_COV list if the source is a junction
-                    if isinstance (source, RefJun):
-                        update_jun_cov (read1.annotations["location"][0], read1.annotations["location"][1])
-                        update_jun_cov (read2.annotations["location"][0], read2.annotations["location"][1])
-        f1.close()
-        f2.close()
+    except IOError as E:
+        print (E)
+        exit (0)
+
+def write_reads_pair (fastgen, source, first, nread, id_len, handles):
+    """
+    Write a range of pair end reads sampled in a source in the given file handles. Need global
+    parameters to be executed correctly.
+    * QUAL_SCALE Quality scale in which fastq quality string will be converted
+    (sanger, illumina, solexa...) (string)
+    @param  fastgen Instance of FastqGeneratorPair
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing the R1 and R2 writable file handles, followed by the handles
+    of SIDECARS
+    """
+    f1, f2 = handles[:2]
+
+    for i in range (first, first + nread):
+        # Reseed the random stream at the beginning of each block
+        if i % BLOCK_SIZE == 0:
+            fastgen.seed_block (source, i // BLOCK_SIZE)
+        # Ask a read to the source throught fastgen
+        read1, read2 = fastgen.generate_fastq(source)
+        # Uniq read identifier
+        read1.id = generate_id(i, id_len, read1.annotations)
+        read2.id = generate_id(i, id_len, read2.annotations)
+        # Write the fastq formated read
+        f1.write(read1.format(QUAL_SCALE))
+        f2.write(read2.format(QUAL_SCALE))
+        # Write the true alignments and the read index records of the pair
+        if SIDECARS:
+            raw = (raw_from_record (read1, fastgen.qual_table), raw_from_record (read2, fastgen.qual_table))
+            for f_sidecar, sidecar in zip (handles[2:], SIDECARS):
+                f_sidecar.write (sidecar.format_pairs ([raw], i, id_len))
+
+        # Add "sonication" fragment lenght to the FRAG_LEN histogram
+        if GRAPH:
+            update_frag_len (read1.annotations["frag_len"])
+            # Add read coverage over junction to JUN_COV if the source is a junction
+            if isinstance (source, RefJun):
+                update_jun_cov (read1.annotations["location"][0], read1.annotations["location"][1])
+                update_jun_cov (read2.annotations["location"][0], read2.annotations["location"][1])
+
+def write_raw_pair (fastgen, source, first, nread, id_len, handles):
+    """
+    Raw read counterpart of write_reads_pair. Reads are generated as RawRead objects and
+    formated in fastq without creating SeqRecord objects. The output is identical to
+    write_reads_pair for a given random state. Need global parameters to be executed correctly.
+    @param  fastgen Instance of FastqGeneratorPair
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing the R1 and R2 writable file handles, followed by the handles
+    of SIDECARS
+    """
+    f1, f2 = handles[:2]
+    jun_graph = GRAPH and isinstance (source, RefJun)
+    # Fastq record template of the source
+    fmt = fastgen.record_formatter (source, id_len)
+
+    for i in range (first, first + nread):
+        # Reseed the random stream at the beginning of each block
+        if i % BLOCK_SIZE == 0:
+            fastgen.seed_block (source, i // BLOCK_SIZE)
+        # Ask a read pair to the source throught fastgen and write them as fastq records
+        read1, read2 = fastgen.generate_raw (source)
+        f1.write (fmt (read1, i))
+        f2.write (fmt (read2, i))
+        # Write the true alignments and the read index records of the pair
+        for f_sidecar, sidecar in zip (handles[2:], SIDECARS):
+            f_sidecar.write (sidecar.format_pairs ([(read1, read2)], i, id_len))
+
+        # Add "sonication" fragment lenght to the FRAG_LEN histogram
+        if GRAPH:
+            update_frag_len (read1.frag_len)
+            # Add read coverage over junction to JUN_COV if the source is a junction
+            if jun_graph:
+                update_jun_cov (read1.start, read1.end)
+                update_jun_cov (read2.start, read2.end)
+
+def write_block_pair (fastgen, source, first, nread, id_len, handles):
+    """
+    Block counterpart of write_raw_pair. Read pairs are generated by blocks of BLOCK_SIZE pairs
+    with a single batch of quality strings and each block is written at once. Need global
+    parameters to be executed correctly.
+    * BLOCK_SIZE Number of read pairs generated in a block (integer)
+    @param  fastgen Instance of FastqGeneratorPair
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read of the range in the source (integer)
+    @param  nread Number of reads to write (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  handles List containing the R1 and R2 writable file handles, followed by the handles
+    of SIDECARS
+    """
+    for block_start in range (first, first + nread, BLOCK_SIZE):
+        # Ask a block of read pairs to the source throught fastgen with a reseeded random stream
+        fastgen.seed_block (source, block_start // BLOCK_SIZE)
+        pairs = fastgen.generate_block (source, min (BLOCK_SIZE, first + nread - block_start))
+
+        # Write all the fastq (and sidecar) records of the block at once
+        for f, text in zip (handles, format_block_pair (fastgen, source, block_start, id_len, pairs)):
+            f.write (text)
+
+def format_block_pair (fastgen, source, first, id_len, pairs):
+    """
+    Format a block of read pairs in fastq and add them to the graphical statistics. Need global
+    parameters to be executed correctly.
+    * GRAPH Activate graphical output (bool)
+    * SIDECARS Formaters of the truth alignment, read index and read interval records (list)
+    @param  fastgen Instance of FastqGeneratorPair
+    @param  source Instance of ReferenceGenome or ReferenceJunctions
+    @param  first Number of the first read pair of the block in the source (integer)
+    @param  id_len Max number of digit of read numbers in the source (integer)
+    @param  pairs List of RawRead pairs of the block
+    @return A list containing the R1 and R2 fastq texts of the block, followed by its records in
+    each of SIDECARS
+    """
+    texts = fastgen.format_block (pairs, first, id_len)
+    texts.extend ([sidecar.format_pairs (pairs, first, id_len) for sidecar in SIDECARS])
+
+    # Add "sonication" fragment lenght to the FRAG_LEN histogram
+    if GRAPH:
+        FRAG_LEN.add_block ([read1.frag_len for read1, read2 in pairs])
+        # Add read coverage over junction to JUN_COV if the source is a junction
+        if isinstance (source, RefJun):
+            reads = [read for pair in pairs for read in pair]
+            JUN_COV.add_block ([read.start for read in reads], [read.end for read in reads])
+
+    return texts
+
+#~~~~~~~FUNCTIONS FOR STREAMING MODE~~~~~~~#
+
+def write_fastq_stream (fastgen):
+    """
+    Write the requested number of reads per reference in fastq format on the standard output.
+    Pair end reads are interleaved (R1 followed by R2). Reads are generated in the main process,
+    by blocks with FastqGenerator.iter_blocks with the block engine, or else by WRITE_READS writing
+    R1 and R2 records in the same output. Need global parameters to be executed correctly.
+    * STDOUT Standard output file (file)
+    * ENGINE Read generation engine : block, raw or seqrecord (string)
+    * BLOCK_SIZE Number of reads generated in a block (integer)
+    * SOURCE_LIST   List containing source sublists with a reference to an
+    instance of ReferenceGenome or ReferenceJunction and the requested number of
+    reads to be generated (list)
+    @param  fastgen Instance of FastqGenerator
+    """
+    print ("\tStreaming {} read(s) in fastq format on the standard output".format (
+        sum ([nread for source_idx, first, nread in shard_ranges (SOURCE_LIST, SHARD, BLOCK_SIZE)])))
 
+    try:
+        f = RecordBuffer (STDOUT)
+        start = time ()
+        # R1 and R2 records are interleaved in pair end mode
+        if ENGINE == "block":
+            for source, first, id_len, reads in fastgen.iter_blocks (SOURCE_LIST, block_size=BLOCK_SIZE, shard=SHARD):
+                f.write (fastgen.format_block (reads, first, id_len, interleave=True)[0])
+                PROFILER.add_source (source.getName(), len (reads), time () - start)
+                start = time ()
+        else:
+            for source_idx, first, nread in shard_ranges (SOURCE_LIST, SHARD, BLOCK_SIZE):
+                source, total = SOURCE_LIST[source_idx]
+                WRITE_READS (fastgen, source, first, nread, len (str (total)), [f, f] if PAIR else [f])
+                PROFILER.add_source (source.getName(), nread, time () - start)
+                start = time ()
+        f.flush()
+        STDOUT.flush()
+
+    # The reading program may close the pipe before the end (for instance head)
     except IOError as E:
         print (E)
         exit (0)
 
+def stream_requested (argv):
+    """
+    Detect the streaming mode (-o -) in the command line arguments before any message is printed
+    @param  argv List of command line arguments (list)
+    @return True if reads have to be written on the standard output (bool)
+    """
+    for i, arg in enumerate (argv):
+        if arg in ("-o", "--output") and argv[i+1:i+2] == ["-"]:
+            return True
+        if arg in ("-o-", "--output=-"):
+            return True
+    return False
+
+#~~~~~~~FUNCTIONS FOR PIPELINE MODE~~~~~~~#
+
+def write_pipeline (fastgen, ranges, handles):
+    """
+    Write ranges of reads in the given file handles with a pipeline of threads : blocks of reads
+    are generated in a thread, formated in fastq in a second thread and written by the calling
+    thread in the writers, which compress them in their own threads. Steps are connected by
+    bounded queues and overlap as long as the GIL is released (numpy and zlib). Need global
+    parameters to be executed correctly.
+    * PIPELINE_QUEUE Maximal number of blocks waiting between 2 steps (integer)
+    * PROFILER Recorder of the stages of the run (Profiler)
+    @param  fastgen Instance of FastqGenerator
+    @param  ranges List of source index, first read and number of reads (list)
+    @param  handles List of writable file handles (1 for single end, 2 for pair end, and the
+    handles of SIDECARS)
+    """
+    pipeline = Pipeline (("generate", generate_blocks (fastgen, ranges, len (handles))),
+        [("format", lambda block: format_item (fastgen, block))], "write", PIPELINE_QUEUE)
+
+    start = time ()
+    for source, nread, texts in pipeline:
+        for f, text in zip (handles, texts):
+            f.write (text)
+        PROFILER.add_source (source.getName(), nread, time () - start)
+        start = time ()
+
+    PROFILER.add_queues (pipeline.stats())
+
+def generate_blocks (fastgen, ranges, nhandle):
+    """
+    Generate the reads of ranges by blocks of BLOCK_SIZE reads. Reads of the block engine are
+    yielded as RawRead to be formated by format_item, while reads of the other engines are
+    generated and formated together by WRITE_READS. Need global parameters to be executed
+    correctly.
+    * BLOCK_SIZE Number of reads generated in a block (integer)
+    * SOURCE_LIST   List containing source sublists with a reference to an
+    instance of ReferenceGenome or ReferenceJunction and the requested number of
+    reads to be generated (list)
+    @param  fastgen Instance of FastqGenerator
+    @param  ranges List of source index, first read and number of reads (list)
+    @param  nhandle Number of output files (integer)
+    @return A generator of lists containing the source, the first read and the number of reads of
+    the block, the number of digits of read ids, and the reads or the fastq texts of the block
+    """
+    for source_idx, first, nread in ranges:
+        source, total = SOURCE_LIST[source_idx]
+        print ("\tWritting {} read(s) in Fastq file from {}".format (nread, source.getName()))
+        # Calculate the number of digits in the total number of reads of the source for read id
+        id_len = len (str (total))
+
+        for block_start in range (first, first + nread, BLOCK_SIZE):
+            n = min (BLOCK_SIZE, first + nread - block_start)
+            if ENGINE == "block":
+                fastgen.seed_block (source, block_start // BLOCK_SIZE)
+                yield [source, block_start, n, id_len, fastgen.generate_block (source, n)]
+            else:
+                texts = [StringIO() for i in range (nhandle)]
+                WRITE_READS (fastgen, source, block_start, n, id_len, texts)
+                yield [source, block_start, n, id_len, [f.getvalue() for f in texts]]
+
+def format_item (fastgen, block):
+    """
+    Format the reads of a block generated by generate_blocks in fastq, if not already done.
+    Need global parameters to be executed correctly.
+    * FORMAT_BLOCK Function formating a block of reads and updating graphical statistics
+    @param  fastgen Instance of FastqGenerator
+    @param  block List generated by generate_blocks
+    @return A tuple containing the source, the number of reads and the fastq texts of the block
+    """
+    source, first, n, id_len, reads = block
+    if ENGINE == "block":
+        return source, n, FORMAT_BLOCK (fastgen, source, first, id_len, reads)
+    return source, n, reads
+
+#~~~~~~~FUNCTIONS FOR MULTIPROCESS MODE~~~~~~~#
+
+def write_sources (fastgen, handles):
+    """
+    Write the requested number of reads for all sources in the given file handles. If several
+    workers are requested, reads of each source are split in chunks generated by a pool of
+    processes and written in order. Since the random stream is reseeded for each block of reads,
+    the output does not depend on the number of workers. Only the reads of the requested shard
+    are written. Need global parameters to be executed correctly.
+    * WORKERS Number of worker processes generating reads (integer)
+    * SHARD Shard number i and number of shards N (tuple)
+    * SOURCE_LIST   List containing source sublists with a reference to an
+    instance of ReferenceGenome or ReferenceJunction and the requested number of
+    reads to be generated (list)
+    @param  fastgen Instance of FastqGenerator
+    @param  handles List of writable file handles (1 for single end, 2 for pair end, and the
+    handles of SIDECARS)
+    """
+    ranges = shard_ranges (SOURCE_LIST, SHARD, BLOCK_SIZE)
+
+    # Serial mode : reads are generated and formated in threads and written in order in output files
+    if WORKERS == 1:
+        write_pipeline (fastgen, ranges, handles)
+        return
+
+    # Multiprocess mode : each worker receive its own copy of fastgen at initialisation. The writers
+    # are fed by the chunks generated by the workers, and not by a write step of a pipeline
+    pool = Pool (WORKERS, init_worker, (fastgen,))
+    for f in handles:
+        f.get_handle().set_producer ("generate")
+
+    try:
+        for source_idx, first, nread in ranges:
+            source = SOURCE_LIST[source_idx][0]
+            print ("\tWritting {} read(s) in Fastq file from {} with {} workers".format (
+                nread, source.getName(), WORKERS))
+
+            # Chunks are returned in the submission order by imap
+            start = time ()
+            for texts, samp_count, jun_cov, frag_len, profile in pool.imap (write_chunk, chunk_list (source_idx, first, nread)):
+                for f, text in zip (handles, texts):
+                    f.write (text)
+                merge_chunk_stats (source, samp_count, jun_cov, frag_len, profile)
+            PROFILER.add_source (source.getName(), nread, time () - start)
+
+        pool.close()
+
+    except:
+        pool.terminate()
+        raise
+
+    finally:
+        pool.join()
+
+def chunk_list (source_idx, first, nread):
+    """
+    Split a range of reads of a source in a list of chunks of at most CHUNK_SIZE reads. CHUNK_SIZE
+    being a multiple of BLOCK_SIZE, chunks start at the beginning of a block
+    @param  source_idx Index of the source in SOURCE_LIST (integer)
+    @param  first Number of the first read of the range (integer)
+    @param  nread Number of reads of the range (integer)
+    @return A list of chunks defined by source index, first read, number of reads and id lenght
+    """
+    id_len = len (str (SOURCE_LIST[source_idx][1]))
+    return [[source_idx, start, min (CHUNK_SIZE, first + nread - start), id_len]
+        for start in range (first, first + nread, CHUNK_SIZE)]
+
+def init_worker (fastgen):
+    """
+    Initialize a worker process with its own FastqGenerator (and thus its own SlicePicker,
+    QualGenerator and random stream, reseeded for each block of reads)
+    @param  fastgen Instance of FastqGenerator copied in the worker process
+    """
+    global WORKER_FASTGEN
+    WORKER_FASTGEN = fastgen
+
+def write_chunk (chunk):
+    """
+    Generate a chunk of reads in a worker process and return formated reads with statistics to
+    be merged in the main process. Need global parameters to be executed correctly.
+    * GRAPH Activate graphical output (bool)
+    * SIDECARS Formaters of the truth alignment, read index and read interval records (list)
+    * PROFILE Record the stages of the run (bool)
+    @param  chunk List containing source index, first read, number of reads and id lenght
+    @return A tuple containing a list of fastq formated strings (1 per output file), a dictionnary
+    of sampling counts per sequence of the source, the JUN_COV and FRAG_LEN accumulators and the
+    profiler snapshot of the chunk
+    """
+    global JUN_COV, FRAG_LEN
+    source_idx, first, nread, id_len = chunk
+    source = SOURCE_LIST[source_idx][0]
+
+    # Reset per chunk counters and statistics that will be merged by the main process
+    source.reset_samp_counter()
+    if GRAPH:
+        JUN_COV = CoverageAccumulator (JUN_LEN*2)
+        FRAG_LEN = LengthHistogram (SONIC_MAX)
+    if PROFILE:
+        PROFILER.reset()
+        WORKER_FASTGEN.get_slicer().rejected = 0
+
+    handles = [StringIO() for i in range ((2 if PAIR else 1) + len (SIDECARS))]
+    WRITE_READS (WORKER_FASTGEN, source, first, nread, id_len, handles)
+
+    samp_count = source.samp_counts()
+    profile = None
+    if PROFILE:
+        PROFILER.count ("rejected_slices", WORKER_FASTGEN.get_slicer().get_rejected())
+        profile = PROFILER.snapshot()
+
+    if GRAPH:
+        return [f.getvalue() for f in handles], samp_count, JUN_COV, FRAG_LEN, profile
+    return [f.getvalue() for f in handles], samp_count, None, None, profile
+
+def merge_chunk_stats (source, samp_count, jun_cov, frag_len, profile=None):
+    """
+    Merge the sampling counts, graphical statistics and profiling of a chunk generated by a worker
+    @param  source Instance of ReferenceGenome or ReferenceJunctions sampled by the worker
+    @param  samp_count Dictionnary of sampling counts per sequence of the source
+    @param  jun_cov Read coverage over junctions of the chunk (CoverageAccumulator)
+    @param  frag_len Fragment lenghts of the chunk (LengthHistogram)
+    @param  profile Stages and counters recorded by the worker or None (tuple)
+    """
+    source.add_samp_counts(samp_count)
+
+    if GRAPH:
+        JUN_COV.merge (jun_cov)
+        FRAG_LEN.merge (frag_len)
+    if profile:
+        PROFILER.merge (profile)
+
 #~~~~~~~HELPER FUNCTIONS~~~~~~~#
 
 def generate_id(i,id_len, d):
     """
-    Generate an identifier indicating from where the read was sampled. The id
-    contains the name of the source an uniq numeric identifier, a bolean set to
-    True is the original sequence is a junction and a description of the origin
-    sequence by read positions. Example: 1-75=Bact:330-405 means that bases
-    position 1 to 75 from the read originates from positions 333-405 from bact
-    reference sequences. Need global parameters to be executed correctly.
+    Generate an identifier indicating from where the read was sampled (see
+    FastqGenerator.read_id) from the annotations of a SeqRecord read, or a short
+    numeric identifier. Need global parameters to be executed correctly.
     * READ_LEN  Lenght of the reads to be generated (integer)
+    * READ_OFFSETS Number of the first read of each source or None (dict)
     @param  i   Num of the read (integer)
     @param  id_len Max number of digit
     @param  d   annotation dictionnary from a seq record object
     @return A descriptive and uniq string.
     """
-    # Add source name
-    id_string = "{}".format(d["source"].getName())
-    # Add an uniq numeric identifier per source with zero padding
-    id_string += "|{0:0{1}}".format(i, id_len)
-
-    # If the source is a junction coordinate along original references are asked
-    # to the source reference junction in which the read was sampled
-    if isinstance (d["source"], RefJun):
-        id_string += "|1|{}".format(d["source"].origin_coord(d["refseq"], d["location"][0], d["location"][1]))
-    # Just enter strored coordinates if the reference is a ReferenceGenome obj
-    else:
-        id_string += "|0|1-{}={}:{}-{}".format(READ_LEN, d["refseq"].id, d["location"][0], d["location"][1])
-
-    return id_string
+    if READ_OFFSETS is not None:
+        return str(READ_OFFSETS[d["source"].getName()] + i)
+    return read_id(i, id_len, d["source"], d["refseq"], d["location"][0], d["location"][1], READ_LEN)
 
 
 #~~~~~~~FUNCTIONS FOR GRAPHICAL OUTPUT~~~~~~~#
 
 def update_jun_cov (start, end):
-    for i in range (start, end):
-        JUN_COV [i] += 1
+    JUN_COV.add (start, end)
 
 def update_frag_len (frag_len):
-    FRAG_LEN.append(frag_len)
+    FRAG_LEN.add (frag_len)
 
 def frag_len_graph ():
     """
@@ -218,7 +715,7 @@ def frag_len_graph ():
     * BASENAME  basename for output files (string)
     * SONIC_MIN Minimal size of sonication fragments (integer)
     * SONIC_MAX Maximal size of sonication fragments (integer)
-    * FRAG_LEN  List of size from sonication fragments (list)
+    * FRAG_LEN  Histogram of sonication fragment sizes (LengthHistogram)
     """
     print ("\tCreating a graphical output of fragment length distribution")
 
@@ -228,10 +725,10 @@ def frag_len_graph ():
     plt.ylabel('Count')
     plt.xlabel('Size of fragment')
 
-    # Plot value from FRAG_LEN list in an histogram reprensentation
-    
+    # Plot value from FRAG_LEN counts in an histogram reprensentation
+    lengths, counts = FRAG_LEN.lengths()
     bins = logspace(len(str(SONIC_MIN))-1,len(str(SONIC_MAX-1)),125)
-    plt.hist(FRAG_LEN, bins=bins, facecolor='green', alpha=0.5, align='mid',  histtype='stepfilled')
+    plt.hist(lengths, bins=bins, weights=counts, facecolor='green', alpha=0.5, align='mid',  histtype='stepfilled')
     plt.gca().set_xscale("log")
     
     # Tweak spacing to prevent clipping of ylabel
@@ -248,7 +745,7 @@ def jun_cov_graph ():
     the third party package pyplot from matplotlib. Need global parameters to be
     executed correctly.
     * BASENAME  basename for output files (string)
-    * JUN_COV  Read coverage list for each position overlaping junctions (list)
+    * JUN_COV  Read coverage for each position overlaping junctions (CoverageAccumulator)
     """
     print ("\tCreating a graphical output of read coverage over junctions")
 
@@ -259,12 +756,13 @@ def jun_cov_graph ():
     plt.xlabel('Position (mid = junction)')
 
     # List of numbers for x axis positions
-    x = [i+1 for i in range (len(JUN_COV))]
+    coverage = JUN_COV.coverage()
+    x = [i+1 for i in range (len(coverage))]
 
     # Plot a vertical line indicating the position of the junction
-    plt.axvline(len(JUN_COV)/2, color="red")
+    plt.axvline(len(coverage)/2, color="red")
     # Plot an area representing the coverage depth
-    plt.fill(x,JUN_COV, facecolor='green', alpha=0.5)
+    plt.fill(x,coverage, facecolor='green', alpha=0.5)
 
     # Tweak spacing to prevent clipping of ylabel
     plt.subplots_adjust(left=0.15)
@@ -274,6 +772,149 @@ def jun_cov_graph ():
 
     return 1
 
+def write_stats_tsv ():
+    """
+    Write the read coverage over junctions and the fragment length distribution (in pair end
+    mode) in tsv files. Need global parameters to be executed correctly.
+    * BASENAME  basename for output files (string)
+    * JUN_COV  Read coverage for each position overlaping junctions (CoverageAccumulator)
+    * FRAG_LEN  Histogram of sonication fragment sizes (LengthHistogram)
+    """
+    print ("\tWriting coverage over junctions and fragment length distribution in tsv files")
+    JUN_COV.to_tsv (BASENAME+'_junction_coverage.tsv')
+    if PAIR:
+        FRAG_LEN.to_tsv (BASENAME+'_fragment_length.tsv')
+
+    return 1
+
+#~~~~~~~FUNCTIONS FOR SIDECAR FILES~~~~~~~#
+
+def open_sidecars ():
+    """
+    Open the files of SIDECARS and write their header : the BGZF compressed truth alignment file
+    if truth alignments are requested, the uncompressed read index file with short read ids and
+    the temporary file of unsorted read intervals if requested. Need global parameters to be
+    executed correctly.
+    * BASENAME  basename for output files (string)
+    * TRUTH Formater of truth alignment records or None (TruthAlignment)
+    * READ_INDEX Formater of read index records or None (ReadIndexFormatter)
+    * INTERVALS Formater of read interval records or None (IntervalIndexFormatter)
+    * COMPRESSION_LEVEL Compression level from 1 to 9 (integer)
+    * COMPRESSION_THREADS Number of threads compressing each bgzf output (integer)
+    @return A list containing the handles of SIDECARS in the same order
+    """
+    handles = []
+
+    if TRUTH:
+        path = BASENAME + ("_truth.bam" if TRUTH.get_format() == "bam" else "_truth.sam.gz")
+        print ("\tWritting true alignments of reads in {}".format (path))
+        handles.append (RecordBuffer (BgzfWriter (path, COMPRESSION_LEVEL, COMPRESSION_THREADS)))
+        handles[-1].write (TRUTH.header())
+
+    # The read index is not compressed to be memory mapped
+    if READ_INDEX:
+        path = BASENAME + "_read_index" + READ_INDEX_EXTENSION
+        print ("\tWritting the origin of reads in {}".format (path))
+        handles.append (RecordBuffer (open_writer (path, "plain")))
+        handles[-1].write (READ_INDEX.header())
+
+    # Read intervals are sorted in the interval index at the end of the run (see index_intervals)
+    if INTERVALS:
+        handles.append (RecordBuffer (open_writer (BASENAME + "_read_intervals.tmp", "plain")))
+        handles[-1].write (INTERVALS.header())
+
+    return handles
+
+def index_intervals ():
+    """
+    Sort the read intervals written during the run in the interval index file if requested. Need
+    global parameters to be executed correctly.
+    * BASENAME  basename for output files (string)
+    * INTERVALS Formater of read interval records or None (IntervalIndexFormatter)
+    """
+    if not INTERVALS:
+        return
+
+    path = BASENAME + "_read_intervals" + INTERVAL_INDEX_EXTENSION
+    print ("\tSorting the intervals of reads in {}".format (path))
+    with PROFILER.stage ("index_intervals"):
+        INTERVALS.write_index (BASENAME + "_read_intervals.tmp", path)
+
+#~~~~~~~FUNCTIONS FOR PROFILING~~~~~~~#
+
+def instrument_run (fastgen):
+    """
+    Replace the methods slicing, generating, formating and writing reads by wrappers recording
+    their calls in the stages of PROFILER. Worker processes inherit the wrappers. Need global
+    parameters to be executed correctly.
+    * PROFILER Recorder of the stages of the run (Profiler)
+    @param  fastgen Instance of FastqGenerator
+    """
+    # Function specific imports
+    from Bio.SeqRecord import SeqRecord
+    from FastqWriter import FastqWriter, BgzfWriter
+
+    # Number of items processed by a call, from its arguments and result
+    n_result = lambda args, result: len (result)
+    n_first = lambda args, result: len (args[0])
+    n_bytes = lambda args, result: len (args[1])
+
+    # Slicing of reads in sources, including the replacement of rejected slices
+    slicer = fastgen.get_slicer()
+    PROFILER.instrument (slicer, "pick_slice", "pick_slice")
+    PROFILER.instrument (slicer, "pick_raw", "pick_slice")
+    PROFILER.instrument (slicer, "pick_block", "pick_slice", count=n_result)
+
+    # Generation of quality scores
+    qualgen = fastgen.get_qualgen()
+    PROFILER.instrument (qualgen, "qual_score", "qual_score")
+    PROFILER.instrument (qualgen, "qual_scores", "qual_score", count=n_result)
+
+    # Read identifiers and fastq formating of the SeqRecord, raw and block engines
+    PROFILER.instrument (sys.modules[__name__], "generate_id", "generate_id")
+    PROFILER.instrument (SeqRecord, "format", "format")
+    PROFILER.instrument (fastgen, "record_formatter", "format", count=lambda args, result: 0,
+        wrap_result=True)
+    PROFILER.instrument (fastgen, "format_block", "format", count=n_first)
+    # Formating of truth alignment records
+    if TRUTH:
+        PROFILER.instrument (TRUTH, "format_reads", "truth", count=n_first)
+        PROFILER.instrument (TRUTH, "format_pairs", "truth", count=n_first)
+    # Formating of read index records
+    if READ_INDEX:
+        PROFILER.instrument (READ_INDEX, "format_reads", "read_index", count=n_first)
+        PROFILER.instrument (READ_INDEX, "format_pairs", "read_index", count=n_first)
+    # Formating of read interval records
+    if INTERVALS:
+        PROFILER.instrument (INTERVALS, "format_reads", "read_intervals", count=n_first)
+        PROFILER.instrument (INTERVALS, "format_pairs", "read_intervals", count=n_first)
+
+    # Buffering of records (bytes), and compression in the writer threads
+    PROFILER.instrument (RecordBuffer, "write", "write", count=n_bytes)
+    for writer in (FastqWriter, BgzfWriter):
+        PROFILER.instrument (writer, "_write", "compress", count=n_bytes)
+
+def write_profile ():
+    """
+    Print the profiling report and write it in a json file. Need global parameters to be executed
+    correctly.
+    * PROFILER Recorder of the stages of the run (Profiler)
+    * BASENAME  basename for output files (string)
+    """
+    print ("Profiling report")
+    for line in PROFILER.report():
+        print (line)
+
+    # No basename is available in streaming mode
+    path = "{}_profile.json".format ("isis" if STREAM else BASENAME)
+    print ("\tWritting profiling report in {}".format (path))
+    try:
+        PROFILER.to_json (path, engine=ENGINE, workers=WORKERS, pair=PAIR, read_num=READ_NUM,
+            read_len=READ_LEN, seed=RNG.get_seed(), shard=list (SHARD))
+    except IOError as E:
+        print (E)
+        exit (0)
+
 #~~~~~~~FUNCTIONS FOR REPORT WRITING~~~~~~~#
 
 def write_samp_report ():
@@ -314,10 +955,22 @@ if __name__ == '__main__':
     ## Version of the main program
     PROGRAM_VERSION = "0.01"
 
+    ## Reads are streamed on the standard output (bool)
+    STREAM = stream_requested (sys.argv[1:])
+    ## Standard output file receiving the reads in streaming mode (file)
+    STDOUT = sys.stdout
+    # Status messages are redirected to the standard error output in streaming mode
+    if STREAM:
+        sys.stdout = sys.stderr
+
     #~~~~~~~Import configurations in global variables~~~~~~~#
 
     ## Instance of the configuration file parser/verifier IsisConf
     CONFIG = IsisConf(PROGRAM_NAME, PROGRAM_VERSION)
+    ## Record the calls and times of the stages of the run (bool)
+    PROFILE = CONFIG.get("profile")
+    ## Recorder of the stages of the run, disabled if profiling is not requested (Profiler)
+    PROFILER = Profiler (enabled=PROFILE)
 
     ## Host genome fasta file path (string)
     HOST_GENOME = CONFIG.get("host_genome")
@@ -363,40 +1016,135 @@ if __name__ == '__main__':
     SONIC_MAX = CONFIG.get("sonic_max")
     ## Thickness of the sonication peak (integer)
     SONIC_CERTAINTY = CONFIG.get("sonic_certainty")
+    ## Empirical fragment length histogram replacing the beta distribution or None (FragmentHistogram)
+    FRAG_HIST = None
+    if PAIR and CONFIG.get("frag_len_hist"):
+        try:
+            FRAG_HIST = import_frag_hist (CONFIG.get("frag_len_hist"), READ_LEN + MIN_CHIMERIC)
+        except (IOError, ValueError) as E:
+            print (E)
+            exit (0)
+        # The range and mode of fragment sizes are those of the histogram
+        SONIC_MIN, SONIC_MODE, SONIC_MAX = FRAG_HIST.get_min(), FRAG_HIST.get_mode(), FRAG_HIST.get_max()
+        print ("\tFragment sizes drawn from {} ({} to {} pb)".format (CONFIG.get("frag_len_hist"), SONIC_MIN, SONIC_MAX))
     ## Range of quality for reads (string)
     QUAL_SCALE = CONFIG.get("qual_scale")
     ## Quality scale in which fastq quality string will be converted (sanger, illumina, solexa...) (string)
     QUAL_RANGE = CONFIG.get("qual_range")
+    ## Number of worker processes generating reads (integer)
+    WORKERS = CONFIG.get("workers")
+    ## Read generation engine : blocks of raw strings, raw strings or Biopython SeqRecord objects (string)
+    ENGINE = CONFIG.get("engine")
+    ## Number of reads generated at once by the block engine (integer)
+    BLOCK_SIZE = 1000
+    ## Maximal number of blocks waiting between 2 threads of the serial pipeline (integer)
+    PIPELINE_QUEUE = 8
+    ## Output backend : plain, gzip, bgzf or pipe (string)
+    COMPRESSION = CONFIG.get("compression")
+    ## Compression level from 1 (fast) to 9 (small) (integer)
+    COMPRESSION_LEVEL = CONFIG.get("compression_level")
+    ## Number of threads compressing each bgzf output (integer)
+    COMPRESSION_THREADS = CONFIG.get("compression_threads")
+    ## Format of the truth alignment file : none, bam or sam (string)
+    TRUTH_FORMAT = CONFIG.get("truth")
+    ## Read identifiers : full descriptive ids or short numeric ids with a read index (string)
+    READ_IDS = CONFIG.get("read_ids")
+    ## Write an index of the reads overlapping each region of the references (bool)
+    READ_INTERVALS = CONFIG.get("read_intervals")
+    ## Maximal number of reads generated by a worker at once, multiple of BLOCK_SIZE (integer)
+    CHUNK_SIZE = 10 * BLOCK_SIZE
+    ## Shard number i and number of shards N of the reads to generate (tuple)
+    SHARD = CONFIG.get("shard")
+    ## Prefix of the junction catalogue files or None (string)
+    CATALOGUE = CONFIG.get("catalogue")
+    ## Reference cache directory or None (string)
+    CACHE_DIR = CONFIG.get("cache")
+    ## Storage of reference sequences : auto or faidx (string)
+    STORAGE = CONFIG.get("storage")
+    ## Random stream shared by all objects, seeded with the seed of the conf file or a random seed (RandomStream)
+    RNG = RandomStream (CONFIG.get("seed") or None)
+    print ("\tSeed of random generators : {}".format (RNG.get_seed()))
     ## Lenght of junctions to be generated (integer)
     JUN_LEN = SONIC_MAX if PAIR else READ_LEN
 
+    # No output file is written in streaming mode
+    if STREAM and (GRAPH or REPORT or TRUTH_FORMAT != "none" or READ_IDS != "full" or READ_INTERVALS):
+        print ("\tGraphical output, sampling report, truth alignments and read indexes are disabled in streaming mode")
+        GRAPH = REPORT = READ_INTERVALS = False
+        TRUTH_FORMAT = "none"
+        READ_IDS = "full"
+    if STREAM and WORKERS > 1:
+        print ("\tReads are generated by a single process in streaming mode")
+        WORKERS = 1
+
     #~~~~~~~Instanciate reference genomes and junctions~~~~~~~#
 
-    ## Viral genome reference object (ReferenceGenome)
-    VIRUS = RefGen ("virus", VIRUS_GENOME)
-    ## Host genome reference object (ReferenceGenome)
-    HOST = RefGen ("host", HOST_GENOME)
-    ## True junctions reference object (ReferenceJunctions)
-    TJUN = RefJun("True_Junction", MIN_CHIMERIC, JUN_LEN, UNIQ_TJUN, VIRUS, HOST, REPEATS, AMBIGUOUS)
-    ## False junctions reference object (ReferenceJunctions)
-    FJUN = RefJun("False_Junction", MIN_CHIMERIC, JUN_LEN, UNIQ_FJUN, VIRUS, HOST, REPEATS, AMBIGUOUS)
+    with PROFILER.stage ("import_seq", 2):
+        ## Viral genome reference object (ReferenceGenome)
+        VIRUS = RefGen ("virus", VIRUS_GENOME, rng=RNG, cache_dir=CACHE_DIR, storage=STORAGE)
+        ## Host genome reference object (ReferenceGenome)
+        HOST = RefGen ("host", HOST_GENOME, rng=RNG, cache_dir=CACHE_DIR, storage=STORAGE)
+
+    with PROFILER.stage ("create_junctions", UNIQ_TJUN + UNIQ_FJUN):
+        ## True junctions reference object (ReferenceJunctions)
+        TJUN = RefJun("True_Junction", MIN_CHIMERIC, JUN_LEN, UNIQ_TJUN, VIRUS, HOST, REPEATS, AMBIGUOUS, rng=RNG,
+            catalogue="{}_True_Junction.npz".format(CATALOGUE) if CATALOGUE else None)
+        ## False junctions reference object (ReferenceJunctions)
+        FJUN = RefJun("False_Junction", MIN_CHIMERIC, JUN_LEN, UNIQ_FJUN, VIRUS, HOST, REPEATS, AMBIGUOUS, rng=RNG,
+            catalogue="{}_False_Junction.npz".format(CATALOGUE) if CATALOGUE else None)
 
     ## Convenient list of reference sequence source associated with the number of read to generate for each of them
     SOURCE_LIST = [[VIRUS, N_VIRUS], [HOST, N_HOST], [TJUN, N_TJUN], [FJUN, N_FJUN]]
 
+    ## Number of the first read of each source in the whole dataset for short read ids, or None (dict)
+    READ_OFFSETS = read_offsets (SOURCE_LIST) if READ_IDS == "short" else None
+
+    ## Formater of the true alignments of reads on virus and host sequences or None (TruthAlignment)
+    TRUTH = None
+    if TRUTH_FORMAT != "none":
+        TRUTH = TruthAlignment ([VIRUS, HOST], TRUTH_FORMAT, QUAL_SCALE,
+            (PROGRAM_NAME, PROGRAM_VERSION, " ".join (sys.argv)), offsets=READ_OFFSETS)
+
+    ## Formater of the origin of reads with short read ids or None (ReadIndexFormatter)
+    READ_INDEX = None
+    if READ_OFFSETS is not None:
+        # Reads of the shard are numbered contiguously from its first range
+        ranges = shard_ranges (SOURCE_LIST, SHARD, BLOCK_SIZE)
+        first = READ_OFFSETS[SOURCE_LIST[ranges[0][0]][0].getName()] + ranges[0][1] if ranges else 0
+        READ_INDEX = ReadIndexFormatter ([VIRUS, HOST], [source for source, nread in SOURCE_LIST], first,
+            sum ([nread for source_idx, start, nread in ranges]), PAIR)
+
+    ## Formater of the intervals of reads along the references or None (IntervalIndexFormatter)
+    INTERVALS = None
+    if READ_INTERVALS:
+        INTERVALS = IntervalIndexFormatter ([VIRUS, HOST], [source for source, nread in SOURCE_LIST], READ_OFFSETS)
+
+    ## Formaters of the files written in the same pass as the fastq files (list)
+    SIDECARS = [sidecar for sidecar in (TRUTH, READ_INDEX, INTERVALS) if sidecar]
+
     #~~~~~~~Prepare tools and variables for graphical output~~~~~~~#
 
     if GRAPH:
         # Third party package matplotlib imported only if needed
         from matplotlib import pyplot as plt
         from numpy import logspace
-        ## Lenghts of sonication fragments (list)
-        FRAG_LEN = []
-        ## Read depth over all positions of junctions (list)
-        JUN_COV = [0 for i in range (JUN_LEN*2)]
+        ## Histogram of sonication fragment lenghts (LengthHistogram)
+        FRAG_LEN = LengthHistogram (SONIC_MAX)
+        ## Read depth over all positions of junctions (CoverageAccumulator)
+        JUN_COV = CoverageAccumulator (JUN_LEN*2)
 
     #~~~~~~~Lauch main fastq writing functions~~~~~~~#
 
+    ## Function writing a range of reads from a source in file handles
+    if ENGINE == "block":
+        WRITE_READS = write_block_pair if PAIR else write_block_single
+        ## Function formating a block of reads of the block engine and updating graphical statistics
+        FORMAT_BLOCK = format_block_pair if PAIR else format_block_single
+    elif ENGINE == "raw":
+        WRITE_READS = write_raw_pair if PAIR else write_raw_single
+    else:
+        WRITE_READS = write_reads_pair if PAIR else write_reads_single
+
     if PAIR: # Pair end mode
         print ("Start pair end mode fastq sampling")
         IsisPair()
@@ -409,8 +1157,13 @@ if __name__ == '__main__':
     if REPORT:
         write_samp_report ()
 
+    # Write the profiling report if requested
+    if PROFILE:
+        write_profile ()
+
     # Draw graphs if requested
     if GRAPH:
+        write_stats_tsv ()
         # Graph of read coverage over junctions
         jun_cov_graph ()
         if PAIR:
@@ -0,0 +1,383 @@
+"""
+@package    PackedGenome
+@brief      **Compile fasta files in a memory-mappable 2-bit packed binary format**
+Each base is stored on 2 bits (A, C, G, T) and the information lost by the packing is kept as runs:
+runs of non ACGT characters (N or other IUPAC ambiguous bases) with their letter and runs of
+lowercase characters (soft masked repeats). A contig index is written at the end of the file. Once
+compiled, the file is memory-mapped and slices are decoded on demand without loading the genome in
+memory. Records mimick the part of the Biopython SeqRecord interface used by Reference. This module
+require the Third party packages numpy and Biopython.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from struct import pack, unpack, calcsize
+from os import path
+import mmap
+
+# Third party packages
+import numpy as np
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import single_letter_alphabet
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Magic string identifying a packed genome file
+MAGIC = "ISIS2BIT"
+## Version of the packed genome format
+VERSION = 1
+## Default extension of packed genome files
+EXTENSION = ".isis2b"
+## File header : magic, version, number of contigs and offset of the contig index
+HEADER_FMT = "<8sIIQ"
+## Fixed part of a contig index entry : length, offset of packed bases, offset and number of
+## ambiguous runs, offset and number of lowercase runs, length of name and description
+ENTRY_FMT = "<QQQIQIHH"
+
+## 2-bit code of each uppercase ASCII character (non ACGT characters are coded as A)
+ENCODE = np.zeros(256, dtype=np.uint8)
+for _code, _base in enumerate("ACGT"):
+    ENCODE[ord(_base)] = _code
+
+## Characters stored as 2-bit codes without an ambiguous run
+PACKABLE = np.zeros(256, dtype=bool)
+for _base in "ACGT":
+    PACKABLE[ord(_base)] = True
+
+## Decoding table of a packed byte into its 4 ASCII bases
+DECODE = np.array([[ord("ACGT"[(byte >> shift) & 3]) for shift in (6, 4, 2, 0)]
+    for byte in range(256)], dtype=np.uint8)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class PackedGenome(object):
+    """
+    @class PackedGenome
+    @brief Memory map a packed genome file and give access to its contigs as PackedRecord objects.
+    Bases are decoded only when a slice is requested.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, packed_path):
+        """
+        Memory map the packed genome file and parse its contig index
+        @param packed_path Path of a packed genome file created by compile_genome (string)
+        @exception IOError Raise if the file is not a valid packed genome file
+        """
+        self.packed_path = packed_path
+
+        with open(packed_path, "rb") as handle:
+            ## Read only memory map of the whole file
+            self.mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, ncontig, index_offset = unpack(HEADER_FMT, self.mm[:calcsize(HEADER_FMT)])
+        if magic != MAGIC or version != VERSION:
+            raise IOError("{} is not a valid packed genome file".format(packed_path))
+
+        ## List of PackedRecord in the order of the original fasta file
+        self.records = []
+        offset = index_offset
+        entry_size = calcsize(ENTRY_FMT)
+
+        for i in range(ncontig):
+            entry = unpack(ENTRY_FMT, self.mm[offset:offset+entry_size])
+            offset += entry_size
+            name = self.mm[offset:offset+entry[6]]
+            offset += entry[6]
+            description = self.mm[offset:offset+entry[7]]
+            offset += entry[7]
+            self.records.append(PackedRecord(self, name, description, *entry[:6]))
+
+    def __repr__(self):
+        return "{}\nFile : {}\nNumber of contigs : {}\n".format(
+            self.__str__(), self.packed_path, len(self.records))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_records(self):
+        return self.records
+
+    def to_dict(self):
+        """
+        @return A dictionnary of PackedRecord indexed by contig name
+        """
+        return {record.id : record for record in self.records}
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def array(self, offset, count, dtype):
+        """
+        Return a read only numpy view on the memory map without copying data
+        @param offset Offset of the first element in the file (int)
+        @param count Number of elements (int)
+        @param dtype Numpy type of the elements
+        @return A numpy array sharing the memory of the memory map
+        """
+        return np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class PackedRecord(object):
+    """
+    @class PackedRecord
+    @brief Contig of a PackedGenome. Slicing the record decode the requested bases and return a
+    Biopython SeqRecord, as would do slicing the SeqRecord parsed from the fasta file.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, genome, name, description, length, base_offset, amb_offset, n_amb,
+                 mask_offset, n_mask):
+        """
+        Create views on the packed bases and the runs of the contig in the memory map
+        @param genome PackedGenome containing the contig
+        @param name Name of the contig (string)
+        @param description Description line of the contig in the fasta file (string)
+        @param length Number of bases of the contig (int)
+        @param base_offset Offset of the packed bases in the file (int)
+        @param amb_offset Offset of ambiguous runs starts, ends and letters in the file (int)
+        @param n_amb Number of ambiguous runs (int)
+        @param mask_offset Offset of lowercase runs starts and ends in the file (int)
+        @param n_mask Number of lowercase runs (int)
+        """
+        self.id = self.name = name
+        self.description = description
+        self.annotations = {}
+        self.length = length
+
+        # Numpy views sharing the memory map
+        self.bases = genome.array(base_offset, (length+3)//4, np.uint8)
+        self.amb_starts = genome.array(amb_offset, n_amb, np.uint32)
+        self.amb_ends = genome.array(amb_offset + 4*n_amb, n_amb, np.uint32)
+        self.amb_letters = genome.array(amb_offset + 8*n_amb, n_amb, np.uint8)
+        self.mask_starts = genome.array(mask_offset, n_mask, np.uint32)
+        self.mask_ends = genome.array(mask_offset + 4*n_mask, n_mask, np.uint32)
+
+        ## Seq like object allowing to slice the record sequence
+        self.seq = PackedSeq(self)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "{}\nID: {}\nPacked sequence of {} bases\n".format(
+            self.__str__(), self.id, self.length)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __getitem__(self, index):
+        """
+        Decode a slice of the contig in a SeqRecord like Biopython slicing of a SeqRecord
+        @param index A slice object with a step of 1
+        @return A SeqRecord object containing the decoded sequence
+        """
+        return SeqRecord(self.seq[index], id=self.id, name=self.name, description=self.description)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def fetch(self, start, end):
+        """
+        Decode the bases between start and end
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return The decoded sequence with its original case and ambiguous letters (string)
+        """
+        start = max(0, start)
+        end = min(self.length, end)
+        if end <= start:
+            return ""
+
+        # Unpack the bytes covering the slice and trim the extra bases
+        first_byte = start // 4
+        last_byte = (end + 3) // 4
+        seq = DECODE[self.bases[first_byte:last_byte]].ravel()[start-4*first_byte:end-4*first_byte]
+
+        # Restore ambiguous letters overlapping the slice
+        i = np.searchsorted(self.amb_ends, start, side="right")
+        while i < len(self.amb_starts) and self.amb_starts[i] < end:
+            seq[max(self.amb_starts[i], start)-start:min(self.amb_ends[i], end)-start] = self.amb_letters[i]
+            i += 1
+
+        # Restore lowercase characters overlapping the slice
+        i = np.searchsorted(self.mask_ends, start, side="right")
+        while i < len(self.mask_starts) and self.mask_starts[i] < end:
+            seq[max(self.mask_starts[i], start)-start:min(self.mask_ends[i], end)-start] |= 0x20
+            i += 1
+
+        return seq.tostring()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class PackedSeq(object):
+    """
+    @class PackedSeq
+    @brief Minimal Seq like interface of a PackedRecord. Slicing return a Biopython Seq object
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    def __init__(self, record):
+        self.record = record
+
+    def __len__(self):
+        return len(self.record)
+
+    def __str__(self):
+        return self.record.fetch(0, len(self.record))
+
+    def __getitem__(self, index):
+        start, end, step = index.indices(len(self.record))
+        if step != 1:
+            raise ValueError("PackedSeq slicing does not support steps")
+        return Seq(self.record.fetch(start, end), single_letter_alphabet)
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def is_packed(fp):
+    """
+    Verify if a file is a packed genome file by reading its magic string
+    @param fp Path of the file to verify (string)
+    @return True if the file is a packed genome file (bool)
+    """
+    try:
+        with open(fp, "rb") as handle:
+            return handle.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+def packed_path(fasta_path):
+    """
+    @param fasta_path Path of a fasta file (string)
+    @return The default path of the packed genome file compiled from a fasta file (string)
+    """
+    return fasta_path + EXTENSION
+
+def up_to_date(fasta_path, packed_path):
+    """
+    @param fasta_path Path of a fasta file (string)
+    @param packed_path Path of a packed genome file (string)
+    @return True if the packed file exists and is more recent than the fasta file (bool)
+    """
+    return (path.isfile(packed_path) and is_packed(packed_path)
+        and path.getmtime(packed_path) >= path.getmtime(fasta_path))
+
+def import_packed(packed_path):
+    """
+    Memory map a packed genome file
+    @param packed_path Path of a packed genome file (string)
+    @return A list of PackedRecord in the order of the fasta file
+    """
+    print("\tMapping packed genome data")
+    return PackedGenome(packed_path).get_records()
+
+def compile_genome(fasta_path, out_path=None):
+    """
+    Compile a fasta file into a packed genome file. Sequences are parsed one by one so that only
+    one contig is loaded in memory at a time
+    @param fasta_path Path of the fasta file to compile. Can be gzipped (string)
+    @param out_path Path of the packed genome file (string). Default = fasta_path + EXTENSION
+    @return The path of the packed genome file (string)
+    @exception ValueError Raise if a contig is too long for the 32 bits run positions
+    """
+    # Require the Third party package Biopython
+    from Bio import SeqIO
+    import gzip
+
+    out_path = out_path or packed_path(fasta_path)
+    print("\tCompiling {} in {}".format(fasta_path, out_path))
+
+    handle = gzip.open(fasta_path, "r") if fasta_path.endswith(".gz") else open(fasta_path, "r")
+    entries = []
+
+    with open(out_path, "wb") as out:
+        # Placeholder header rewritten when the index offset is known
+        out.write(pack(HEADER_FMT, "", 0, 0, 0))
+
+        for record in SeqIO.parse(handle, "fasta"):
+            seq = np.frombuffer(str(record.seq), dtype=np.uint8)
+            if len(seq) >= 2**32:
+                raise ValueError("Contig {} is too long to be packed ({} bases)".format(record.id, len(seq)))
+
+            # Only lowercase letters are converted, other characters being kept as ambiguous
+            lower = (seq >= ord("a")) & (seq <= ord("z"))
+            upper = np.where(lower, seq & 0xDF, seq)
+
+            # Pack 4 bases per byte after padding the sequence to a multiple of 4
+            codes = np.zeros(((len(seq)+3)//4)*4, dtype=np.uint8)
+            codes[:len(seq)] = ENCODE[upper]
+            base_offset = out.tell()
+            out.write((codes[0::4] << 6 | codes[1::4] << 4 | codes[2::4] << 2 | codes[3::4]).tostring())
+
+            # Runs of identical non ACGT letters
+            amb_starts, amb_ends, amb_letters = _runs(np.where(PACKABLE[upper], 0, upper))
+            amb_offset = out.tell()
+            for array in (amb_starts, amb_ends):
+                out.write(array.astype(np.uint32).tostring())
+            out.write(amb_letters.astype(np.uint8).tostring())
+
+            # Runs of lowercase letters
+            mask_starts, mask_ends, _ = _runs(lower)
+            mask_offset = out.tell()
+            for array in (mask_starts, mask_ends):
+                out.write(array.astype(np.uint32).tostring())
+
+            # Keep 8 bytes alignment of the next contig
+            out.write("\0" * (-out.tell() % 8))
+
+            entries.append(pack(ENTRY_FMT, len(seq), base_offset, amb_offset, len(amb_starts),
+                mask_offset, len(mask_starts), len(record.id), len(record.description))
+                + record.id + record.description)
+
+        # Write the contig index and update the header
+        index_offset = out.tell()
+        out.write("".join(entries))
+        out.seek(0)
+        out.write(pack(HEADER_FMT, MAGIC, VERSION, len(entries), index_offset))
+
+    handle.close()
+    return out_path
+
+def _runs(values):
+    """
+    Find runs of identical non null values in an array
+    @param values Numpy array of integers or booleans
+    @return Arrays of start positions, end positions and values of runs
+    """
+    values = values.astype(np.uint8)
+    if not len(values):
+        empty = np.zeros(0, dtype=np.uint32)
+        return empty, empty, empty
+
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1, [len(values)]))
+    starts, ends, run_values = bounds[:-1], bounds[1:], values[bounds[:-1]]
+    keep = run_values != 0
+    return starts[keep], ends[keep], run_values[keep]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~MAIN FUNCTION~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    import optparse
+
+    usage_string = "%prog genome.fa[.gz] [-o genome.fa{}]".format(EXTENSION)
+    optparser = optparse.OptionParser(usage = usage_string)
+    hstr = "Facultative option to indicate the path of the packed genome file (default = fasta path + {})".format(EXTENSION)
+    optparser.add_option( '-o', '--output', dest="output", help=hstr)
+    options, args = optparser.parse_args()
+
+    if len(args) != 1:
+        optparser.error("A single fasta file path is required")
+
+    print ("Packed genome written in {}".format(compile_genome(args[0], options.output)))
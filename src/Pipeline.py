@@ -0,0 +1,216 @@
+"""
+@package    Pipeline
+@brief      **Stages of read generation running concurrently in threads**
+A pipeline chains a producer iterating over a generator (for instance the generation of blocks of
+reads) and stages transforming each item (for instance the formating of blocks in fastq text).
+Each step runs in its own thread and the steps are connected by bounded queues, so that a fast
+step is blocked when the next one cannot follow (backpressure) and the memory used stays bounded.
+The items are yielded in order to the calling thread. Queues record their depth and the time spent
+waiting by their producer (queue full) and their consumer (queue empty), to find the bottleneck.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from threading import Thread
+from Queue import Queue, Empty
+from time import time
+import sys
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Default maximal number of items waiting between 2 steps of a pipeline
+QUEUE_SIZE = 8
+## Item marking the end of the items of a queue
+END = None
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class StatQueue(Queue):
+    """
+    @class StatQueue
+    @brief Bounded queue recording its depth when items are put, and the time spent blocked by
+    its producer and its consumer. A queue often full shows that its consumer is the bottleneck,
+    and a queue often empty that its producer is. A single producer and a single consumer thread
+    are expected.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, name, producer, consumer, maxsize=QUEUE_SIZE):
+        """
+        @param name Name of the queue (string)
+        @param producer Name of the step putting items in the queue (string)
+        @param consumer Name of the step consuming the queue (string)
+        @param maxsize Maximal number of items in the queue (int)
+        """
+        Queue.__init__(self, maxsize)
+        self.name = name
+        self.producer = producer
+        self.consumer = consumer
+        self.puts = self.depth_sum = self.max_depth = self.full_puts = 0
+        self.gets = self.empty_gets = 0
+        self.put_wait = self.get_wait = 0.0
+
+    def __repr__(self):
+        return "{}\nName : {}\nDepth : {}/{}\n".format(
+            self.__str__(), self.name, self.qsize(), self.maxsize)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def put(self, item, block=True, timeout=None):
+        depth = self.qsize()
+        start = time()
+        Queue.put(self, item, block, timeout)
+        self.put_wait += time() - start
+        self.puts += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+        if depth >= self.maxsize:
+            self.full_puts += 1
+
+    def get(self, block=True, timeout=None):
+        empty = not self.qsize()
+        start = time()
+        item = Queue.get(self, block, timeout)
+        self.get_wait += time() - start
+        self.gets += 1
+        if empty:
+            self.empty_gets += 1
+        return item
+
+    def stats(self):
+        """
+        @return The depth and waiting statistics of the queue (dict)
+        """
+        return {"queue": self.name, "producer": self.producer, "consumer": self.consumer, "size": self.maxsize,
+            "puts": self.puts, "mean_depth": float(self.depth_sum) / self.puts if self.puts else 0,
+            "max_depth": self.max_depth, "full_puts": self.full_puts, "put_wait": self.put_wait,
+            "empty_gets": self.empty_gets, "get_wait": self.get_wait}
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class Pipeline(object):
+    """
+    @class Pipeline
+    @brief Iterable running a producer and a chain of stages in threads connected by bounded
+    queues, and yielding the items of the last stage in order. An exception raised in a thread
+    (including SystemExit) is raised again in the calling thread.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, producer, stages=(), consumer="main", queue_size=QUEUE_SIZE):
+        """
+        @param producer Tuple of the name of the producer and an iterable of items (tuple)
+        @param stages List of tuples of the name of a stage and a function applied to each item
+        (list)
+        @param consumer Name of the step iterating over the pipeline (string)
+        @param queue_size Maximal number of items waiting between 2 steps (int)
+        """
+        self.names = [producer[0]] + [name for name, func in stages]
+        self.producer = producer[1]
+        self.stages = [func for name, func in stages]
+        self.queues = [StatQueue("{} -> {}".format(name, after), name, after, queue_size)
+            for name, after in zip(self.names, self.names[1:] + [consumer])]
+        self.error = None
+        self.stopped = False
+        self.threads = []
+
+    def __repr__(self):
+        return "{}\nSteps : {}\n".format(self.__str__(), " -> ".join(self.names))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __iter__(self):
+        """
+        Start the threads and yield the items of the last stage
+        """
+        self.threads = [Thread(target=self._produce, name=self.names[0])]
+        for i, func in enumerate(self.stages):
+            self.threads.append(Thread(target=self._transform, name=self.names[i+1],
+                args=(func, self.queues[i], self.queues[i+1])))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while True:
+                item = self.queues[-1].get()
+                if item is END:
+                    break
+                yield item
+        finally:
+            self._stop()
+
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def stats(self):
+        """
+        @return The statistics of the queues from the first to the last (list of dict)
+        """
+        return [queue.stats() for queue in self.queues]
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _produce(self):
+        """
+        Producer thread putting the items of the producer iterable in the first queue
+        """
+        try:
+            for item in self.producer:
+                if self.stopped or self.error:
+                    break
+                self.queues[0].put(item)
+        except BaseException:
+            self.error = self.error or sys.exc_info()
+        self.queues[0].put(END)
+
+    def _transform(self, func, source, target):
+        """
+        Stage thread applying a function to the items of a queue and putting the results in the
+        next one. After an error, items are consumed without being transformed until the end
+        @param func Function transforming an item (function)
+        @param source Input queue (StatQueue)
+        @param target Output queue (StatQueue)
+        """
+        while True:
+            item = source.get()
+            if item is END:
+                break
+            if self.error or self.stopped:
+                continue
+            try:
+                target.put(func(item))
+            except BaseException:
+                self.error = self.error or sys.exc_info()
+        target.put(END)
+
+    def _stop(self):
+        """
+        Stop the producer and consume all the queues until the threads are finished
+        """
+        self.stopped = True
+        while any(thread.is_alive() for thread in self.threads):
+            for queue in self.queues:
+                try:
+                    while True:
+                        queue.get_nowait()
+                except Empty:
+                    pass
+            for thread in self.threads:
+                thread.join(0.01)
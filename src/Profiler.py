@@ -0,0 +1,311 @@
+"""
+@package    Profiler
+@brief      **Wall and CPU time of the stages of a run**
+Methods and functions of the objects of a run are replaced by timed wrappers recording, for each
+stage, the number of calls, the number of items processed (reads or bytes), the wall time and the
+CPU time of the calling thread. Nothing is instrumented if profiling is not requested, so that
+the normal runs are not slowed down. Stages recorded in worker processes are merged in the main
+process, and the report is printed and written in a json file.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from contextlib import contextmanager
+from threading import Lock, local
+from functools import wraps
+from time import time
+import resource
+import json
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+def _thread_usage():
+    """
+    @return The resource usage selector of the calling thread if supported by the system, or else
+    of the whole process (int)
+    """
+    try:
+        # RUSAGE_THREAD of Linux, not exposed by the python 2 resource module
+        resource.getrusage(getattr(resource, "RUSAGE_THREAD", 1))
+        return getattr(resource, "RUSAGE_THREAD", 1)
+    except (ValueError, resource.error):
+        return resource.RUSAGE_SELF
+
+## Resource usage selector used to measure the CPU time of stages
+RUSAGE = _thread_usage()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class Profiler(object):
+    """
+    @class Profiler
+    @brief Record the number of calls, items, wall time and CPU time of named stages. A stage
+    called within itself (for instance pick_raw called by pick_block) is only recorded once. A
+    disabled profiler does not instrument nor record anything.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, enabled=True):
+        """
+        Start the profiler with empty stages
+        @param enabled If False stages are neither instrumented nor recorded (bool)
+        """
+        self.enabled = enabled
+        self.start = time()
+        self.lock = Lock()
+        self.active = local()
+        self.reset()
+
+    def __repr__(self):
+        return "{}\nStages : {}\nSources : {}\n".format(
+            self.__str__(), ", ".join(sorted(self.stages)), len(self.sources))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def is_enabled(self):
+        return self.enabled
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def reset(self):
+        """
+        Forget all the recorded stages, counters, sources and queues
+        """
+        ## Calls, items, wall time and CPU time per stage name
+        self.stages = {}
+        ## Free counters such as the number of rejected slices
+        self.counters = {}
+        ## Number of reads and wall time of each source written
+        self.sources = []
+        ## Depth and waiting statistics of the queues between the steps of the run
+        self.queues = []
+
+    def record(self, name, calls, items, wall, cpu):
+        """
+        Add measures to a stage
+        @param name Name of the stage (string)
+        @param calls Number of calls (int)
+        @param items Number of items processed (int)
+        @param wall Wall time in seconds (float)
+        @param cpu CPU time in seconds (float)
+        """
+        with self.lock:
+            stage = self.stages.setdefault(name, [0, 0, 0.0, 0.0])
+            stage[0] += calls
+            stage[1] += items
+            stage[2] += wall
+            stage[3] += cpu
+
+    def count(self, name, value):
+        """
+        @param name Name of the counter (string)
+        @param value Value added to the counter (int)
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_source(self, name, nread, wall):
+        """
+        @param name Name of the source (string)
+        @param nread Number of reads written from the source (int)
+        @param wall Wall time spent to write the reads (float)
+        """
+        if not self.enabled:
+            return
+        # Consecutive blocks of reads of the same source are added
+        if self.sources and self.sources[-1][0] == name:
+            self.sources[-1][1] += nread
+            self.sources[-1][2] += wall
+        else:
+            self.sources.append([name, nread, wall])
+
+    def add_queues(self, stats):
+        """
+        @param stats Depth and waiting statistics of queues, as returned by StatQueue.stats (list
+        of dict)
+        """
+        if self.enabled:
+            self.queues.extend(stats)
+
+    def bottleneck(self):
+        """
+        Steps connected by queues wait for their input when their producer is slower, and for their
+        output when their consumer is slower. The step waiting the least is the bottleneck
+        @return The name of the slowest step or None if no queue was recorded (string)
+        """
+        waits = {}
+        for queue in self.queues:
+            waits[queue["producer"]] = waits.get(queue["producer"], 0) + queue["put_wait"]
+            waits[queue["consumer"]] = waits.get(queue["consumer"], 0) + queue["get_wait"]
+        return min(waits, key=waits.get) if waits else None
+
+    @contextmanager
+    def stage(self, name, items=1):
+        """
+        Context manager recording the block of code it contains in a stage
+        @param name Name of the stage (string)
+        @param items Number of items processed in the block (int)
+        """
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time(), _cpu_time()
+        yield
+        self.record(name, 1, items, time() - wall, _cpu_time() - cpu)
+
+    def instrument(self, owner, attr, name, count=None, wrap_result=False):
+        """
+        Replace a method or a function by a wrapper recording its calls in a stage
+        @param owner Instance, class or module owning the function (object)
+        @param attr Name of the method or function (string)
+        @param name Name of the stage (string)
+        @param count Function returning the number of items processed from the arguments and the
+        result of a call, by default 1 per call (function)
+        @param wrap_result If True the function returned by the method is also recorded in the
+        stage, for factories of formatting functions (bool)
+        """
+        if not self.enabled:
+            return
+        func = getattr(owner, attr)
+        profiler = self
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            active = profiler.active.__dict__
+            # Nested calls of the same stage are measured by the outer call
+            if active.get(name):
+                return func(*args, **kwargs)
+
+            active[name] = True
+            wall, cpu = time(), _cpu_time()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                active[name] = False
+            profiler.record(name, 1, count(args, result) if count else 1,
+                time() - wall, _cpu_time() - cpu)
+
+            if wrap_result:
+                return profiler.wrap(result, name)
+            return result
+
+        setattr(owner, attr, wrapper)
+
+    def wrap(self, func, name):
+        """
+        @param func Function to record (function)
+        @param name Name of the stage (string)
+        @return A wrapper of func recording its calls in a stage (function)
+        """
+        holder = _Holder(func)
+        self.instrument(holder, "func", name)
+        return holder.func
+
+    def snapshot(self):
+        """
+        @return The stages and counters recorded, to be merged in another profiler (tuple)
+        """
+        with self.lock:
+            return {name: list(stage) for name, stage in self.stages.items()}, dict(self.counters)
+
+    def merge(self, snapshot):
+        """
+        Add the stages and counters recorded by another profiler, for instance in a worker process
+        @param snapshot Stages and counters returned by snapshot (tuple)
+        """
+        stages, counters = snapshot
+        for name, (calls, items, wall, cpu) in stages.items():
+            self.record(name, calls, items, wall, cpu)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def summary(self, **info):
+        """
+        @param info Additional informations on the run included in the summary
+        @return A dictionnary of the total wall and CPU times, and of the measures of stages,
+        counters and sources (dict)
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall = time() - self.start
+
+        stages = {}
+        for name, (calls, items, stage_wall, cpu) in self.stages.items():
+            stages[name] = {"calls": calls, "items": items, "wall": stage_wall, "cpu": cpu,
+                "items_per_sec": items / stage_wall if stage_wall else None}
+
+        sources = [{"source": name, "reads": nread, "wall": source_wall,
+            "reads_per_sec": nread / source_wall if source_wall else None}
+            for name, nread, source_wall in self.sources]
+
+        return dict(info, wall=wall, cpu=usage.ru_utime + usage.ru_stime,
+            cpu_children=children.ru_utime + children.ru_stime,
+            max_rss_kb=usage.ru_maxrss, stages=stages, counters=self.counters, sources=sources,
+            queues=self.queues, bottleneck=self.bottleneck())
+
+    def report(self):
+        """
+        @return A human readable report of the sources and stages (list of string)
+        """
+        lines = ["\tThroughput per source"]
+        for name, nread, wall in self.sources:
+            lines.append("\t\t{:<16}{:>12} reads{:>10.2f} s{:>12.0f} reads/s".format(
+                name, nread, wall, nread / wall if wall else 0))
+
+        lines.append("\t{:<24}{:>10}{:>14}{:>10}{:>10}".format(
+            "Stage", "calls", "items", "wall (s)", "cpu (s)"))
+        for name, (calls, items, wall, cpu) in sorted(self.stages.items(), key=lambda item: -item[1][2]):
+            lines.append("\t{:<24}{:>10}{:>14}{:>10.2f}{:>10.2f}".format(name, calls, items, wall, cpu))
+        for name, value in sorted(self.counters.items()):
+            lines.append("\t{:<24}{:>10}".format(name, value))
+
+        if self.queues:
+            lines.append("\t{:<40}{:>8}{:>8}{:>8}{:>12}{:>12}".format(
+                "Queue", "size", "depth", "% full", "put wait", "get wait"))
+            for queue in self.queues:
+                lines.append("\t{:<40}{:>8}{:>8.1f}{:>8.0f}{:>12.2f}{:>12.2f}".format(queue["queue"],
+                    queue["size"], queue["mean_depth"], 100. * queue["full_puts"] / max(queue["puts"], 1),
+                    queue["put_wait"], queue["get_wait"]))
+            lines.append("\tBottleneck : {}".format(self.bottleneck()))
+        return lines
+
+    def to_json(self, path, **info):
+        """
+        Write the summary in a json file
+        @param path Path of the json file (string)
+        @param info Additional informations on the run included in the summary
+        """
+        with open(path, "w") as handle:
+            json.dump(self.summary(**info), handle, indent=1, sort_keys=True)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class _Holder(object):
+    """
+    @class _Holder
+    @brief Attribute holder allowing to instrument a standalone function
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    def __init__(self, func):
+        self.func = func
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def _cpu_time():
+    """
+    @return The user and system CPU time of the calling thread (or process) in seconds (float)
+    """
+    usage = resource.getrusage(RUSAGE)
+    return usage.ru_utime + usage.ru_stime
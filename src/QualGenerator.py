@@ -18,8 +18,11 @@ thank a gaussian distribution according to pattern standard deviation.
 
 #~~~~~~~PACKAGE IMPORTS~~~~~~~#
 
-# Standard library packages
-from random import gauss
+# Third party packages
+import numpy as np
+
+# Local packages
+from RandomStream import DEFAULT_STREAM
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class QualGenerator(object):
@@ -28,24 +31,31 @@ class QualGenerator(object):
     @brief Generate list of quality PHRED quality values mimicking illumina quality score.
     A pattern is created at object instantiation following a read lenght and a quality range.
     It contains a mean and a standard deviation for all positions in the defined lenght. This mold
-    is used to generate a list of quality scores when calling qual_score() function.
+    is used to generate a list of quality scores when calling qual_score() function, or a batch of
+    quality lists as a numpy matrix when calling qual_scores().
     """
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, length, qual_range):
+    def __init__(self, length, qual_range, rng=None):
         """
         Create the class by asigning a lenght and a pattern of quality mean, sd variation for all
         positions along a given len
         @param length Lenght of quality list that the object will be able to produce (integer)
         @param qual_range Range of quality within a list f predefined values (string)
+        @param rng RandomStream used to generate quality values (default = DEFAULT_STREAM)
         """
+        ## Random stream (RandomStream)
+        self.rng = rng or DEFAULT_STREAM
         ## Lenght of quality list that the object will be able to produce (integer)
         self.length = length
         ## Quality patern template containing mean and sd for each position in the length (list)
         self.qual_pattern = self._quality_pattern(length, qual_range)
+        ## Mean and sd patterns as numpy arrays for batch generation
+        self.mean_array = np.array(self.get_mean_pattern(), dtype=np.int16)
+        self.sd_array = np.array(self.get_sd_pattern(), dtype=np.float64)
 
     def __repr__(self):
         return "{}\n Mean qual pattern :\n{}\nStandard dev pattern :\n{}".format(
@@ -101,6 +111,31 @@ class QualGenerator(object):
 
         return qual_string
 
+    def qual_scores(self, n):
+        """
+        Batch counterpart of qual_score generating n lists of PHRED values at once with numpy.
+        The mean attraction recurrence of qual_score is applied column by column to all lists
+        of the batch, with the same truncation of the gaussian fluctuation and the same borders.
+        @param n Number of quality lists to generate (int)
+        @return A numpy matrix of n lines and length columns of PHRED values (uint8)
+        """
+        # Gaussian fluctuations of all positions truncated toward 0 as int(self.rng.gauss(0, sigma))
+        noise = np.trunc(self.rng.standard_normal((n, self.length)) * self.sd_array).astype(np.int16)
+        scores = np.empty((n, self.length), dtype=np.uint8)
+
+        for i in range(self.length):
+            if i == 0:
+                qual_mean = self.mean_array[0]
+            else:
+                # Factor attracting values toward the pattern mean (floor division as in qual_score)
+                qual_mean = prev + (self.mean_array[i] - prev) // 2
+
+            # Scores outside of Phred quality borders (0 to 40) are truncated
+            prev = np.clip(qual_mean + noise[:, i], 0, 40)
+            scores[:, i] = prev
+
+        return scores
+
     #~~~~~~~PRIVATE METHODS~~~~~~~#
 
     def _valid_score(self, qual_mean, sigma):
@@ -111,7 +146,7 @@ class QualGenerator(object):
         @return A score calculated following a gaussian distribution with exclusion of values >40
         or <0
         """
-        score = qual_mean + int(gauss(0, sigma))
+        score = qual_mean + int(self.rng.gauss(0, sigma))
         # if the score is outside of Phred quality borders (0 to 40).
         # the part coresponding to the gaussian fluctuation will not be
         # took into acount
@@ -0,0 +1,86 @@
+"""
+@package    RandomStream
+@brief      **Seedable random number stream shared by Reference, SlicePicker and QualGenerator**
+A RandomStream wraps a python random generator and a numpy random generator. Both can be reseeded
+from the stream seed and a list of keys (for instance a source name and a block number), so that
+the reads generated after a reseed only depend on the seed and the keys. Blocks of reads can thus
+be generated in any order, by several processes or on several computers, and still give exactly
+the same dataset. This module require the Third party package numpy.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from random import Random, SystemRandom
+from hashlib import md5
+
+# Third party packages
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class RandomStream(object):
+    """
+    @class RandomStream
+    @brief Python and numpy random generators reseedable from a seed and a list of keys. The
+    python methods random, randint, randrange, sample, gauss and betavariate and the numpy methods
+    random_sample, standard_normal, geometric and beta are available as attributes.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, seed=None):
+        """
+        @param seed Seed of the stream. A random seed is drawn if None (int)
+        """
+        self.seed = seed if seed is not None else SystemRandom().randint(1, 2**32-1)
+        self.py = Random()
+        self.np = np.random.RandomState()
+
+        # Shortcuts to the generator methods
+        self.random = self.py.random
+        self.randint = self.py.randint
+        self.randrange = self.py.randrange
+        self.sample = self.py.sample
+        self.gauss = self.py.gauss
+        self.betavariate = self.py.betavariate
+        self.random_sample = self.np.random_sample
+        self.standard_normal = self.np.standard_normal
+        self.geometric = self.np.geometric
+        self.beta = self.np.beta
+
+        self.reseed()
+
+    def __repr__(self):
+        return "{}\nSeed : {}\n".format(self.__str__(), self.seed)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_seed(self):
+        return self.seed
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def reseed(self, *keys):
+        """
+        Reseed both generators with a state derived from the seed of the stream and a list of keys
+        @param keys Any number of int or string identifying a part of the generation
+        """
+        digest = md5(repr((self.seed,) + keys)).digest()
+        self.py.seed(long(digest.encode("hex"), 16))
+        self.np.seed(np.frombuffer(digest, dtype=np.uint32))
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Stream used by objects created without an explicit stream
+DEFAULT_STREAM = RandomStream()
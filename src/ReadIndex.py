@@ -0,0 +1,358 @@
+"""
+@package    ReadIndex
+@brief      **Memory-mappable index of the origin of reads with short numeric ids**
+With short read ids, reads are only identified by their number in the whole dataset and their
+origin (source, sequence, start, end, strand, junction and number of mutations) is written in a
+binary sidecar file of fixed size records, in the same pass as the fastq files. The file starts
+with a header giving the number of the first read, followed by a json table of source and
+sequence names, the table of the junctions of junction sources (sequence, location and strand of
+each side), and the records of all reads in order (R1 then R2 in pair end mode). Once the file is
+memory mapped, the record of a read number is found at a computed offset without parsing, and the
+host and virus positions of a read from a junction are found in its junction table.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from struct import pack, unpack, calcsize
+import json
+import mmap
+
+# Third party packages
+import numpy as np
+
+# Local packages
+from Reference import ReferenceJunctions
+from TruthAlignment import contig_table
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Magic string identifying a read index file
+MAGIC = "ISISRIDX"
+## Version of the read index format
+VERSION = 2
+## Default extension of read index files
+EXTENSION = ".isisidx"
+## File header : magic, version, number of records per read (1 or 2), number of the first read,
+## number of reads, size of the json name table and offset of the first record. The junction tables
+## of junction sources are written between the name table and the records
+HEADER_FMT = "<8sIIQQQQ"
+## Record of a read. Start and end are positions along the sequence (contig index) of a genome
+## source, or along the junction (junction index) of a junction source. Strand is + or -, mate is
+## 0 in single end mode and 1 or 2 in pair end mode
+RECORD_DTYPE = np.dtype([("start", "<i8"), ("end", "<i8"), ("contig", "<i4"), ("junction", "<i4"),
+    ("mutations", "<u2"), ("source", "u1"), ("strand", "S1"), ("mate", "u1"), ("pad", "V3")])
+## Junction of a junction source : sequence index, start position and strand (forward or not) of
+## the slice of each side of the junction
+JUNCTION_DTYPE = np.dtype([("contig", "<i4", (2,)), ("location", "<i8", (2,)), ("forward", "u1", (2,)),
+    ("pad", "V6")])
+## Mate number of the mate names of RawRead objects
+MATES = {None: 0, "R1": 1, "R2": 2}
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadIndexFormatter(object):
+    """
+    @class ReadIndexFormatter
+    @brief Format the origin of RawRead objects in read index records. Sequence indexes are those
+    of the truth alignment header (see TruthAlignment.contig_table).
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, refs, sources, first, nread, pair):
+        """
+        @param refs List of ReferenceGenome containing the sequences of genome sources (list)
+        @param sources List of the sources of reads, ReferenceGenome or ReferenceJunctions (list)
+        @param first Number of the first read written (int)
+        @param nread Number of reads (or read pairs) written (int)
+        @param pair Pair end mode (bool)
+        """
+        self.first = first
+        self.nread = nread
+        self.mates = 2 if pair else 1
+        self.contigs = contig_table(refs)
+        self.contig_ids = {(ref_name, name): i for i, (ref_name, name, length) in enumerate(self.contigs)}
+        self.source_names = [source.getName() for source in sources]
+        self.source_ids = {name: i for i, name in enumerate(self.source_names)}
+        self.junction_sources = [source for source in sources if isinstance(source, ReferenceJunctions)]
+
+    def __repr__(self):
+        return "{}\nReads : {}-{}\nMates : {}\n".format(
+            self.__str__(), self.first, self.first + self.nread - 1, self.mates)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def header(self):
+        """
+        @return The header, the name table and the junction tables of the file, padded to align
+        records (string)
+        """
+        # Junction tables follow the name table, at offsets given from the end of the name table
+        tables = [self._junction_table(source) for source in self.junction_sources]
+        junctions, table_offset = {}, 0
+        for source, table in zip(self.junction_sources, tables):
+            junctions[source.getName()] = {"offset": table_offset, "count": len(table),
+                "half_len": source.half_len}
+            table_offset += table.nbytes
+
+        names = json.dumps({"sources": self.source_names,
+            "contigs": [[name, length] for ref_name, name, length in self.contigs],
+            "junctions": junctions})
+        names_end = calcsize(HEADER_FMT) + len(names)
+        names_end += -names_end % 8
+        offset = names_end + table_offset
+        header = pack(HEADER_FMT, MAGIC, VERSION, self.mates, self.first, self.nread, len(names), offset)
+        return (header + names).ljust(names_end, "\0") + "".join([table.tostring() for table in tables])
+
+    def format_reads(self, reads, first=None, id_len=None):
+        """
+        Format the records of a block of single end reads. Records only depend on their position
+        in the file, first and id_len being accepted for compatibility with TruthAlignment
+        @param reads List of RawRead from the same source
+        @return The records of the block (string)
+        """
+        return self._records(reads)
+
+    def format_pairs(self, pairs, first=None, id_len=None):
+        """
+        Format the records of a block of read pairs, R1 followed by R2
+        @param pairs List of RawRead pairs from the same source
+        @return The records of the block (string)
+        """
+        return self._records([read for pair in pairs for read in pair])
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _records(self, reads):
+        """
+        @param reads List of RawRead from the same source
+        @return The records of the reads (string)
+        """
+        if not reads:
+            return ""
+        source = reads[0].source
+        records = np.zeros(len(reads), dtype=RECORD_DTYPE)
+        records["start"] = [read.start for read in reads]
+        records["end"] = [read.end for read in reads]
+        records["mutations"] = [min(read.mutations, 65535) for read in reads]
+        records["source"] = self.source_ids[source.getName()]
+        records["strand"] = [read.orientation for read in reads]
+        records["mate"] = [MATES[read.mate] for read in reads]
+
+        if isinstance(source, ReferenceJunctions):
+            records["contig"] = -1
+            records["junction"] = [read.refseq.index for read in reads]
+        else:
+            name = source.getName()
+            records["contig"] = [self.contig_ids[(name, read.refseq.id)] for read in reads]
+            records["junction"] = -1
+        return records.tostring()
+
+    def _junction_table(self, source):
+        """
+        @param source Instance of ReferenceJunctions
+        @return The junctions of the source with the sequence indexes of the truth alignment header
+        (numpy array of JUNCTION_DTYPE)
+        """
+        table = np.zeros(source.contig.shape[1], dtype=JUNCTION_DTYPE)
+        for side in (0, 1):
+            contig_ids = np.array([self.contig_ids[(source.refs[side].getName(), name)]
+                for name in source.contig_names[side]], dtype=np.int32)
+            table["contig"][:, side] = contig_ids[source.contig[side]]
+            table["location"][:, side] = source.location[side]
+            table["forward"][:, side] = source.forward[side]
+        return table
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReadIndex(object):
+    """
+    @class ReadIndex
+    @brief Memory map a read index file and find the record of a read number in constant time
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, path):
+        """
+        Memory map the read index file and parse its header
+        @param path Path of a read index file (string)
+        @exception IOError Raise if the file is not a valid read index file
+        """
+        self.path = path
+
+        with open(path, "rb") as handle:
+            ## Read only memory map of the whole file
+            self.mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        size = calcsize(HEADER_FMT)
+        if len(self.mm) < size:
+            raise IOError("{} is not a valid read index file".format(path))
+        magic, version, self.mates, self.first, self.nread, names_len, offset = unpack(HEADER_FMT, self.mm[:size])
+        if magic != MAGIC or version != VERSION:
+            raise IOError("{} is not a valid read index file".format(path))
+
+        names = json.loads(self.mm[size:size+names_len])
+        self.source_names = [str(name) for name in names["sources"]]
+        self.contig_names = [str(name) for name, length in names["contigs"]]
+        self.contig_lens = [length for name, length in names["contigs"]]
+
+        # Junction tables of junction sources, numpy views on the memory map
+        tables_offset = size + names_len + (-(size + names_len) % 8)
+        self.half_lens = {}
+        self.junctions = {}
+        for name, table in names["junctions"].items():
+            self.half_lens[str(name)] = table["half_len"]
+            self.junctions[str(name)] = np.frombuffer(self.mm, dtype=JUNCTION_DTYPE,
+                count=table["count"], offset=tables_offset + table["offset"])
+
+        ## Records of all reads, a numpy view on the memory map
+        self.records = np.frombuffer(self.mm, dtype=RECORD_DTYPE, count=self.nread * self.mates,
+            offset=offset)
+
+    def __repr__(self):
+        return "{}\nFile : {}\nReads : {}-{}\n".format(
+            self.__str__(), self.path, self.first, self.first + self.nread - 1)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __len__(self):
+        return self.nread
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_first(self):
+        return self.first
+
+    def get_source_names(self):
+        return self.source_names
+
+    def get_contig_names(self):
+        return self.contig_names
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def record(self, number, mate=1):
+        """
+        @param number Read number, the numeric id of the read (int)
+        @param mate 1 or 2 in pair end mode, ignored in single end mode (int)
+        @return The record of the read (numpy record)
+        @exception IndexError Raise if the read is not in the file
+        """
+        if not self.first <= number < self.first + self.nread:
+            raise IndexError("Read {} is not in {}".format(number, self.path))
+        return self.records[(number - self.first) * self.mates + (mate - 1 if self.mates == 2 else 0)]
+
+    def origin(self, number, mate=1):
+        """
+        @param number Read number, the numeric id of the read (int)
+        @param mate 1 or 2 in pair end mode, ignored in single end mode (int)
+        @return The origin of the read with the names of its source and sequence (dict). Start and
+        end of reads from a junction are positions along the junction, and their segments give
+        the sequence, start, end and strand of the part of the read on each side of the junction
+        @exception IndexError Raise if the read is not in the file
+        """
+        record = self.record(number, mate)
+        source = self.source_names[record["source"]]
+        contig, junction = int(record["contig"]), int(record["junction"])
+        start, end, strand = int(record["start"]), int(record["end"]), str(record["strand"])
+
+        if junction < 0:
+            segments = [{"contig": self.contig_names[contig], "start": start, "end": end, "strand": strand}]
+        else:
+            segments = self._junction_segments(source, junction, start, end, strand)
+
+        return {"read": number, "mate": int(record["mate"]), "source": source,
+            "contig": self.contig_names[contig] if contig >= 0 else None,
+            "junction": junction if junction >= 0 else None,
+            "start": start, "end": end, "strand": strand,
+            "mutations": int(record["mutations"]), "segments": segments}
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _junction_segments(self, source, index, start, end, strand):
+        """
+        Split a slice of a junction in a segment per side of the junction overlapped
+        @param source Name of the junction source (string)
+        @param index Index of the junction (int)
+        @param start Start position along the junction (int)
+        @param end End position along the junction (int)
+        @param strand Strand of the read along the junction (string)
+        @return A list of segments with their sequence name, start, end and strand (list of dict)
+        """
+        junction = self.junctions[source][index]
+        half_len = self.half_lens[source]
+        segments = []
+        for side, seg_start, seg_end in ((0, start, min(end, half_len)), (1, max(start, half_len), end)):
+            if seg_start >= seg_end:
+                continue
+            seg_start, seg_end = seg_start - side * half_len, seg_end - side * half_len
+            location = int(junction["location"][side])
+            if junction["forward"][side]:
+                seg_start, seg_end, seg_strand = location + seg_start, location + seg_end, strand
+            else:
+                seg_start, seg_end = location + half_len - seg_end, location + half_len - seg_start
+                seg_strand = "-" if strand == "+" else "+"
+            segments.append({"contig": self.contig_names[junction["contig"][side]],
+                "start": seg_start, "end": seg_end, "strand": seg_strand})
+        return segments
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~MAIN FUNCTION~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    import optparse
+    import signal
+    import sys
+
+    # Exit quietly when the output is piped in a program closing it early (for instance head)
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    usage_string = "%prog reads{} number[-number] [...]".format(EXTENSION)
+    optparser = optparse.OptionParser(usage = usage_string)
+    options, args = optparser.parse_args()
+
+    if len(args) < 2:
+        optparser.error("A read index file and at least one read number are required")
+    try:
+        index = ReadIndex(args[0])
+    except IOError as E:
+        sys.stderr.write("{}\n".format(E))
+        exit (1)
+
+    # Start positions are 1-based and end positions inclusive, as in the interval index command.
+    # Reads from a junction have a line per side of the junction overlapped, with positions along
+    # the host or virus sequence. Reads missing from the file are reported on the standard error
+    status = 0
+    print ("read\tmate\tsource\tcontig\tjunction\tstart\tend\tstrand\tmutations")
+    for arg in args[1:]:
+        try:
+            start, end = [int(value) for value in arg.split("-")] if "-" in arg else (int(arg), int(arg))
+        except ValueError:
+            optparser.error("Invalid read number {}".format(arg))
+
+        for number in range(start, end + 1):
+            for mate in range(1, index.mates + 1):
+                try:
+                    d = index.origin(number, mate)
+                except IndexError as E:
+                    sys.stderr.write("{}\n".format(E))
+                    status = 1
+                    break
+                for segment in d["segments"]:
+                    d.update(segment, start=segment["start"] + 1)
+                    print ("{read}\t{mate}\t{source}\t{contig}\t{junction}\t{start}\t{end}\t{strand}\t{mutations}".format(**d))
+
+    exit (status)
@@ -15,12 +15,31 @@ references intended to mimick integration of exogenous DNA sequences in a anothe
 #~~~~~~~PACKAGE IMPORTS~~~~~~~#
 
 # Standard library packages
-from random import random, randint, sample
+from bisect import bisect_right
+from time import time
+from hashlib import md5
+from zipfile import BadZipfile
 import gzip
+import os
+
+# Third party packages
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+import numpy as np
 
 # Local packages
-from Utilities import import_seq
-from SlicePicker import SlicePickerSingle
+from Utilities import import_seq, reverse_complement, file_digest
+from PackedGenome import is_packed, up_to_date, packed_path, import_packed
+from ReferenceCache import ReferenceCache
+from FaidxGenome import import_faidx
+from ValidIndex import load_index, build_index
+from SlicePicker import SlicePickerSingle, RawRead
+from RandomStream import DEFAULT_STREAM
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Number of junction anchors drawn at once in each reference
+JUNCTION_BATCH = 100000
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class Reference(object):
@@ -33,14 +52,16 @@ class Reference(object):
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, name):
+    def __init__(self, name, rng=None):
         """
         Print a status message and initialize the name of the Reference object
         @param name Name of the reference
+        @param rng RandomStream used to sample slices (default = DEFAULT_STREAM)
         """
         print "Initialisation of {}...".format(name)
         # Store object variables
         self.name = name
+        self.rng = rng or DEFAULT_STREAM
 
     def __repr__(self):
         result = "{}\n".format(self.__str__())
@@ -80,7 +101,7 @@ class Reference(object):
         """
 
         # Randomly choose an orientation reverse or forward and sample a slice
-        if randint(0,1):
+        if self.rng.randint(0,1):
             s = self.d[refseq][start:end]
             s.annotations["orientation"] = "+"
         else:
@@ -100,8 +121,49 @@ class Reference(object):
 
         return s
 
+    def getRawSlice(self, refseq, start, end):
+        """
+        Raw counterpart of getSlice returning a RawRead instead of a SeqRecord. The random
+        orientation is drawn the same way so that both methods return the same slice for a given
+        random state.
+        @param refseq Name of the sequence (string)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return A slice of the refseq at the given positions (RawRead object)
+        """
+        # Randomly choose an orientation reverse or forward and sample a slice
+        if self.rng.randint(0,1):
+            s = RawRead(self.fetch(refseq, start, end), self, self.d[refseq], start, end, "+")
+        else:
+            s = RawRead(reverse_complement(self.fetch(refseq, start, end)), self, self.d[refseq],
+                start, end, "-")
+
+        # Increment the sampling counter of the refseq
+        self.d[refseq].annotations["nb_samp"] += 1
+
+        return s
+
+    def fetch(self, refseq, start, end):
+        """
+        Return the sequence string between start and end in a given SeqRecord without creating an
+        intermediate SeqRecord
+        @param refseq Name of the sequence (string)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return The forward sequence of the slice (string)
+        """
+        return str(self.d[refseq].seq[start:end])
+
     #~~~~~~~PUBLIC METHODS~~~~~~~#
 
+    def valid_slices(self, alphabet):
+        """
+        @param alphabet String of allowed DNA bases (string)
+        @return True if all slices returned by slicer for this alphabet contain only allowed bases,
+        so that the validity of the slices does not need to be verified (bool)
+        """
+        return False
+
     def reset_samp_counter(self):
         """
         Initialize or reset counter for each Seqrecord that will be incremented each time
@@ -110,6 +172,21 @@ class Reference(object):
         for name, record in self.d.items():
             record.annotations ["nb_samp"] = 0
 
+    def samp_counts(self):
+        """
+        @return A dictionnary of the non null sampling counters of the sequences (dict)
+        """
+        return {name : record.annotations["nb_samp"] for name, record in self.d.items()
+            if record.annotations["nb_samp"]}
+
+    def add_samp_counts(self, counts):
+        """
+        Add sampling counts, for instance obtained by another process, to the sampling counters
+        @param counts Dictionnary of sampling counts per sequence name (dict)
+        """
+        for name, count in counts.items():
+            self.d[name].annotations["nb_samp"] += count
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 class ReferenceGenome(Reference):
     """
@@ -123,18 +200,47 @@ class ReferenceGenome(Reference):
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, name, fasta_path):
+    def __init__(self, name, fasta_path, rng=None, cache_dir=None, storage="auto"):
         """
         Import reference sequences from fasta file in a dictionnary and create a list
-        of probability to allow a random sampling in SeqRecords proportionally to their size
+        of probability to allow a random sampling in SeqRecords proportionally to their size.
+        If the path is a packed genome file or if an up to date packed genome file compiled from
+        the fasta file exists, sequences are memory mapped instead of being parsed. If a cache
+        directory is given, the fasta file is compiled once in the cache and the packed genome is
+        memory mapped at the next runs. With the faidx storage, sequences are not loaded but read on
+        demand from the plain or BGZF compressed fasta file through a faidx index.
         @param name Name of the reference (string)
-        @param fasta_path Path of the fasta or fasta.gz file containing sequences (string)
+        @param fasta_path Path of the fasta, fasta.gz or packed genome file containing sequences (string)
+        @param rng RandomStream used to sample slices (default = DEFAULT_STREAM)
+        @param cache_dir Path of a reference cache directory (string)
+        @param storage auto or faidx (string)
         """
         # Use the super class init method
-        super(self.__class__, self).__init__(name)
+        super(self.__class__, self).__init__(name, rng)
+        self.fasta_path = fasta_path
+        # Hash of the content of the fasta file, computed on demand
+        self.digest = None
+
+        # Records read on demand from an indexed fasta file, or created from a packed genome file
+        # if available, or else bioPython records created from fasta file
+        if storage == "faidx":
+            records = import_faidx(fasta_path)
+        elif is_packed(fasta_path):
+            records = import_packed(fasta_path)
+        elif up_to_date(fasta_path, packed_path(fasta_path)):
+            records = import_packed(packed_path(fasta_path))
+        elif cache_dir:
+            cached_path, self.digest = ReferenceCache(cache_dir).get(fasta_path)
+            records = import_packed(cached_path)
+        else:
+            records = import_seq(fasta_path, "list", "fasta")
 
-        # Dictionnary of bioPython record created from fasta file
-        self.d = import_seq(fasta_path, "dict", "fasta")
+        # Dictionnary of records indexed by name, and names in the order of the fasta file used to
+        # declare sequences in the truth alignment and in the read and interval indexes
+        self.d = {record.id : record for record in records}
+        self.fasta_names = [record.id for record in records]
+        if len(self.d) != len(records):
+            raise ValueError("Duplicate sequence names in {}".format(fasta_path))
 
         # Initialize a counter for each reference that will be
         # incremented each time _random_slice choose this reference
@@ -144,22 +250,80 @@ class ReferenceGenome(Reference):
         # calculated from to their respective size.
         self.proba_list = self._calculate_proba()
 
+        # Names, lenghts and cumulative probabilities of sequences in the order of proba_list
+        # allowing to pick a sequence by bisection or by batches with numpy
+        self.refseq_names = [name for name, freq in self.proba_list]
+        self.refseq_lens = np.array([len(self.d[name]) for name in self.refseq_names], dtype=np.int64)
+        self.cum_proba = [freq for name, freq in self.proba_list]
+        self.cum_array = np.array(self.cum_proba)
+
+        # Indexes of valid windows for each window length and alphabet, created on demand
+        self.index_dict = {}
 
     #~~~~~~~ACCESS METHODS~~~~~~~#
 
     def getProba(self):
         return self.proba_list
 
+    def getFastaPath(self):
+        return self.fasta_path
+
+    def getDigest(self):
+        """
+        @return The md5 hash of the content of the fasta file, computed at the first call (string)
+        """
+        if not self.digest:
+            self.digest = file_digest(self.fasta_path)
+        return self.digest
+
     #~~~~~~~PUBLIC METHODS~~~~~~~#
 
-    def slicer (self, size):
+    def valid_slices(self, alphabet):
+        """
+        Slices asked with an alphabet are drawn in an index of valid windows
+        @param alphabet String of allowed DNA bases (string)
+        @return True (bool)
+        """
+        return True
+
+    def valid_index(self, window, alphabet):
+        """
+        Return the index of windows containing only allowed bases. The index is loaded from the
+        disk cache next to the fasta file if up to date, or else created and cached.
+        @param window Length of the windows (int)
+        @param alphabet String of allowed DNA bases (string)
+        @return A ValidIndex object
+        @exception Exception Generic exception raise if no valid window exists in the reference
+        """
+        key = (window, alphabet)
+        if key not in self.index_dict:
+            names = sorted(self.d)
+            index = load_index(self.fasta_path, window, alphabet, names)
+            if not index:
+                index = build_index(self.fasta_path, [self.d[name] for name in names], window,
+                    alphabet, names)
+            if not index.get_total():
+                raise Exception("ERROR. No window of {} bases containing only allowed bases was\n\
+                found in {}. Please review repetition and ambiguity parameters".format(window, self.name))
+            self.index_dict[key] = index
+        return self.index_dict[key]
+
+    def slicer (self, size, raw=False, alphabet=None, window=None):
         """
         Generate a random candidate slice in a random Seqrecord from the dictionnary. If not
         SeqRecord of a sufficient size was found after 100 tries, a generic Exception will be
-        raised
+        raised. If an alphabet is given, the slice is drawn among the slices which windows of
+        length window at both ends contain only allowed bases.
         @param size Size of the slice to sample (int)
-        @return Random slice of a valid size (SeqRecord object)
+        @param raw If True a RawRead is returned instead of a SeqRecord (bool)
+        @param alphabet String of allowed DNA bases (string)
+        @param window Size of the windows at both ends of the slice to validate, by default the
+        whole slice (int)
+        @return Random slice of a valid size (SeqRecord or RawRead object)
         """
+        if alphabet:
+            return self._valid_slice(size, raw, alphabet, window or size)
+
         # Guard condition
         for count in range(100):
             # Pick a random sequence in dictionnary
@@ -167,7 +331,84 @@ class ReferenceGenome(Reference):
 
             # If the size is valid return a slice
             if size <= len(self.d[refseq]):
-                return self._random_slice(refseq, size)
+                return self._random_slice(refseq, size, raw)
+
+        # if no valid size was found
+        raise Exception("ERROR. Unable to find a slice of a valid length after 100 tries.\n\
+        Please review the size of your references or the size of the reads.")
+
+    def slicer_block (self, sizes, alphabet=None, window=None):
+        """
+        Batch counterpart of slicer returning RawRead slices. Sequences and start positions of all
+        slices are drawn at once with random_refseqs or random_windows if an alphabet is given.
+        @param sizes Sizes of the slices to sample (list or numpy array of int)
+        @param alphabet String of allowed DNA bases (string)
+        @param window Size of the windows at both ends of the slices to validate, by default the
+        whole slices (int)
+        @return A list of random RawRead slices of the requested sizes
+        """
+        if alphabet:
+            names, starts = self.random_windows(sizes, alphabet, window)
+        else:
+            indices, starts = self.random_refseqs(len(sizes), sizes)
+            names = [self.refseq_names[i] for i in indices.tolist()]
+        return [self.getRawSlice(name, start, start + size)
+            for name, start, size in zip(names, starts.tolist(), list(sizes))]
+
+    def random_windows (self, sizes, alphabet, window=None):
+        """
+        Draw uniformly start positions of slices which windows at both ends contain only allowed
+        bases.
+        @param sizes Sizes of the slices (list or numpy array of int)
+        @param alphabet String of allowed DNA bases (string)
+        @param window Size of the windows at both ends of the slices, by default the smallest
+        slice size (int)
+        @return A list of sequence names and a numpy array of start positions
+        """
+        index, seqs, starts = self._draw_windows(sizes, alphabet, window)
+        return [index.names[i] for i in seqs.tolist()], starts
+
+    def random_anchors (self, n, size, alphabet):
+        """
+        Draw the coordinates of n slices containing only allowed bases in a random orientation,
+        without extracting their sequences nor incrementing the sampling counters.
+        @param n Number of slices to draw (int)
+        @param size Size of the slices (int)
+        @param alphabet String of allowed DNA bases (string)
+        @return The list of sequence names in the order of the index of valid windows, and numpy
+        arrays of sequence indices in this list, start positions and forward orientations
+        """
+        index, seqs, starts = self._draw_windows(np.repeat(size, n), alphabet, size)
+        forward = self.rng.random_sample(n) < 0.5
+        return index.names, seqs, starts, forward
+
+    def random_refseqs (self, n, size):
+        """
+        Draw n random sequences proportionally to their size and a random start position in each
+        of them, as _random_refseq and _random_slice would do for each slice. Draws falling in a
+        sequence shorter than the slice are drawn again, up to 100 times.
+        @param n Number of positions to draw (int)
+        @param size Size of the slices, same for all or one per slice (int or array of int)
+        @return A numpy array of sequence indices in refseq_names and a numpy array of start
+        positions
+        """
+        sizes = np.zeros(n, dtype=np.int64) + size
+        indices = np.zeros(n, dtype=np.int64)
+        todo = np.arange(n)
+
+        # Guard condition
+        for count in range(100):
+            # Pick sequences by bisection in the cumulative probability list
+            picked = np.searchsorted(self.cum_array, self.rng.random_sample(len(todo)), side="right")
+            indices[todo] = np.minimum(picked, len(self.cum_array)-1)
+
+            # Draw again slices longer than their sequence
+            todo = todo[self.refseq_lens[indices[todo]] < sizes[todo]]
+            if not len(todo):
+                # Uniform start positions in the valid range of each sequence
+                span = self.refseq_lens[indices] - sizes + 1
+                starts = (self.rng.random_sample(n) * span).astype(np.int64)
+                return indices, starts
 
         # if no valid size was found
         raise Exception("ERROR. Unable to find a slice of a valid length after 100 tries.\n\
@@ -218,244 +459,677 @@ class ReferenceGenome(Reference):
 
         """
         # Define a pseudo-random decimal frequency
-        rand_freq = random()
+        rand_freq = self.rng.random()
 
-        # Attibute this frequency to a sequence from d based on proba_list
-        for name, freq  in self.proba_list:
-            if freq > rand_freq :
-                return name
+        # Attibute this frequency to the first sequence from proba_list with a greater cumulative
+        # probability, found by bisection
+        i = bisect_right(self.cum_proba, rand_freq)
+        return self.refseq_names[min(i, len(self.refseq_names)-1)]
 
-    def _random_slice(self, refseq, size):
+    def _random_slice(self, refseq, size, raw=False):
         """
         Return a random slice in a given SeqRecord reference sequence in a random orientation.
         The SeqRecord annotations dict is updated to contain relevant informations.
         @param refseq Name of the sequence (string)
         @param size Size of the slice to sample (int)
-        @return A random slice in refseq (SeqRecord object)
+        @param raw If True a RawRead is returned instead of a SeqRecord (bool)
+        @return A random slice in refseq (SeqRecord or RawRead object)
         """
         # Randomly choose the slice start position
-        start = randint(0, len(self.d[refseq])-size)
+        start = self.rng.randint(0, len(self.d[refseq])-size)
         end = start+size
 
+        if raw:
+            return self.getRawSlice(refseq, start, end)
         return self.getSlice(refseq, start, end)
 
+    def _draw_windows(self, sizes, alphabet, window=None):
+        """
+        Draw start positions of slices in the index of valid windows. Slices extending beyond
+        their sequence or ending with an invalid window are drawn again, up to 100 times.
+        @param sizes Sizes of the slices (list or numpy array of int)
+        @param alphabet String of allowed DNA bases (string)
+        @param window Size of the windows at both ends of the slices, by default the smallest
+        slice size (int)
+        @return The ValidIndex and numpy arrays of sequence indices and start positions
+        @exception Exception Generic exception raise if slices are still invalid after 100 tries
+        """
+        sizes = np.asarray(sizes, dtype=np.int64)
+        index = self.valid_index(window or int(sizes.min()), alphabet)
+        seqs = np.zeros(len(sizes), dtype=np.int64)
+        starts = np.zeros(len(sizes), dtype=np.int64)
+        todo = np.arange(len(sizes))
+
+        # Guard condition
+        for count in range(100):
+            seqs[todo], starts[todo], ok = index.draw(self.rng.random_sample(len(todo)), sizes[todo])
+            todo = todo[~ok]
+            if not len(todo):
+                return index, seqs, starts
+
+        # if no valid slice was found
+        raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
+        Please review repetition and ambiguity parameters and verify your reference sequences")
+
+    def _valid_slice(self, size, raw, alphabet, window):
+        """
+        Return a random slice which windows at both ends contain only allowed bases, in a random
+        orientation. If no valid slice was found after 100 tries, a generic Exception will be raised
+        @param size Size of the slice to sample (int)
+        @param raw If True a RawRead is returned instead of a SeqRecord (bool)
+        @param alphabet String of allowed DNA bases (string)
+        @param window Size of the windows at both ends of the slice (int)
+        @return A random valid slice (SeqRecord or RawRead object)
+        """
+        index = self.valid_index(window, alphabet)
+
+        # Guard condition
+        for count in range(100):
+            seq, start, ok = index.draw(self.rng.random(), size)
+            if ok:
+                refseq = index.names[seq]
+                if raw:
+                    return self.getRawSlice(refseq, int(start), int(start) + size)
+                return self.getSlice(refseq, int(start), int(start) + size)
+
+        # if no valid slice was found
+        raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
+        Please review repetition and ambiguity parameters and verify your reference sequences")
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+class Junction(object):
+    """
+    @class Junction
+    @brief Lightweight handle on a junction of a ReferenceJunctions pool used in place of a
+    SeqRecord to identify the junction of a read. The junction sequence is not stored but assembled
+    on demand by the pool from the coordinates of the junction.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    __slots__ = ("pool", "index")
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, pool, index):
+        """
+        @param pool ReferenceJunctions object containing the junction
+        @param index Index of the junction in the pool (int)
+        """
+        self.pool = pool
+        self.index = index
+
+    def __repr__(self):
+        return "{}\nId : {}\nLenght : {}\n".format(self.__str__(), self.id, len(self))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    def __len__(self):
+        return 2 * self.pool.half_len
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    @property
+    def id(self):
+        return self.pool.junction_id(self.index)
+
+    @property
+    def seq(self):
+        return Seq(self.pool.fetch(self.index, 0, len(self)))
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
 class ReferenceJunctions(Reference):
     """
     @class ReferenceJunctions
-    @brief Create a dictionnary of sequences by merging 2 SeqRecord slices from 2 Reference object
-    for n junctions. The class provide a method to get a random seqrecord slice from one of the
-    SeqRecord in the junction dictionnary. These slices overlap the middle of the chosen junction
-    with a possible asymmetry given by the min_chimeric parameter.
+    @brief Create a pool of n junctions by merging 2 slices from 2 Reference objects. Only the
+    coordinates of the slices (sequence, start and orientation in each reference) are stored in
+    compact numpy arrays, and the junction sequences are assembled from the parent references only
+    when a slice is sampled. The class provide a method to get a random slice from one of the
+    junctions of the pool. These slices overlap the middle of the chosen junction with a possible
+    asymmetry given by the min_chimeric parameter. Junctions are chosen uniformly or according to
+    weights in constant time, one by one or by batches.
     """
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, name, min_chimeric, size, njun, ref1, ref2, repeats, ambiguous):
+    def __init__(self, name, min_chimeric, size, njun, ref1, ref2, repeats, ambiguous, rng=None,
+                 catalogue=None, weights=None):
         """
-        Create a dictionnary of junctions by merging SeqRecords from 2 Reference objects and
-        initialize other class parameters.
+        Create a pool of junctions by merging slices from 2 Reference objects and initialize other
+        class parameters. If a catalogue file is given, the junctions are loaded from it when it
+        was created from the same references and parameters, or else created and saved in it.
         @param name Name of the reference (string)
         @param min_chimeric Minimal number of pb from one of the 2 references in a read or read
         pair overlaping a junction (int)
         @param size Size of the slice to sample in each reference to constitute a junction
         @param njun Number of junctions to generate
-        @param ref1 Reference to the first source Reference
-        @param ref2 Reference to the second source Reference
+        @param ref1 Reference to the first source ReferenceGenome
+        @param ref2 Reference to the second source ReferenceGenome
         @param repeats Allow lowercase characters (repeats) in the junctions
         @param ambiguous Allow Ambiguous DNA bases in the junctions
+        @param rng RandomStream used to create junctions and sample slices (default = DEFAULT_STREAM)
+        @param catalogue Path of a junction catalogue file (string)
+        @param weights Relative sampling weight of each junction, uniform if None (list or numpy
+        array of float)
         """
         # Use the super class init method
-        super(self.__class__, self).__init__(name)
+        super(self.__class__, self).__init__(name, rng)
 
         # Store object variables
         self.min_chimeric = min_chimeric
         self.half_len = size
-
-        # Initialise junction dictionnary
-        self.d = self._create_junctions_dict(size, njun, ref1, ref2, repeats, ambiguous)
+        self.njun = njun
+        self.refs = (ref1, ref2)
+        # Number of digits in njun to generate junctions ids
+        self.id_len = len(str(njun))
+        # Bases allowed in junctions
+        self.alphabet = SlicePickerSingle(size, repeats, ambiguous, rng=self.rng).get_alphabet()
+
+        # Initialise the coordinate arrays of the junction pool
+        key = self.catalogue_key() if catalogue else None
+        if not (catalogue and self.load_catalogue(catalogue, key)):
+            self._create_junctions(size, njun, ref1, ref2)
+            if catalogue:
+                self.save_catalogue(catalogue, key)
         # Reset the sampling counter of references
         ref1.reset_samp_counter()
         ref2.reset_samp_counter()
 
-        # Initialize a counter for each reference that will be
-        # incremented each time _random_slice choose this reference
+        # Alias table of the junction weights
+        self.set_weights(weights)
+
+        # Initialize a counter for each junction that will be
+        # incremented each time _random_slice choose this junction
         self.reset_samp_counter()
 
+    def __repr__(self):
+        return "{}\nJunctions : {}\nLenght : {}\nSources : {} / {}\n".format(self.__str__(),
+            self.njun, 2 * self.half_len, self.refs[0].getName(), self.refs[1].getName())
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
 
-###    PUBLIC METHODS    ####
+    def get(self, varkey):
+        """
+        @param varkey Id or index of a junction of the pool (string or int)
+        @return A handle on the junction (Junction object)
+        """
+        if isinstance(varkey, Junction):
+            return varkey
+        if isinstance(varkey, basestring):
+            varkey = int(varkey.rpartition("_")[2])
+        return Junction(self, int(varkey))
 
-    def slicer (self, size):
+    def getDict(self):
         """
-        Generate a random candidate slice ovelaping a junction in a random Seqrecord from the
-        dictionnary. If the require size is too short or too long to be sample, a generic
-        Exception will be raised
+        @return A dictionnary of handles on all the junctions of the pool indexed by id. The
+        dictionnary is created at each call.
+        """
+        return {self.junction_id(i) : Junction(self, i) for i in xrange(self.njun)}
+
+    def getLenDict(self):
+        return self.njun
+
+    def get_weights(self):
+        """
+        @return The sampling probability of each junction or None if uniform (numpy array)
+        """
+        if self.alias is None:
+            return None
+        # Each junction receives its own share of its column and the complement of the columns aliased to it
+        probs = self.alias_prob.copy()
+        np.add.at(probs, self.alias, 1 - self.alias_prob)
+        return probs / self.njun
+
+    def junction_id(self, index):
+        """
+        @param index Index of a junction of the pool (int)
+        @return The id of the junction (string)
+        """
+        return "Junction_{0:0{1}}".format(index, self.id_len)
+
+    def getSlice(self, refseq, start, end):
+        """
+        Return a slice from start to end in a given junction in a random orientation.
+        The SeqRecord annotations dict is updated to contain relevant informations.
+        @param refseq Id, index or handle of the junction (string, int or Junction object)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return A slice of the junction at the given positions (SeqRecord object)
+        """
+        junction = self.get(refseq)
+
+        # Randomly choose an orientation reverse or forward and sample a slice
+        if self.rng.randint(0,1):
+            s = SeqRecord(Seq(self.fetch(junction, start, end)))
+            s.annotations["orientation"] = "+"
+        else:
+            s = SeqRecord(Seq(self.fetch(junction, start, end))).reverse_complement()
+            s.annotations["orientation"] = "-"
+
+        # Add informations to the annotations dictionnary
+        s.annotations["refseq"] = junction
+        s.annotations["location"] = [start, end]
+        s.annotations["source"] = self
+
+        # Undefine description, id and name
+        s.name = s.description = s.id = ""
+
+        # Increment the sampling counter of the junction
+        self.nb_samp[junction.index] += 1
+
+        return s
+
+    def getRawSlice(self, refseq, start, end):
+        """
+        Raw counterpart of getSlice returning a RawRead instead of a SeqRecord
+        @param refseq Id, index or handle of the junction (string, int or Junction object)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return A slice of the junction at the given positions (RawRead object)
+        """
+        junction = self.get(refseq)
+
+        # Increment the sampling counter of the junction
+        self.nb_samp[junction.index] += 1
+
+        # Randomly choose an orientation reverse or forward and sample a slice
+        return self._raw_slice(junction, start, end, self.rng.randint(0,1))
+
+    def fetch(self, refseq, start, end):
+        """
+        Assemble the sequence between start and end of a junction from the parent references
+        @param refseq Id, index or handle of the junction (string, int or Junction object)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @return The forward sequence of the slice (string)
+        """
+        index = self.get(refseq).index
+        seq = ""
+        # Part of the slice in the first reference then in the second one
+        if start < self.half_len:
+            seq += self._fetch_side(index, 0, start, min(end, self.half_len))
+        if end > self.half_len:
+            seq += self._fetch_side(index, 1, max(start - self.half_len, 0), end - self.half_len)
+        return seq
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def set_weights(self, weights=None):
+        """
+        Define the relative sampling weights of the junctions. Junctions are then drawn in constant
+        time with the alias method : a column is chosen uniformly, then either the junction of the
+        column or its alias according to the probability of the column.
+        @param weights Relative sampling weight of each junction, uniform if None (list or numpy
+        array of float)
+        @exception ValueError Raise if the weights are not valid
+        """
+        if weights is None:
+            self.alias_prob = self.alias = None
+            return
+
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) != self.njun or (weights < 0).any() or not weights.sum() > 0:
+            raise ValueError("{} positive weights with a non null sum are required".format(self.njun))
+        self.alias_prob, self.alias = self._alias_table(weights)
+
+    def random_junctions(self, n):
+        """
+        Draw n junction indices at once according to the junction weights
+        @param n Number of junctions to draw (int)
+        @return A numpy array of junction indices
+        """
+        indices = (self.rng.random_sample(n) * self.njun).astype(np.int64)
+        if self.alias is None:
+            return indices
+        aliased = self.rng.random_sample(n) >= self.alias_prob[indices]
+        indices[aliased] = self.alias[indices[aliased]]
+        return indices
+
+    def valid_slices(self, alphabet):
+        """
+        Junctions are made of slices containing only bases of the junction alphabet, and so are
+        all their slices
+        @param alphabet String of allowed DNA bases (string)
+        @return True if the junction alphabet is included in alphabet (bool)
+        """
+        return set(self.alphabet).issubset(alphabet)
+
+    def reset_samp_counter(self):
+        """
+        Initialize or reset the sampling counter of each junction
+        """
+        self.nb_samp = np.zeros(self.njun, dtype=np.int64)
+
+    def samp_counts(self):
+        """
+        @return A dictionnary of the non null sampling counters indexed by junction index (dict)
+        """
+        return {int(i) : int(self.nb_samp[i]) for i in np.flatnonzero(self.nb_samp)}
+
+    def add_samp_counts(self, counts):
+        """
+        Add sampling counts, for instance obtained by another process, to the sampling counters
+        @param counts Dictionnary of sampling counts per junction index or id (dict)
+        """
+        for varkey, count in counts.items():
+            self.nb_samp[self.get(varkey).index] += count
+
+    def catalogue_key(self):
+        """
+        Identify the junction pool by the content of the fasta files of the source references and
+        the parameters of the pool. The seed is not included so that a catalogue can be reused
+        whatever the seed of the run.
+        @return A md5 hash (string)
+        """
+        sources = [(ref.getName(), ref.getDigest()) for ref in self.refs]
+        return md5(repr((self.name, sources, self.half_len, self.njun,
+            "".join(sorted(self.alphabet))))).hexdigest()
+
+    def save_catalogue(self, path, key=None):
+        """
+        Save the coordinates of the junctions in a numpy npz catalogue file. The file is written
+        under a temporary name and renamed so that concurrent runs never read an incomplete file
+        @param path Path of the catalogue file (string)
+        @param key Hash of the pool, calculated with catalogue_key if not given (string)
+        """
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp, "wb") as handle:
+                np.savez(handle, key=key or self.catalogue_key(), names1=np.array(self.contig_names[0]),
+                    names2=np.array(self.contig_names[1]), contig=self.contig,
+                    location=self.location, forward=self.forward)
+            os.rename(tmp, path)
+            print("\tJunctions saved in {}".format(path))
+        except (IOError, OSError) as E:
+            print("\tUnable to save the junction catalogue {} : {}".format(path, E))
+
+    def load_catalogue(self, path, key=None):
+        """
+        Load the coordinates of the junctions from a catalogue file if it was created from the
+        same references and parameters
+        @param path Path of the catalogue file (string)
+        @param key Hash of the pool, calculated with catalogue_key if not given (string)
+        @return True if the junctions were loaded (bool)
+        """
+        try:
+            data = np.load(path)
+            if str(data["key"]) != (key or self.catalogue_key()):
+                print("\tCatalogue {} was created from other references or parameters".format(path))
+                return False
+            self.contig_names = (data["names1"].tolist(), data["names2"].tolist())
+            self.contig = data["contig"]
+            self.location = data["location"]
+            self.forward = data["forward"]
+        except (IOError, OSError, KeyError, ValueError, BadZipfile):
+            return False
+
+        print("\tJunctions loaded from {}".format(path))
+        return True
+
+    def slicer (self, size, raw=False, alphabet=None, window=None):
+        """
+        Generate a random candidate slice ovelaping a junction in a random junction from the
+        pool. If the require size is too short or too long to be sample, a generic Exception
+        will be raised
         @param size Size of the slice to sample (int)
-        @return Random slice of a valid size (SeqRecord object)
+        @param raw If True a RawRead is returned instead of a SeqRecord (bool)
+        @param alphabet Unused, for compatibility with ReferenceGenome.slicer
+        @param window Unused, for compatibility with ReferenceGenome.slicer
+        @return Random slice of a valid size (SeqRecord or RawRead object)
 
         Generate a slice overlapping a junction and return it
         """
-        # Guard conditions
-        if  size < 2 * self.min_chimeric:
-            raise Exception ("ERROR. The size of the slice is too short to define a fragment\n\
-            with the require minimal number of chimeric bases in each reference sequence.\n\
-            Review your size of min chimeric base or read length")
-        if size > self.half_len:
-            raise Exception ("ERROR. The size of the slice is longer than the reference.\n\
-            Review your maximal sonication size or the size of junctions")
+        self._check_size (size, size)
 
-        # Pick a random reference junction and return a slice of it
-        refseq = sample(self.d, 1)[0]
-        return self._random_slice (refseq, size)
+        # Pick a random junction and return a slice of it
+        return self._random_slice (self._random_junction(), size, raw)
+
+    def slicer_block (self, sizes, alphabet=None, window=None):
+        """
+        Batch counterpart of slicer returning RawRead slices. Junctions, start positions and
+        orientations of all slices are drawn at once.
+        @param sizes Sizes of the slices to sample (list or numpy array of int)
+        @param alphabet Unused, for compatibility with ReferenceGenome.slicer_block
+        @param window Unused, for compatibility with ReferenceGenome.slicer_block
+        @return A list of random RawRead slices overlapping junctions
+        """
+        n = len(sizes)
+        if not n:
+            return []
+        sizes = np.asarray(sizes, dtype=np.int64)
+        self._check_size (sizes.min(), sizes.max())
+
+        # Start positions are drawn in the autorized area of each slice as in _random_slice
+        indices = self.random_junctions(n)
+        low = self.half_len + self.min_chimeric - sizes
+        starts = low + (self.rng.random_sample(n) * (self.half_len - self.min_chimeric - low + 1)).astype(np.int64)
+        forward = self.rng.random_sample(n) < 0.5
+
+        self.nb_samp += np.bincount(indices, minlength=self.njun)
+        return [self._raw_slice(Junction(self, index), start, start + size, fwd)
+            for index, start, size, fwd in zip(indices.tolist(), starts.tolist(), sizes.tolist(), forward.tolist())]
 
     def samp_report (self):
         """
         Create a simple list report containing the name, origin and number of time a slice was
-        sample into each SeqRecord in the dictionnary.
-        @return A sampling report for each SeqRecord as a list (list)
+        sample into each junction of the pool.
+        @return A sampling report for each junction as a list (list)
         """
         # Add column header
         samp_list = [["junction_id", "ref1_source", "ref1_chr", "ref1_loc",
                 "ref1_orientation", "ref2_source", "ref2_chr", "ref2_loc",
                 "ref2_orientation", "nb_samp"]]
 
-        # Create a sorted list of refseq
-        ref_list = self.d.keys()
-        ref_list.sort()
-
-        # Add values for each reference
-        for ref in ref_list:
-            samp_list.append([
-                self.d[ref].id,
-                self.d[ref].annotations["ref1_source"].getName(),
-                self.d[ref].annotations["ref1_refseq"].id,
-                self.d[ref].annotations["ref1_location"],
-                self.d[ref].annotations["ref1_orientation"],
-                self.d[ref].annotations["ref2_source"].getName(),
-                self.d[ref].annotations["ref2_refseq"].id,
-                self.d[ref].annotations["ref2_location"],
-                self.d[ref].annotations["ref2_orientation"],
-                self.d[ref].annotations["nb_samp"]])
+        # Add values for each junction in the order of ids
+        for i in xrange(self.njun):
+            line = [self.junction_id(i)]
+            for side in (0, 1):
+                start = int(self.location[side, i])
+                line += [
+                    self.refs[side].getName(),
+                    self.contig_names[side][self.contig[side, i]],
+                    [start, start + self.half_len],
+                    "+" if self.forward[side, i] else "-"]
+            line.append(int(self.nb_samp[i]))
+            samp_list.append(line)
 
         return samp_list
 
     def origin_coord (self, refseq, start, end):
         """
         Return a string describing the the origin of a sequence correponding to a slice of a
-        SeqRecord junction in the dictionnary.
-        @param refseq Name of the sequence (string)
+        junction in the pool.
+        @param refseq Id, index or handle of the junction (string, int or Junction object)
         @param start Start position of the slice (int)
         @param end End position of the slice (int)
         @return A string detailing the origin of a sequence (string)
         """
+        index = self.get(refseq).index
+
         # If the give coord overlap only the left reference of a junction
         if end < self.half_len:
             return ("{}-{}={}".format(
             1, end-start,
-            self._coord_to_str(refseq, "ref1", start, end+1)))
+            self._coord_to_str(index, 0, start, end+1)))
 
         # If the give coord overlap only the right reference of a junction
         elif start >= self.half_len:
             return ("{}-{}={}".format(
             1, end-start,
-            self._coord_to_str(refseq, "ref2", start-self.half_len, end-self.half_len+1)))
+            self._coord_to_str(index, 1, start-self.half_len, end-self.half_len+1)))
 
         # If the give coord overlap both references of a junction
         else :
             return ("{}-{}={}|{}-{}={}".format(
             1,self.half_len-start,
-            self._coord_to_str(refseq, "ref1", start, self.half_len),
+            self._coord_to_str(index, 0, start, self.half_len),
             self.half_len-start+1, end-start,
-            self._coord_to_str(refseq, "ref2", 0, end-self.half_len+1)))
+            self._coord_to_str(index, 1, 0, end-self.half_len+1)))
 
     #~~~~~~~PRIVATE METHODS~~~~~~~#
 
-    def _create_junctions_dict (self, size, njun, ref1, ref2, repeats, ambiguous):
+    def _create_junctions (self, size, njun, ref1, ref2):
         """
-        Fill a dictionary with junctions between sequences from ref1 and ref2. An annotation
-        dictionnary associated with each junction allows to retrieve easily its origin.
+        Draw the coordinates of junctions between sequences from ref1 and ref2. For each side of
+        the junctions (0 for ref1 and 1 for ref2), the index of the sequence in contig_names, the
+        start position of the slice and its orientation are stored in arrays of njun values.
+        Anchors are drawn by batches of JUNCTION_BATCH among the valid windows of each reference
+        so that no candidate has to be verified.
         @param size Size of the slice to sample in each reference to constitute a junction
         @param njun Number of junctions to generate
-        @param ref1 Reference to the first source Reference
-        @param ref2 Reference to the second source Reference
-        @param repeats Allow lowercase characters (repeats) in the junctions
-        @param ambiguous Allow Ambiguous DNA bases in the junctions
-        @return A dictionnary containing junctions as SeqRecord objects
+        @param ref1 Reference to the first source ReferenceGenome
+        @param ref2 Reference to the second source ReferenceGenome
         """
         print("\tCreating junctions between {} and {}".format(ref1.getName(), ref2.getName()))
+        start_time = time()
+
+        # Junctions only depend on the seed of the random stream and the name of the reference
+        self.rng.reseed("junctions", self.name)
+
+        self.contig_names = ([], [])
+        self.contig = np.zeros((2, njun), dtype=np.int32)
+        self.location = np.zeros((2, njun), dtype=np.int64)
+        self.forward = np.zeros((2, njun), dtype=bool)
+
+        # Draw the anchors of junctions in each reference by batches among valid windows
+        for first in xrange(0, njun, JUNCTION_BATCH):
+            last = min(first + JUNCTION_BATCH, njun)
+            for side, ref in enumerate(self.refs):
+                names, seqs, starts, forward = ref.random_anchors(last - first, size, self.alphabet)
+                self.contig_names[side][:] = names
+                self.contig[side, first:last] = seqs
+                self.location[side, first:last] = starts
+                self.forward[side, first:last] = forward
+
+            if njun > JUNCTION_BATCH:
+                print("\t\t{}/{} junctions".format(last, njun))
+
+        elapsed = time() - start_time
+        print("\t{} junctions created in {:.2f}s ({:.0f} junctions/s)".format(
+            njun, elapsed, njun / max(elapsed, 1e-6)))
+
+    def _fetch_side (self, index, side, start, end):
+        """
+        Return the sequence of one side of a junction from its parent reference
+        @param index Index of the junction (int)
+        @param side 0 for the ref1 part or 1 for the ref2 part of the junction (int)
+        @param start Start coordinate relative to the start of the side (int)
+        @param end End coordinate relative to the start of the side (int)
+        @return The forward sequence of the part of the junction (string)
+        """
+        name = self.contig_names[side][self.contig[side, index]]
+        location = int(self.location[side, index])
 
-        slicer = SlicePickerSingle(size, repeats, ambiguous)
-        junctions_dict = {}
-
-        # Calculate the number of digits in njunctions for to generate junctions ids
-        max_len = len(str(njun))
-
-        for i in range(njun):
-
-            # Pick 1 slice in each reference
-            s1 = slicer.pick_slice(ref1)
-            s2 = slicer.pick_slice(ref2)
-
-            # Create a new junction from the 2 slice
-            junction = s1 + s2
-
-            # Define id, name and description to the SeqReccord object
-            junction.name = junction.description = ""
-            junction.id = "Junction_{0:0{1}}".format(i, max_len)
+        if self.forward[side, index]:
+            return self.refs[side].fetch(name, location + start, location + end)
+        return reverse_complement(self.refs[side].fetch(name, location + self.half_len - end,
+            location + self.half_len - start))
 
-            # Add informations to the annotations dictionnary
-            junction.annotations = {
-                "ref1_source" : ref1,
-                "ref2_source" : ref2,
-                "ref1_refseq" : s1.annotations["refseq"],
-                "ref2_refseq" : s2.annotations["refseq"],
-                "ref1_location" : s1.annotations["location"],
-                "ref2_location" : s2.annotations["location"],
-                "ref1_orientation" : s1.annotations["orientation"],
-                "ref2_orientation" : s2.annotations["orientation"]}
+    def _check_size (self, min_size, max_size):
+        """
+        Verify that slices of the given sizes can be sampled overlapping junctions. If not, a
+        generic Exception will be raised
+        @param min_size Size of the shortest slice (int)
+        @param max_size Size of the longest slice (int)
+        """
+        if  min_size < 2 * self.min_chimeric:
+            raise Exception ("ERROR. The size of the slice is too short to define a fragment\n\
+            with the require minimal number of chimeric bases in each reference sequence.\n\
+            Review your size of min chimeric base or read length")
+        if max_size > self.half_len:
+            raise Exception ("ERROR. The size of the slice is longer than the reference.\n\
+            Review your maximal sonication size or the size of junctions")
 
-            junctions_dict[junction.id] = junction
+    def _random_junction (self):
+        """
+        Draw a junction index according to the junction weights in constant time
+        @return The index of the junction (int)
+        """
+        index = self.rng.randrange(self.njun)
+        if self.alias is None or self.rng.random() < self.alias_prob[index]:
+            return index
+        return int(self.alias[index])
 
-        return junctions_dict
+    def _alias_table (self, weights):
+        """
+        Build the alias table of the weights with the method of Vose. Each of the n columns holds a
+        probability 1/n shared between its own junction and at most one other junction (its alias).
+        @param weights Relative sampling weight of each junction (numpy array of float)
+        @return The probability to keep the junction of each column and the alias of each column
+        (tuple of numpy arrays)
+        """
+        prob = weights * (self.njun / weights.sum())
+        alias = np.arange(self.njun, dtype=np.int64)
+        small = np.flatnonzero(prob < 1).tolist()
+        large = np.flatnonzero(prob >= 1).tolist()
+        scaled = prob.tolist()
+
+        # Fill each column with a lower probability with the excess of a column with a higher one
+        while small and large:
+            less, more = small.pop(), large[-1]
+            alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(large.pop())
+
+        # Remaining columns are full, up to rounding errors
+        for index in small + large:
+            scaled[index] = 1.0
+        return np.array(scaled), alias
+
+    def _raw_slice (self, junction, start, end, forward):
+        """
+        @param junction Handle of the junction (Junction object)
+        @param start Start position of the slice (int)
+        @param end End position of the slice (int)
+        @param forward Orientation of the slice (bool)
+        @return A slice of the junction at the given positions (RawRead object)
+        """
+        if forward:
+            return RawRead(self.fetch(junction, start, end), self, junction, start, end, "+")
+        return RawRead(reverse_complement(self.fetch(junction, start, end)), self, junction,
+            start, end, "-")
 
-    def _random_slice (self, refseq, size):
+    def _random_slice (self, refseq, size, raw=False):
         """
-        Return a slice overlapping a junction from a given SeqRecord reference sequence in a
-        random orientation. The SeqRecord annotations dict is updated to contain relevant
-        informations.
-        @param refseq Name of the sequence (string)
+        Return a slice overlapping a junction from a given junction in a random orientation.
+        @param refseq Index of the junction (int)
         @param size Size of the slice to sample (int)
-        @return A random slice in refseq (SeqRecord object)
+        @param raw If True a RawRead is returned instead of a SeqRecord (bool)
+        @return A random slice in the junction (SeqRecord or RawRead object)
         """
         # Randomly choose the slice start position in the autorized area
-        start = randint((self.half_len + self.min_chimeric - size), (self.half_len - self.min_chimeric))
+        start = self.rng.randint((self.half_len + self.min_chimeric - size), (self.half_len - self.min_chimeric))
         end = start + size
 
+        if raw:
+            return self.getRawSlice(refseq, start, end)
         return self.getSlice(refseq, start, end)
 
 
-    def _coord_to_str (self, refseq, refsource, start, end):
+    def _coord_to_str (self, index, side, start, end):
         """
         Return a string containg the coordinate on ref1 or ref2 from a junction
-        @param refseq SeqReccord object containing a junction from the dict
-        @param refsource Indicates if the source reference sequence is the left
-        part ("ref1") or the right part ("ref2") of the junction
+        @param index Index of the junction (int)
+        @param side Indicates if the source reference sequence is the left part (0) or the right
+        part (1) of the junction
         @param start Start coordinate relative to the start of the reference
         @param end End coordinate relative to the start of the reference
         @return A string composed of the id of the source reference followed by
         start and end coordinates on the source reference (ex : chr12:124-434 )
         """
+        ref_id = self.contig_names[side][self.contig[side, index]]
+        location = int(self.location[side, index])
 
-        ref_id = refseq.annotations[refsource+"_refseq"].id
-
-        if refseq.annotations[refsource+"_orientation"] == '+':
-            ref_start = refseq.annotations[refsource+"_location"][0] + start
-            ref_end = refseq.annotations[refsource+"_location"][0] + end
+        if self.forward[side, index]:
+            ref_start = location + start
+            ref_end = location + end
 
         else:
-            ref_start = refseq.annotations[refsource+"_location"][1] - end
-            ref_end = refseq.annotations[refsource+"_location"][1] - start
+            ref_start = location + self.half_len - end
+            ref_end = location + self.half_len - start
 
         return ("{}:{}-{}".format(ref_id, ref_start, ref_end))
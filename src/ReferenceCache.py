@@ -0,0 +1,322 @@
+"""
+@package    ReferenceCache
+@brief      **Content addressed cache of packed reference genomes**
+Fasta files are compiled once in the packed genome format and stored in a cache directory under
+the md5 hash of their content, so that the same genome is found whatever its path. An index of the
+cache records the path, size and modification time of the fasta files already hashed, to avoid
+hashing them again at each run, and the last use of each entry. The index is locked while it is
+updated, so that concurrent runs sharing the cache do not lose their updates. Entries can be built
+in advance, listed and evicted from the command line, either all (with --all), by key or the least
+recently used ones until the cache fits in a size limit.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from time import time, strftime, localtime
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+from os import path
+
+# Local packages
+from Utilities import file_digest
+from PackedGenome import EXTENSION, is_packed, compile_genome
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Default cache directory if none is given
+DEFAULT_CACHE_DIR = path.join(path.expanduser("~"), ".cache", "isis")
+## Name of the index file of a cache directory
+INDEX_NAME = "index.json"
+## Name of the lock file of the index
+LOCK_NAME = "index.lock"
+## Multipliers of the size suffixes accepted by parse_size
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ReferenceCache(object):
+    """
+    @class ReferenceCache
+    @brief Cache directory of packed genome files named by the md5 hash of their source fasta
+    file. The index is a json file with an entry per packed genome (size, creation, last use and
+    source paths) and the size, modification time and hash of each fasta path already hashed.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, cache_dir=None):
+        """
+        Create the cache directory if needed
+        @param cache_dir Path of the cache directory (default = DEFAULT_CACHE_DIR)
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        if not path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.index_path = path.join(self.cache_dir, INDEX_NAME)
+        self.lock_path = path.join(self.cache_dir, LOCK_NAME)
+
+    def __repr__(self):
+        return "{}\nDirectory : {}\nEntries : {}\nSize : {}\n".format(
+            self.__str__(), self.cache_dir, len(self.entries()), self.total_size())
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_cache_dir(self):
+        return self.cache_dir
+
+    def entry_path(self, key):
+        """
+        @param key md5 hash of a fasta file (string)
+        @return Path of the packed genome file of the entry (string)
+        """
+        return path.join(self.cache_dir, key + EXTENSION)
+
+    def entries(self):
+        """
+        @return A list of entries sorted from the least to the most recently used. Each entry is a
+        dictionnary containing the key, size, created, last_used and sources fields
+        """
+        entries = self._read_index()["entries"]
+        result = [dict(entry, key=key) for key, entry in entries.items()]
+        return sorted(result, key=lambda entry: entry["last_used"])
+
+    def total_size(self):
+        """
+        @return The total size of the packed genome files in the cache in bytes (int)
+        """
+        return sum(entry["size"] for entry in self.entries())
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def lookup(self, fasta_path):
+        """
+        Find the packed genome compiled from a fasta file. The fasta file is hashed only if its
+        path, size or modification time are not already in the index. The last use of the entry is
+        updated if it is found
+        @param fasta_path Path of the fasta file (string)
+        @return The path of the packed genome file or None if not in the cache, and the md5 hash
+        of the fasta file (tuple)
+        """
+        with self._locked():
+            index = self._read_index()
+            key = self._digest(index, fasta_path)
+            entry = index["entries"].get(key)
+
+            if entry and is_packed(self.entry_path(key)):
+                entry["last_used"] = time()
+                source = path.abspath(fasta_path)
+                if source not in entry["sources"]:
+                    entry["sources"].append(source)
+                self._write_index(index)
+                return self.entry_path(key), key
+
+            self._write_index(index)
+            return None, key
+
+    def get(self, fasta_path):
+        """
+        Return the packed genome compiled from a fasta file, compiling it in the cache if needed
+        @param fasta_path Path of the fasta file (string)
+        @return The path of the packed genome file and the md5 hash of the fasta file (tuple)
+        """
+        packed, key = self.lookup(fasta_path)
+        if packed:
+            print("\tUsing cached packed genome {}".format(packed))
+            return packed, key
+
+        # Compile under a temporary name so that concurrent runs never map an incomplete file
+        packed = self.entry_path(key)
+        tmp = "{}.{}.tmp".format(packed, os.getpid())
+        compile_genome(fasta_path, tmp)
+        os.rename(tmp, packed)
+
+        with self._locked():
+            index = self._read_index()
+            index["entries"][key] = {"size": path.getsize(packed), "created": time(),
+                "last_used": time(), "sources": [path.abspath(fasta_path)]}
+            self._write_index(index)
+        return packed, key
+
+    def evict(self, max_size=None, keys=None, evict_all=False):
+        """
+        Remove entries from the cache. Entries listed in keys are removed, or else the least
+        recently used entries are removed until the cache size is lower than max_size, or else
+        all entries are removed if evict_all is True
+        @param max_size Maximal size of the cache in bytes (int)
+        @param keys List of keys or key prefixes of the entries to remove (list of string)
+        @param evict_all Remove all entries if neither keys nor max_size are given (bool)
+        @return The list of removed entries
+        @exception ValueError Raise if neither keys, max_size nor evict_all are given
+        """
+        if not keys and max_size is None and not evict_all:
+            raise ValueError("Keys, a maximal size or evict_all are required to evict entries")
+
+        with self._locked():
+            index = self._read_index()
+            entries = sorted(index["entries"].items(), key=lambda item: item[1]["last_used"])
+
+            if keys:
+                removed = [(key, entry) for key, entry in entries
+                    if any(key.startswith(prefix) for prefix in keys)]
+            elif max_size is not None:
+                removed = []
+                total = sum(entry["size"] for key, entry in entries)
+                for key, entry in entries:
+                    if total <= max_size:
+                        break
+                    removed.append((key, entry))
+                    total -= entry["size"]
+            else:
+                removed = entries
+
+            for key, entry in removed:
+                del index["entries"][key]
+                try:
+                    os.remove(self.entry_path(key))
+                except OSError:
+                    pass
+
+            # Forget the hashes of the fasta files of removed entries
+            removed_keys = set(key for key, entry in removed)
+            index["paths"] = {source : stat for source, stat in index["paths"].items()
+                if stat[2] not in removed_keys}
+
+            self._write_index(index)
+        return [dict(entry, key=key) for key, entry in removed]
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    @contextmanager
+    def _locked(self):
+        """
+        Context manager holding an exclusive lock on the index, to read, modify and write it
+        without interleaving with other processes sharing the cache
+        """
+        with open(self.lock_path, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _digest(self, index, fasta_path):
+        """
+        Return the md5 hash of a fasta file from the index if its size and modification time are
+        unchanged, or else hash the file and record it in the index
+        @param index Index dictionnary of the cache (dict)
+        @param fasta_path Path of the fasta file (string)
+        @return The md5 hash of the fasta file (string)
+        """
+        source = path.abspath(fasta_path)
+        stat = [path.getsize(source), path.getmtime(source)]
+        known = index["paths"].get(source)
+        if known and known[:2] == stat:
+            return str(known[2])
+
+        print("\tHashing {}".format(fasta_path))
+        key = file_digest(source)
+        index["paths"][source] = stat + [key]
+        return key
+
+    def _read_index(self):
+        """
+        @return The index dictionnary of the cache, empty if the index file is absent or invalid
+        """
+        try:
+            with open(self.index_path, "r") as handle:
+                index = json.load(handle)
+            return {"entries": index["entries"], "paths": index["paths"]}
+        except (IOError, ValueError, KeyError, TypeError):
+            return {"entries": {}, "paths": {}}
+
+    def _write_index(self, index):
+        """
+        Write the index file under a temporary name and rename it
+        @param index Index dictionnary of the cache (dict)
+        """
+        tmp = "{}.{}.tmp".format(self.index_path, os.getpid())
+        with open(tmp, "w") as handle:
+            json.dump(index, handle, indent=1, sort_keys=True)
+        os.rename(tmp, self.index_path)
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def parse_size(size):
+    """
+    @param size Size in bytes with an optional K, M, G or T suffix, for instance 20G (string)
+    @return The size in bytes (int)
+    @exception ValueError Raise if the size is not valid
+    """
+    size = size.strip().upper().rstrip("B")
+    unit = size[-1] if size and size[-1] in SIZE_UNITS else ""
+    return int(float(size[:len(size)-len(unit)]) * SIZE_UNITS[unit])
+
+def format_size(size):
+    """
+    @param size Size in bytes (int)
+    @return A human readable size (string)
+    """
+    for unit in ("", "K", "M", "G"):
+        if size < 1024:
+            return "{:.1f}{}".format(size, unit)
+        size /= 1024.0
+    return "{:.1f}T".format(size)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~MAIN FUNCTION~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+if __name__ == '__main__':
+
+    import optparse
+
+    usage_string = "%prog build genome.fa[.gz] [...] | list | evict --all | --max-size 20G | key [...] [-d cache_dir]"
+    optparser = optparse.OptionParser(usage = usage_string)
+    hstr = "Facultative option to indicate the cache directory (default = {})".format(DEFAULT_CACHE_DIR)
+    optparser.add_option( '-d', '--cache-dir', dest="cache_dir", help=hstr)
+    hstr = "Evict the least recently used entries until the cache is smaller than this size (for instance 20G)"
+    optparser.add_option( '--max-size', dest="max_size", help=hstr)
+    hstr = "Evict all the entries of the cache"
+    optparser.add_option( '--all', dest="evict_all", action="store_true", default=False, help=hstr)
+    options, args = optparser.parse_args()
+
+    if not args or args[0] not in ("build", "list", "evict"):
+        optparser.error("A command among build, list and evict is required")
+    cache = ReferenceCache(options.cache_dir)
+
+    if args[0] == "build":
+        if len(args) < 2:
+            optparser.error("At least one fasta file path is required")
+        for fasta_path in args[1:]:
+            packed, key = cache.get(fasta_path)
+            print ("{}\t{}".format(key, fasta_path))
+
+    elif args[0] == "list":
+        print ("key\tsize\tlast_used\tsources")
+        for entry in cache.entries():
+            print ("{}\t{}\t{}\t{}".format(entry["key"], format_size(entry["size"]),
+                strftime("%Y-%m-%d %H:%M:%S", localtime(entry["last_used"])),
+                ",".join(entry["sources"])))
+        print ("Total size : {}".format(format_size(cache.total_size())))
+
+    else:
+        try:
+            max_size = parse_size(options.max_size) if options.max_size else None
+        except ValueError:
+            optparser.error("Invalid size {}".format(options.max_size))
+        if len(args) < 2 and max_size is None and not options.evict_all:
+            optparser.error("Keys, --max-size or --all are required to evict entries")
+        for entry in cache.evict(max_size, args[1:], options.evict_all):
+            print ("Evicted {}\t{}".format(entry["key"], format_size(entry["size"])))
+        print ("Total size : {}".format(format_size(cache.total_size())))
@@ -15,11 +15,81 @@ the superclass SlicePicker which contains the common code.
 #~~~~~~~PACKAGE IMPORTS~~~~~~~#
 
 # Standard library packages
-from random import random, sample, betavariate
+from math import log, log1p
+from bisect import bisect_right
 
 # Third party packages
 from Bio.Alphabet.IUPAC import IUPACAmbiguousDNA as Ambiguous
 from Bio.Alphabet.IUPAC import IUPACUnambiguousDNA as Unambiguous
+from Bio.Seq import Seq
+import numpy as np
+
+# Local packages
+from Utilities import reverse_complement
+from RandomStream import DEFAULT_STREAM
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+def _mutation_table():
+    """
+    Create the table of substitution bases for each possible byte. A base is substituted by one of
+    the non ambiguous DNA bases it does not contain (3 for A, C, G, T and 4 for ambiguous bases).
+    @return A 256 x 4 array of substitution bytes and an array of number of substitutions
+    """
+    subs = np.zeros((256, 4), dtype=np.uint8)
+    counts = np.zeros(256, dtype=np.int64)
+    for code in range(256):
+        bases = [mut_base for mut_base in ['A','T','C','G'] if mut_base not in chr(code).upper()]
+        subs[code, :len(bases)] = [ord(base) for base in bases]
+        counts[code] = len(bases)
+    return subs, counts
+
+## Substitution bases and number of possible substitutions indexed by base byte
+MUTATION_SUBS, MUTATION_COUNTS = _mutation_table()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+class RawRead(object):
+    """
+    @class RawRead
+    @brief Lightweight alternative to a SeqRecord slice used by the raw read pipeline. The sequence
+    is a plain string and the informations stored in the SeqRecord annotations dict are stored in
+    attributes.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    __slots__ = ("seq", "source", "refseq", "start", "end", "orientation", "frag_len", "mate",
+                 "mutations", "qual")
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, seq, source, refseq, start, end, orientation, mate=None):
+        """
+        @param seq DNA sequence of the read (string)
+        @param source Pointer to the source Reference object
+        @param refseq Source ref sequence (SeqRecord like object)
+        @param start Start position along the source ref sequence (int)
+        @param end End position along the source ref sequence (int)
+        @param orientation Orientation along the source ref sequence "+" or "-" (string)
+        @param mate R1 or R2 for pair end reads (string)
+        """
+        self.seq = seq
+        self.source = source
+        self.refseq = refseq
+        self.start = start
+        self.end = end
+        self.orientation = orientation
+        self.mate = mate
+        self.frag_len = len(seq)
+        self.mutations = 0
+        self.qual = None
+
+    def __repr__(self):
+        return "{}\n{}:{}-{}({})\n{}\n".format(
+            self.__str__(), self.refseq.id, self.start, self.end, self.orientation, self.seq)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
@@ -33,20 +103,27 @@ class SlicePicker(object):
 
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
-    def __init__(self, read_len, repeats, ambiguous, mut_freq=0):
+    def __init__(self, read_len, repeats, ambiguous, mut_freq=0, rng=None):
         """
         Store generic informations in object variables
         @param read_len Lenght of the reads to generate (int)
         @param repeats Allow lowercase characters (repeats) in the read (boolean)
         @param ambiguous Allow Ambiguous DNA bases in the read (boolean)
         @param mut_freq Mean frequency of mutations to introduce in the read (float)
+        @param rng RandomStream used for fragment sizes and mutations (default = DEFAULT_STREAM)
         """
+        # Random stream
+        self.rng = rng or DEFAULT_STREAM
         # Definition of a generic mutation frequency
         self.mut_freq = mut_freq
+        # Log of the probability of a base not to be mutated to draw geometric gaps between mutations
+        self.log_keep = log1p(-mut_freq) if 0 < mut_freq < 1 else None
         # Definition of a generic alphabet of allowed DNA bases
         self.alphabet = self._IUPAC_alphabet(repeats, ambiguous)
         # Store read length
         self.read_len = read_len
+        # Number of candidate slices rejected because of forbidden bases
+        self.rejected = 0
 
     def __repr__(self):
         descr = "{}\n".format(self.__str__())
@@ -66,6 +143,9 @@ class SlicePicker(object):
     def get_alphabet (self):
         return self.alphabet
 
+    def get_rejected (self):
+        return self.rejected
+
     def get_read_len (self):
         return self.read_len
 
@@ -91,34 +171,120 @@ class SlicePicker(object):
 
     def _mutate_sequence(self, read):
         """
-        Scan a Seq object lenght with a probability to introduce mutations a the defined frequency
+        Introduce mutations at the defined frequency in the Seq object of a read
         @param read A seq object extracted from a biopython SeqRecord.
         @return The read with eventual mutations
         """
-
         read.annotations ["Mutations"] = []
         if self.mut_freq != 0:
+            seq, mutations = self._mutate_string(str(read.seq))
+            if mutations:
+                read.seq = Seq(seq, read.seq.alphabet)
+                read.annotations ["Mutations"] = ["Pos {} {} -> {}".format(i+1, original_base, new_base)
+                    for i, original_base, new_base in mutations]
 
-            # Change Seq to mutable object
-            seq = read.seq.tomutable()
-            for i in range(len(seq)):
-                if random() < self.mut_freq:
-                    original_base = seq[i]
-                    seq[i] = self._mutate_base(seq[i])
-                    read.annotations ["Mutations"].append("Pos {} {} -> {}".format(i+1, original_base, seq[i]))
+        return read
 
-            # Change back to non-mutable object
-            read.seq = seq.toseq()
+    def _mutate_raw(self, read):
+        """
+        Raw read counterpart of _mutate_sequence. Random values are drawn in the same order so that
+        both pipelines introduce the same mutations for a given random state
+        @param read A RawRead object
+        @return The read with eventual mutations and their number in read.mutations
+        """
+        if self.mut_freq != 0:
+            read.seq, mutations = self._mutate_string(read.seq)
+            read.mutations += len(mutations)
 
         return read
 
+    def _mutate_block(self, reads):
+        """
+        Batch counterpart of _mutate_raw. Mutation positions of all reads are drawn at once as
+        geometric gaps along the reads laid end to end, and substituted with numpy
+        @param reads A list of RawRead objects
+        @return The list of reads with eventual mutations and their number in read.mutations
+        """
+        if self.mut_freq == 0 or not reads:
+            return reads
+
+        lengths = np.array([len(read.seq) for read in reads], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        positions = self._block_positions(int(ends[-1]))
+        if not len(positions):
+            return reads
+
+        # Substitute bases in a single buffer containing all reads
+        buf = np.frombuffer("".join([read.seq for read in reads]), dtype=np.uint8).copy()
+        bases = buf[positions]
+        choice = (self.rng.random_sample(len(positions)) * MUTATION_COUNTS[bases]).astype(np.int64)
+        buf[positions] = MUTATION_SUBS[bases, choice]
+
+        # Update the sequence of mutated reads only
+        mutated, counts = np.unique(np.searchsorted(ends, positions, side="right"), return_counts=True)
+        for i, count in zip(mutated.tolist(), counts.tolist()):
+            reads[i].seq = buf[ends[i]-lengths[i]:ends[i]].tostring()
+            reads[i].mutations += count
+
+        return reads
+
+    def _mutate_string(self, seq):
+        """
+        Introduce mutations at the defined frequency in a sequence string. Positions are drawn as
+        geometric gaps between successive mutations, so that only one random value is drawn per
+        mutation instead of one per base
+        @param seq DNA sequence (string)
+        @return The mutated sequence (string) and a list of mutations as tuples (position, original
+        base, new base)
+        """
+        mutations = []
+        i = self._mutation_gap()
+        if i >= len(seq):
+            return seq, mutations
+
+        buf = bytearray(seq)
+        while i < len(buf):
+            original_base = chr(buf[i])
+            buf[i] = self._mutate_base(original_base)
+            mutations.append((i, original_base, chr(buf[i])))
+            i += 1 + self._mutation_gap()
+
+        return str(buf), mutations
+
+    def _mutation_gap(self):
+        """
+        Draw the number of non mutated bases before the next mutation following a geometric law
+        @return The number of bases (int)
+        """
+        if self.log_keep is None:
+            return 0
+        return int(log(1.0 - self.rng.random()) / self.log_keep)
+
+    def _block_positions(self, total):
+        """
+        Draw all mutation positions along a sequence of a given length as geometric gaps
+        @param total Length of the sequence (int)
+        @return A sorted numpy array of positions
+        """
+        if self.log_keep is None:
+            return np.arange(total)
+
+        # Draw gaps by chunks until the end of the sequence is reached
+        chunk = int(total * self.mut_freq * 1.1) + 16
+        positions = np.cumsum(self.rng.geometric(self.mut_freq, chunk)) - 1
+        while positions[-1] < total:
+            more = positions[-1] + np.cumsum(self.rng.geometric(self.mut_freq, chunk))
+            positions = np.concatenate((positions, more))
+        return positions[positions < total]
+
     def _mutate_base(self, base):
         """
         Return a DNA base different from the given base
         @param base A DNA base (may be ambigous)
         @return A different non ambiguous DNA base
         """
-        return sample([mut_base for mut_base in ['A','T','C','G'] if mut_base not in base.upper()],1)[0]
+        code = ord(base)
+        return chr(MUTATION_SUBS[code, int(self.rng.random() * MUTATION_COUNTS[code])])
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
@@ -146,24 +312,86 @@ class SlicePickerSingle(SlicePicker):
         * mutation : List of mutations introduced in the sequence
         @exception Exception Generic exception raise if no valid sequence was found after 100 tries
         """
+        # Slices of sources able to draw valid slices by construction do not need to be verified
+        valid = source.valid_slices(self.alphabet)
+
         # Guard condition if not possible to find a valid pair after 100 tries
         for count in range(1000):
             # Ask a random sequence to the source
             try:
-                read = source.slicer(self.read_len)
+                read = source.slicer(self.read_len, alphabet=self.alphabet)
             except Exception as e:
                 print e
                 exit (0)
 
             # Verify the validity of the candidate sequence
-            if self._valid_sequence(str(read.seq)):
+            if valid or self._valid_sequence(str(read.seq)):
                 read.annotations["frag_len"] = len(read.seq)
                 return self._mutate_sequence(read)
+            self.rejected += 1
+
+        # If no candidate sequence was found an Exception is raised
+        raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
+        Please review repetition and ambiguity parameters and verify your reference sequences")
+
+    def pick_raw(self, source):
+        """
+        Raw read counterpart of pick_slice. Generate a candidate read as a RawRead object without
+        creating any SeqRecord.
+        @param source Reference object source where the read have to be sampled
+        @return A RawRead from the source with eventual mutations
+        @exception Exception Generic exception raise if no valid sequence was found after 100 tries
+        """
+        # Slices of sources able to draw valid slices by construction do not need to be verified
+        valid = source.valid_slices(self.alphabet)
+
+        # Guard condition if not possible to find a valid pair after 100 tries
+        for count in range(1000):
+            # Ask a random sequence to the source
+            try:
+                read = source.slicer(self.read_len, raw=True, alphabet=self.alphabet)
+            except Exception as e:
+                print e
+                exit (0)
+
+            # Verify the validity of the candidate sequence
+            if valid or self._valid_sequence(read.seq):
+                return self._mutate_raw(read)
+            self.rejected += 1
 
         # If no candidate sequence was found an Exception is raised
         raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
         Please review repetition and ambiguity parameters and verify your reference sequences")
 
+    def pick_block(self, source, n):
+        """
+        Block counterpart of pick_raw. All candidate reads are asked at once to the source and
+        only invalid candidates are replaced one by one with pick_raw.
+        @param source Reference object source where the reads have to be sampled
+        @param n Number of reads to generate (int)
+        @return A list of RawRead from the source with eventual mutations
+        """
+        try:
+            candidates = source.slicer_block([self.read_len] * n, alphabet=self.alphabet)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Replace invalid candidates, and mutate valid candidates all at once
+        valid = source.valid_slices(self.alphabet)
+        reads = []
+        to_mutate = []
+        for read in candidates:
+            if valid or self._valid_sequence(read.seq):
+                to_mutate.append(read)
+                reads.append(read)
+            else:
+                self.rejected += 1
+                reads.append(self.pick_raw(source))
+
+        self._mutate_block(to_mutate)
+        return reads
+
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
 class SlicePickerPair(SlicePicker):
@@ -174,7 +402,7 @@ class SlicePickerPair(SlicePicker):
     #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
 
     def __init__(self, read_len, sonic_min, sonic_mode, sonic_max, sonic_certainty, repeats,
-                 ambiguous, mut_freq):
+                 ambiguous, mut_freq, rng=None, frag_hist=None):
         """
         Surdefine the super class init by adding sonication parameters
         @param read_len Lenght of the reads to generate (int)
@@ -185,9 +413,12 @@ class SlicePickerPair(SlicePicker):
         @param sonic_mode   Modal size of sonication fragments (int)
         @param sonic_max    Maximal size of sonication fragments (int)
         @param sonic_certainty  Thickness of the sonication peak (int)
+        @param rng RandomStream used for fragment sizes and mutations (default = DEFAULT_STREAM)
+        @param frag_hist Empirical fragment length distribution replacing the beta distribution
+        (FragmentHistogram)
         """
         # Use the super class init method
-        super(self.__class__, self).__init__(read_len, repeats, ambiguous, mut_freq)
+        super(self.__class__, self).__init__(read_len, repeats, ambiguous, mut_freq, rng)
 
         if not read_len <= sonic_min <= sonic_mode <= sonic_max:
             raise Exception("Wrong sonication parameters")
@@ -199,6 +430,10 @@ class SlicePickerPair(SlicePicker):
         self.sonic_certainty = sonic_certainty
         self.alpha, self.beta = self._beta_shape()
 
+        if frag_hist and not sonic_min <= frag_hist.get_min() <= frag_hist.get_max() <= sonic_max:
+            raise Exception("Fragment lengths of the histogram are out of the sonication range")
+        self.frag_hist = frag_hist
+
     def __repr__(self):
         descr = super(self.__class__, self).__repr__()
         descr += "Sonication minimum {}\n".format(self.sonic_min)
@@ -207,6 +442,8 @@ class SlicePickerPair(SlicePicker):
         descr += "Sonication certainty {}\n".format(self.sonic_certainty)
         descr += "alpha {}\n".format(self.alpha)
         descr += "beta {}\n".format(self.beta)
+        if self.frag_hist:
+            descr += "Fragment length histogram {}\n".format(self.frag_hist)
         return descr
 
     #~~~~~~~ACCESS METHODS~~~~~~~#
@@ -229,6 +466,9 @@ class SlicePickerPair(SlicePicker):
     def get_beta (self):
         return self.beta
 
+    def get_frag_hist (self):
+        return self.frag_hist
+
     #~~~~~~~PUBLIC METHODS~~~~~~~#
 
     def pick_slice(self, source):
@@ -252,14 +492,17 @@ class SlicePickerPair(SlicePicker):
         @exception Exception Generic exception raise if no valid sequence was found after 100 tries
         """
 
+        # Slices of sources able to draw valid slices by construction do not need to be verified
+        valid = source.valid_slices(self.alphabet)
+
         # Guard condition if not possible to find a valid pair after 100 tries
         for count in range(1000):
-            # Generate a random size following a beta distribution
-            frag_len = self._beta_distrib()
+            # Generate a random size following the fragment length distribution
+            frag_len = self._frag_len()
 
-            # Ask a random sequence to the source
+            # Ask a random sequence which both read windows are valid to the source
             try:
-                fragment = source.slicer(frag_len)
+                fragment = source.slicer(frag_len, alphabet=self.alphabet, window=self.read_len)
             except Exception as e:
                 print e
                 exit (0)
@@ -268,13 +511,81 @@ class SlicePickerPair(SlicePicker):
             read1, read2 = self._extract_pair(fragment)
 
             # Verify the validity of the candidate sequence
-            if self._valid_sequence(str(read1.seq)) and self._valid_sequence(str(read2.seq)):
+            if valid or (self._valid_sequence(str(read1.seq)) and self._valid_sequence(str(read2.seq))):
                 return(self._mutate_sequence(read1), self._mutate_sequence(read2))
+            self.rejected += 1
 
         # If no candidate sequence was found an Exception is raised
         raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
         Please review repetition and ambiguity parameters and verify your reference sequences")
 
+    def pick_raw(self, source):
+        """
+        Raw read counterpart of pick_slice. Generate a candidate read pair as RawRead objects
+        without creating any SeqRecord.
+        @param source Reference object source where the read have to be sampled
+        @return A pair of RawRead from the source with eventual mutations (tuple)
+        @exception Exception Generic exception raise if no valid sequence was found after 100 tries
+        """
+        # Slices of sources able to draw valid slices by construction do not need to be verified
+        valid = source.valid_slices(self.alphabet)
+
+        # Guard condition if not possible to find a valid pair after 100 tries
+        for count in range(1000):
+            # Generate a random size following the fragment length distribution
+            frag_len = self._frag_len()
+
+            # Ask a random sequence which both read windows are valid to the source
+            try:
+                fragment = source.slicer(frag_len, raw=True, alphabet=self.alphabet, window=self.read_len)
+            except Exception as e:
+                print e
+                exit (0)
+
+            # Extract pair reads from slice
+            read1, read2 = self._extract_raw_pair(fragment)
+
+            # Verify the validity of the candidate sequence
+            if valid or (self._valid_sequence(read1.seq) and self._valid_sequence(read2.seq)):
+                return(self._mutate_raw(read1), self._mutate_raw(read2))
+            self.rejected += 1
+
+        # If no candidate sequence was found an Exception is raised
+        raise Exception("ERROR. Unable to find a valid slice after 100 tries.\n\
+        Please review repetition and ambiguity parameters and verify your reference sequences")
+
+    def pick_block(self, source, n):
+        """
+        Block counterpart of pick_raw. The sizes of all candidate fragments are drawn in a single
+        batch and the fragments are asked at once to the source. Only pairs with an invalid read
+        are replaced one by one with pick_raw.
+        @param source Reference object source where the reads have to be sampled
+        @param n Number of read pairs to generate (int)
+        @return A list of RawRead pairs from the source with eventual mutations (list of tuples)
+        """
+        try:
+            fragments = source.slicer_block(self._frag_lens(n).tolist(),
+                alphabet=self.alphabet, window=self.read_len)
+        except Exception as e:
+            print e
+            exit (0)
+
+        # Replace invalid candidates, and mutate valid candidates all at once
+        valid = source.valid_slices(self.alphabet)
+        pairs = []
+        to_mutate = []
+        for fragment in fragments:
+            read1, read2 = self._extract_raw_pair(fragment)
+            if valid or (self._valid_sequence(read1.seq) and self._valid_sequence(read2.seq)):
+                to_mutate.extend((read1, read2))
+                pairs.append((read1, read2))
+            else:
+                self.rejected += 1
+                pairs.append(self.pick_raw(source))
+
+        self._mutate_block(to_mutate)
+        return pairs
+
     #~~~~~~~PRIVATE METHODS~~~~~~~#
 
     def _beta_shape(self):
@@ -292,7 +603,27 @@ class SlicePickerPair(SlicePicker):
         comprise between sonic_min and sonic_max
         @return A size of the fragment (int)
         """
-        return int(betavariate(self.alpha, self.beta) * (self.sonic_max - self.sonic_min) + self.sonic_min)
+        return int(self.rng.betavariate(self.alpha, self.beta) * (self.sonic_max - self.sonic_min) + self.sonic_min)
+
+    def _frag_len(self):
+        """
+        @return A fragment size drawn in the empirical histogram if available, or else in the beta
+        distribution (int)
+        """
+        if self.frag_hist:
+            return self.frag_hist.sample_one(self.rng)
+        return self._beta_distrib()
+
+    def _frag_lens(self, n):
+        """
+        Batch counterpart of _frag_len drawing all sizes at once with numpy
+        @param n Number of fragment sizes to draw (int)
+        @return A numpy array of fragment sizes
+        """
+        if self.frag_hist:
+            return self.frag_hist.sample(self.rng, n)
+        draws = self.rng.beta(self.alpha, self.beta, n)
+        return (draws * (self.sonic_max - self.sonic_min) + self.sonic_min).astype(np.int64)
 
     def _extract_pair(self, fragment):
         """
@@ -357,3 +688,124 @@ class SlicePickerPair(SlicePicker):
 
         return d
 
+    def _extract_raw_pair(self, fragment):
+        """
+        Raw read counterpart of _extract_pair. Extract reads forward and reverse from a fragment
+        @param fragment RawRead fragment from which a pair at extremities needs to be extracted
+        @return A pair of forward and reverse RawRead (tuple)
+        """
+        f_start = fragment.start
+        f_end = fragment.end
+        r_len = self.read_len
+
+        # Location and orientation of R1 and R2 according to the fragment orientation
+        if fragment.orientation == "+":
+            loc1, loc2 = (f_start, f_start + r_len, "+"), (f_end - r_len, f_end, "-")
+        else:
+            loc1, loc2 = (f_end - r_len, f_end, "-"), (f_start, f_start + r_len, "+")
+
+        forward = RawRead(fragment.seq[:r_len], fragment.source, fragment.refseq, *loc1, mate="R1")
+        reverse = RawRead(reverse_complement(fragment.seq[-r_len:]), fragment.source,
+            fragment.refseq, *loc2, mate="R2")
+        forward.frag_len = reverse.frag_len = fragment.frag_len
+
+        return(forward, reverse)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class FragmentHistogram(object):
+    """
+    @class FragmentHistogram
+    @brief Empirical distribution of fragment lengths, for instance the insert size histogram of a
+    real library, sampled by inversion of its cumulative distribution table.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, lengths, counts):
+        """
+        @param lengths Fragment lengths (list of int)
+        @param counts Number of fragments of each length (list of int or float)
+        @exception ValueError Raise if the histogram contains no fragment
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+        order = np.argsort(lengths, kind="mergesort")
+        keep = counts[order] > 0
+        self.lengths = lengths[order][keep]
+        self.counts = counts[order][keep]
+        if not len(self.lengths):
+            raise ValueError("The fragment length histogram is empty")
+
+        # Cumulative distribution table searched with uniform draws
+        self.cdf = np.cumsum(self.counts) / self.counts.sum()
+        self.cdf[-1] = 1.0
+        self.cdf_list = self.cdf.tolist()
+        self.length_list = self.lengths.tolist()
+
+    def __repr__(self):
+        return "{}\nLengths : {}-{}\nMode : {}\nFragments : {}\n".format(
+            self.__str__(), self.get_min(), self.get_max(), self.get_mode(), int(self.counts.sum()))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_min (self):
+        return self.length_list[0]
+
+    def get_max (self):
+        return self.length_list[-1]
+
+    def get_mode (self):
+        return self.length_list[int(np.argmax(self.counts))]
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def sample(self, rng, n):
+        """
+        @param rng RandomStream used to draw the fragment lengths
+        @param n Number of fragment lengths to draw (int)
+        @return A numpy array of n fragment lengths
+        """
+        return self.lengths[np.searchsorted(self.cdf, rng.random_sample(n), side="right")]
+
+    def sample_one(self, rng):
+        """
+        @param rng RandomStream used to draw the fragment length
+        @return A fragment length (int)
+        """
+        return self.length_list[bisect_right(self.cdf_list, rng.random())]
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def import_frag_hist(path, min_len=0):
+    """
+    Import a fragment length histogram from a text file with a length and a count per line, such
+    as the histogram section of Picard CollectInsertSizeMetrics files. Lines which do not start
+    with two numeric fields are ignored, as well as all lines before a "## HISTOGRAM" line.
+    @param path Path of the histogram file (string)
+    @param min_len Fragments shorter than this length are discarded (int)
+    @return A FragmentHistogram
+    @exception IOError Raise if the file is not readable
+    @exception ValueError Raise if the file contains no fragment longer than min_len
+    """
+    lengths = []
+    counts = []
+    with open(path, "r") as handle:
+        for line in handle:
+            # The metrics section of Picard files also contains numeric lines
+            if line.startswith("## HISTOGRAM"):
+                lengths, counts = [], []
+                continue
+            fields = line.split()
+            try:
+                length, count = int(fields[0]), float(fields[1])
+            except (IndexError, ValueError):
+                continue
+            if length >= min_len:
+                lengths.append(length)
+                counts.append(count)
+
+    return FragmentHistogram(lengths, counts)
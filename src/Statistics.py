@@ -0,0 +1,188 @@
+"""
+@package    Statistics
+@brief      **Accumulators of read statistics for graphical and text outputs**
+The read coverage over junctions is accumulated in a difference array, where a read only increments
+its start position and decrements its end position, and the fragment lengths in an histogram of
+fixed 1 pb bins. The memory used does not depend on the number of reads, accumulators of several
+workers can be merged, and they can be exported in tsv files.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Third party packages
+import numpy as np
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class CoverageAccumulator(object):
+    """
+    @class CoverageAccumulator
+    @brief Read depth over the positions of a sequence of fixed length (the junctions) stored as a
+    difference array. The coverage is the cumulative sum of the array.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, length):
+        """
+        @param length Number of positions covered (int)
+        """
+        self.length = length
+        self.diff = np.zeros(length + 1, dtype=np.int64)
+
+    def __repr__(self):
+        return "{}\nPositions : {}\nMax coverage : {}\n".format(
+            self.__str__(), self.length, self.coverage().max() if self.length else 0)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_length(self):
+        return self.length
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def add(self, start, end):
+        """
+        Add a read covering the positions from start to end (excluded)
+        @param start Start position of the read (int)
+        @param end End position of the read (int)
+        """
+        self.diff[start] += 1
+        self.diff[end] -= 1
+
+    def add_block(self, starts, ends):
+        """
+        Add a block of reads at once
+        @param starts Start positions of the reads (list or numpy array of int)
+        @param ends End positions of the reads (list or numpy array of int)
+        """
+        if len(starts):
+            self.diff += np.bincount(starts, minlength=self.length + 1)
+            self.diff -= np.bincount(ends, minlength=self.length + 1)
+
+    def merge(self, other):
+        """
+        Add the reads of another accumulator of the same length
+        @param other Instance of CoverageAccumulator
+        """
+        self.diff += other.diff
+
+    def coverage(self):
+        """
+        @return The number of reads covering each position (numpy array)
+        """
+        return np.cumsum(self.diff[:-1])
+
+    def to_tsv(self, path):
+        """
+        Write the coverage in a tsv file with a position (starting at 1) and a depth per line
+        @param path Path of the output file (string)
+        """
+        with open(path, "w") as handle:
+            handle.write("position\tcoverage\n")
+            handle.write("".join(["{}\t{}\n".format(i, cov)
+                for i, cov in enumerate(self.coverage().tolist(), 1)]))
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class LengthHistogram(object):
+    """
+    @class LengthHistogram
+    @brief Counts of lengths (the fragment lengths) in bins of 1 pb from 0 to the largest length
+    added. The bins are extended if longer lengths are added.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, max_len=0):
+        """
+        @param max_len Largest length expected, to allocate the bins at once (int)
+        """
+        self.counts = np.zeros(max_len + 1, dtype=np.int64)
+
+    def __repr__(self):
+        return "{}\nLengths : {}\nTotal : {}\n".format(
+            self.__str__(), len(self.counts) - 1, self.total())
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def add(self, length):
+        """
+        @param length Length to count (int)
+        """
+        if length >= len(self.counts):
+            self._extend(length + 1)
+        self.counts[length] += 1
+
+    def add_block(self, lengths):
+        """
+        Count a block of lengths at once
+        @param lengths Lengths to count (list or numpy array of int)
+        """
+        if len(lengths):
+            self._add_counts(np.bincount(lengths))
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram
+        @param other Instance of LengthHistogram
+        """
+        self._add_counts(other.counts)
+
+    def total(self):
+        """
+        @return The number of lengths counted (int)
+        """
+        return int(self.counts.sum())
+
+    def lengths(self):
+        """
+        @return The lengths counted at least once and their counts (tuple of numpy arrays)
+        """
+        lengths = np.flatnonzero(self.counts)
+        return lengths, self.counts[lengths]
+
+    def to_tsv(self, path):
+        """
+        Write the histogram in a tsv file with a length and a count per line, from the shortest to
+        the longest length counted
+        @param path Path of the output file (string)
+        """
+        lengths = np.flatnonzero(self.counts)
+        with open(path, "w") as handle:
+            handle.write("length\tcount\n")
+            if len(lengths):
+                first, last = lengths[0], lengths[-1]
+                handle.write("".join(["{}\t{}\n".format(length, count)
+                    for length, count in enumerate(self.counts[first:last+1].tolist(), first)]))
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _extend(self, size):
+        """
+        @param size New number of bins (int)
+        """
+        counts = np.zeros(size, dtype=np.int64)
+        counts[:len(self.counts)] = self.counts
+        self.counts = counts
+
+    def _add_counts(self, counts):
+        """
+        @param counts Counts per length starting at 0 (numpy array)
+        """
+        if len(counts) > len(self.counts):
+            self._extend(len(counts))
+        self.counts[:len(counts)] += counts
@@ -0,0 +1,391 @@
+"""
+@package    TruthAlignment
+@brief      **Golden truth alignments of simulated reads in BAM or SAM format**
+The true origin of each read is written as an alignment record on the host and virus sequences,
+with its position, strand and CIGAR, so that aligners and integration site callers can be
+evaluated by comparing coordinates instead of parsing read identifiers. A read overlapping a
+junction is split in a primary record for its longest part and a supplementary record for the
+chimeric part, soft clipped and linked by SA tags. Records are formated by blocks of reads in the
+same pass as the fastq, and written in a BGZF file (BAM, or SAM text compressed with bgzip).
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from struct import pack
+
+# Third party packages
+import numpy as np
+
+# Local packages
+from Reference import ReferenceJunctions
+from SlicePicker import RawRead
+from FastqGenerator import phred_chars
+from Utilities import reverse_complement
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Mapping quality of truth records (255 = not available)
+MAPQ = 255
+## Flags of the first and second read of a pair, of a properly paired read, of a reverse read or
+## mate and of a supplementary record
+FLAG_PAIRED, FLAG_PROPER, FLAG_REVERSE, FLAG_MATE_REVERSE = 0x1, 0x2, 0x10, 0x20
+FLAG_R1, FLAG_R2, FLAG_SUPPLEMENTARY = 0x41, 0x81, 0x800
+## Bases in the order of their 4 bits code in BAM records
+BAM_BASES = "=ACMGRSVTWYHKDBN"
+
+def _nibble_table():
+    """
+    @return A translation table converting DNA bases in upper or lower case in their 4 bits BAM
+    code. Other characters are coded as N (string)
+    """
+    table = [chr(15)] * 256
+    for code, base in enumerate(BAM_BASES):
+        table[ord(base)] = table[ord(base.lower())] = chr(code)
+    return "".join(table)
+
+## Translation table of DNA bases in 4 bits BAM codes
+NIBBLE_TABLE = _nibble_table()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class TruthAlignment(object):
+    """
+    @class TruthAlignment
+    @brief Format the true alignments of RawRead objects in BAM or SAM records. Sequences of the
+    host and virus references are declared in the header, and the name of a record is the read
+    identifier up to its second | (source name and read number), or the short numeric read id,
+    shared by both reads of a pair.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, refs, fmt="bam", qual_scale="fastq-sanger", program=None, offsets=None):
+        """
+        @param refs List of ReferenceGenome declared as alignment targets (list)
+        @param fmt Output format : bam or sam (string)
+        @param qual_scale Quality scale of the quality strings of reads (string)
+        @param program Name, version and command line of the program for the @PG line (tuple)
+        @param offsets Number of the first read of each source name when reads have short numeric
+        ids, or None (dict)
+        @exception ValueError Raise if the format is not bam or sam
+        """
+        if fmt not in ("bam", "sam"):
+            raise ValueError("Invalid truth alignment format {}".format(fmt))
+        self.fmt = fmt
+        self.program = program
+        self.offsets = offsets
+
+        # Sequences of all references, prefixed by the name of their reference if a sequence name
+        # is used in several references
+        contigs = contig_table(refs)
+        count = {}
+        for ref_name, name, length in contigs:
+            count[name] = count.get(name, 0) + 1
+        self.ref_names = [name if count[name] == 1 else "{}:{}".format(ref_name, name)
+            for ref_name, name, length in contigs]
+        self.ref_lens = [length for ref_name, name, length in contigs]
+        self.ref_ids = {(ref_name, name): i for i, (ref_name, name, length) in enumerate(contigs)}
+
+        # Translation table decoding quality characters in raw PHRED bytes (BAM) or in sanger
+        # characters (SAM). Lower PHRED values are kept for characters shared by several values
+        offset = 0 if fmt == "bam" else 33
+        table = [chr(i) for i in range(256)]
+        for phred, char in reversed(list(enumerate(phred_chars(qual_scale)))):
+            table[ord(char)] = chr(phred + offset)
+        self.qual_table = "".join(table)
+
+    def __repr__(self):
+        return "{}\nFormat : {}\nSequences : {}\n".format(self.__str__(), self.fmt, len(self.ref_names))
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_format(self):
+        return self.fmt
+
+    def get_ref_names(self):
+        return self.ref_names
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def header(self):
+        """
+        @return The SAM text header, encoded in binary in BAM format (string)
+        """
+        text = "@HD\tVN:1.6\tSO:unsorted\tGO:query\n"
+        text += "".join(["@SQ\tSN:{}\tLN:{}\n".format(name, length)
+            for name, length in zip(self.ref_names, self.ref_lens)])
+        if self.program:
+            text += "@PG\tID:{0}\tPN:{0}\tVN:{1}\tCL:{2}\n".format(*self.program)
+        if self.offsets is None:
+            text += "@CO\tTrue origin of simulated reads. QNAME is the read id up to its second |\n"
+        else:
+            text += "@CO\tTrue origin of simulated reads. QNAME is the numeric read id\n"
+
+        if self.fmt == "sam":
+            return text
+        refs = "".join([pack("<i", len(name) + 1) + name + "\0" + pack("<i", length)
+            for name, length in zip(self.ref_names, self.ref_lens)])
+        return "BAM\1" + pack("<i", len(text)) + text + pack("<i", len(self.ref_names)) + refs
+
+    def format_reads(self, reads, first, id_len):
+        """
+        Format the truth records of a block of single end reads
+        @param reads List of RawRead from the same source
+        @param first Number of the first read of the block in its source (int)
+        @param id_len Max number of digit of read numbers (int)
+        @return The records of the block (string)
+        """
+        if not reads:
+            return ""
+        template, offset = self._name_template(reads[0].source, id_len)
+        records = []
+        for i, read in enumerate(reads, first + offset):
+            records.extend(self._read_records(template % i, read, self._segments(read), 0))
+        return self._serialize(records)
+
+    def format_pairs(self, pairs, first, id_len):
+        """
+        Format the truth records of a block of read pairs. Pairs entirely aligned on a single
+        sequence are flagged as properly paired, with the fragment length as template length
+        @param pairs List of RawRead pairs from the same source
+        @param first Number of the first read pair of the block in its source (int)
+        @param id_len Max number of digit of read numbers (int)
+        @return The records of the block (string)
+        """
+        if not pairs:
+            return ""
+        template, offset = self._name_template(pairs[0][0].source, id_len)
+        records = []
+        for i, (read1, read2) in enumerate(pairs, first + offset):
+            segs1, segs2 = self._segments(read1), self._segments(read2)
+            mate1, mate2 = segs1[0], segs2[0]
+            flag, tlen1, tlen2 = FLAG_PAIRED, 0, 0
+
+            if len(segs1) == len(segs2) == 1 and mate1[0] == mate2[0]:
+                flag |= FLAG_PROPER
+                # The leftmost read has a positive template length
+                start = min(mate1[1], mate2[1])
+                end = max(mate1[1] + mate1[4], mate2[1] + mate2[4])
+                tlen1 = end - start if mate1[1] <= mate2[1] else start - end
+                tlen2 = -tlen1
+
+            records.extend(self._read_records(template % i, read1, segs1, flag | FLAG_R1, mate2, tlen1))
+            records.extend(self._read_records(template % i, read2, segs2, flag | FLAG_R2, mate1, tlen2))
+        return self._serialize(records)
+
+    #~~~~~~~PRIVATE METHODS~~~~~~~#
+
+    def _name_template(self, source, id_len):
+        """
+        @param source Instance of ReferenceGenome or ReferenceJunctions
+        @param id_len Max number of digit of read numbers (int)
+        @return The template of record names of a source, identical to the beginning of read ids,
+        and the number added to read numbers (tuple)
+        """
+        if self.offsets is not None:
+            return "%d", self.offsets[source.getName()]
+        return "{}|%0{}d".format(source.getName().replace("%", "%%"), id_len), 0
+
+    def _segments(self, read):
+        """
+        Align a read on its source. A read from a junction is split in a segment per side of the
+        junction overlapped, the longest segment being the first
+        @param read RawRead object
+        @return A list of segments as (reference sequence index, start, reverse strand, left soft
+        clip, aligned length, right soft clip, edit distance). Clips are given along the reference
+        strand (list of tuple)
+        """
+        length = len(read.seq)
+        source = read.source
+        if not isinstance(source, ReferenceJunctions):
+            return [(self.ref_ids[(source.getName(), read.refseq.id)], read.start,
+                read.orientation == "-", 0, length, 0, read.mutations)]
+
+        # Unmutated forward sequence of the junction to count the substitutions of each segment
+        ref_seq = source.fetch(read.refseq, read.start, read.end).upper() if read.mutations else None
+        read_seq = read.seq.upper() if read.orientation == "+" else reverse_complement(read.seq.upper())
+
+        index = read.refseq.index
+        half_len = source.half_len
+        segments = []
+        for side, start, end in ((0, read.start, min(read.end, half_len)), (1, max(read.start, half_len), read.end)):
+            if start >= end:
+                continue
+            # Part of the read along the forward junction and along the side of the junction
+            u, v = start - read.start, end - read.start
+            side_start, side_end = start - side * half_len, end - side * half_len
+            name = source.contig_names[side][source.contig[side, index]]
+            ref_id = self.ref_ids[(source.refs[side].getName(), name)]
+            location = int(source.location[side, index])
+            edit = sum([a != b for a, b in zip(read_seq[u:v], ref_seq[u:v])]) if ref_seq else 0
+
+            if source.forward[side, index]:
+                segments.append((ref_id, location + side_start, read.orientation == "-",
+                    u, v - u, length - v, edit))
+            else:
+                segments.append((ref_id, location + half_len - side_end, read.orientation == "+",
+                    length - v, v - u, u, edit))
+
+        # The longest segment is the primary record
+        segments.sort(key=lambda segment: -segment[4])
+        return segments
+
+    def _read_records(self, name, read, segments, flag, mate=None, tlen=0):
+        """
+        @param name Name of the records (string)
+        @param read RawRead object
+        @param segments Segments of the read returned by _segments (list)
+        @param flag Flags common to all the records of the read (int)
+        @param mate Primary segment of the mate or None (tuple)
+        @param tlen Template length (int)
+        @return A list of records as (name, flag, segment, sequence, quality, mate segment, template
+        length, SA tag) tuples, the sequence and quality being along the reference strand (list)
+        """
+        forward = (read.seq, read.qual.translate(self.qual_table))
+        reverse = None
+        if mate and mate[2]:
+            flag |= FLAG_MATE_REVERSE
+
+        records = []
+        for k, segment in enumerate(segments):
+            if segment[2] and not reverse:
+                reverse = (reverse_complement(read.seq), forward[1][::-1])
+            seq, qual = reverse if segment[2] else forward
+            supplementary = ";".join([self._sa_entry(other) for other in segments if other is not segment])
+            records.append((name, flag | (FLAG_REVERSE if segment[2] else 0) | (FLAG_SUPPLEMENTARY if k else 0),
+                segment, seq, qual, mate, tlen, supplementary + ";" if supplementary else None))
+        return records
+
+    def _sa_entry(self, segment):
+        """
+        @param segment Segment returned by _segments (tuple)
+        @return The description of the segment in a SA tag (string)
+        """
+        return "{},{},{},{},{},{}".format(self.ref_names[segment[0]], segment[1] + 1,
+            "-" if segment[2] else "+", _cigar_string(segment), MAPQ, segment[6])
+
+    def _serialize(self, records):
+        """
+        @param records Records returned by _read_records (list)
+        @return The records in the output format (string)
+        """
+        if self.fmt == "sam":
+            return "".join([self._sam_record(*record) for record in records])
+
+        # The 4 bits codes of all sequences are packed in bytes at once, sequences being padded to
+        # an even length so that a byte never contains bases from 2 records
+        codes = np.frombuffer("".join([seq + "=" * (len(seq) % 2) for name, flag, segment, seq,
+            qual, mate, tlen, sa in records]).translate(NIBBLE_TABLE), dtype=np.uint8)
+        packed = ((codes[0::2] << 4) | codes[1::2]).tostring()
+
+        chunks = []
+        offset = 0
+        for name, flag, segment, seq, qual, mate, tlen, sa in records:
+            size = (len(seq) + 1) // 2
+            chunks.append(self._bam_record(name, flag, segment, packed[offset:offset+size], qual,
+                mate, tlen, sa))
+            offset += size
+        return "".join(chunks)
+
+    def _bam_record(self, name, flag, segment, packed_seq, qual, mate, tlen, sa):
+        """
+        @return A BAM alignment record with its block size (string)
+        """
+        ref_id, pos, reverse, left, length, right, edit = segment
+        cigar = [(left << 4) | 4] if left else []
+        cigar.append(length << 4)
+        if right:
+            cigar.append((right << 4) | 4)
+
+        tags = "NMi" + pack("<i", edit)
+        if sa:
+            tags += "SAZ" + sa + "\0"
+
+        data = pack("<iiBBHHHiiii", ref_id, pos, len(name) + 1, MAPQ, reg2bin(pos, pos + length),
+            len(cigar), flag, len(qual), mate[0] if mate else -1, mate[1] if mate else -1, tlen)
+        data += name + "\0" + pack("<{}I".format(len(cigar)), *cigar) + packed_seq + qual + tags
+        return pack("<i", len(data)) + data
+
+    def _sam_record(self, name, flag, segment, seq, qual, mate, tlen, sa):
+        """
+        @return A SAM alignment line (string)
+        """
+        if mate:
+            mate_ref = "=" if mate[0] == segment[0] else self.ref_names[mate[0]]
+            mate_pos = mate[1] + 1
+        else:
+            mate_ref, mate_pos = "*", 0
+
+        line = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\tNM:i:{}".format(name, flag,
+            self.ref_names[segment[0]], segment[1] + 1, MAPQ, _cigar_string(segment), mate_ref,
+            mate_pos, tlen, seq.upper(), qual, segment[6])
+        if sa:
+            line += "\tSA:Z:" + sa
+        return line + "\n"
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def reg2bin(start, end):
+    """
+    Compute the bin of the UCSC binning scheme used by BAM indexes, the smallest bin of 16 kb,
+    128 kb, 1 Mb, 8 Mb or 64 Mb containing an interval (SAM/BAM specification)
+    @param start Start position of the interval (int)
+    @param end End position of the interval, excluded (int)
+    @return The number of the bin (int)
+    """
+    end -= 1
+    if start >> 14 == end >> 14:
+        return 4681 + (start >> 14)
+    if start >> 17 == end >> 17:
+        return 585 + (start >> 17)
+    if start >> 20 == end >> 20:
+        return 73 + (start >> 20)
+    if start >> 23 == end >> 23:
+        return 9 + (start >> 23)
+    if start >> 26 == end >> 26:
+        return 1 + (start >> 26)
+    return 0
+
+def contig_table(refs):
+    """
+    List the sequences of references in the order of the truth alignment header, each reference
+    in the order of its fasta file. Positions of sequences in this list are the contig indexes of
+    truth records and read indexes.
+    @param refs List of ReferenceGenome (list)
+    @return A list of (reference name, sequence name, sequence length) tuples (list)
+    """
+    return [(ref.getName(), name, len(ref.d[name])) for ref in refs for name in ref.fasta_names]
+
+def raw_from_record(record, qual_table):
+    """
+    Convert a SeqRecord read of the SeqRecord engine in a RawRead, to format its truth records
+    @param record SeqRecord read with its annotations and phred_quality letter annotation
+    @param qual_table Translation table encoding raw PHRED bytes in the quality scale (string)
+    @return A RawRead object with an encoded quality string
+    """
+    d = record.annotations
+    read = RawRead(str(record.seq), d["source"], d["refseq"], d["location"][0], d["location"][1],
+        d["orientation"], d.get("mate"))
+    read.mutations = len(d.get("Mutations", []))
+    read.qual = str(bytearray(record.letter_annotations["phred_quality"])).translate(qual_table)
+    return read
+
+def _cigar_string(segment):
+    """
+    @param segment Segment returned by TruthAlignment._segments (tuple)
+    @return The CIGAR string of the segment (string)
+    """
+    left, length, right = segment[3:6]
+    return "{}{}M{}".format("{}S".format(left) if left else "", length,
+        "{}S".format(right) if right else "")
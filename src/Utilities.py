@@ -133,6 +133,21 @@ def dir_name (path):
     """
     return path.rpartition("/")[0].rpartition("/")[2]
 
+def file_digest (path, block_size=1048576):
+    """
+    Return the md5 hash of the content of a file read by blocks
+    @param path Filepath as a string
+    @param block_size Size of the blocks read (int)
+    """
+    # Function specific imports
+    from hashlib import md5
+
+    digest = md5()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
 #~~~~~~~FASTA UTILITIES~~~~~~~#
 
 def import_seq(filename, col_type="dict", seq_type="fasta"):
@@ -189,6 +204,31 @@ def import_seq(filename, col_type="dict", seq_type="fasta"):
         print (E)
         exit
 
+def reverse_complement(seq):
+    """
+    Return the reverse complement of a DNA sequence string. Lowercase and IUPAC ambiguous bases
+    are complemented the same way as with Biopython Seq.reverse_complement
+    @param seq DNA sequence (string)
+    @return The reverse complement sequence (string)
+    """
+    return seq.translate(DNA_COMPLEMENT_TABLE)[::-1]
+
+def _complement_table():
+    """
+    Create a string translation table complementing IUPAC ambiguous DNA bases in upper and lower
+    cases, identical to Bio.Data.IUPACData.ambiguous_dna_complement
+    @return A translation table usable with str.translate
+    """
+    # Function specific imports
+    from string import maketrans
+
+    before = "ACGTMRWSYKVHDBXN"
+    after = "TGCAKYWSRMBDHVXN"
+    return maketrans(before + before.lower(), after + after.lower())
+
+## Translation table used by reverse_complement
+DNA_COMPLEMENT_TABLE = _complement_table()
+
 #~~~~~~~GRAPHICAL UTILIES~~~~~~~#
 
 def fill_between_graph (X, Y, basename="out", img_type="png", title=None, xlabel=None, ylabel=None, baseline=0):
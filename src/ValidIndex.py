@@ -0,0 +1,259 @@
+"""
+@package    ValidIndex
+@brief      **Index of valid sampling windows in a reference genome**
+For a given window length and DNA alphabet, list all start positions of windows containing only
+allowed bases, as runs in a global coordinate system (sequences laid end to end). Windows can then
+be drawn uniformly among valid positions so that no rejection is needed. Indexes are cached on disk
+next to the fasta file and reused while the fasta file is unchanged. This module require the Third
+party package numpy.
+@copyright  [GNU General Public License v2](http://www.gnu.org/licenses/gpl-2.0.html)
+@author     Adrien Leger - 2014
+* <adrien.leger@gmail.com>
+* <adrien.leger@inserm.fr>
+* <adrien.leger@univ-nantes.fr>
+* [Github](https://github.com/a-slide)
+* [Atlantic Gene Therapies - INSERM 1089] (http://www.atlantic-gene-therapies.fr/)
+"""
+
+#~~~~~~~PACKAGE IMPORTS~~~~~~~#
+
+# Standard library packages
+from hashlib import md5
+from zipfile import BadZipfile
+import os
+from os import path
+
+# Third party packages
+import numpy as np
+
+# Local packages
+from PackedGenome import PackedRecord, _runs
+
+#~~~~~~~GLOBAL VARIABLES~~~~~~~#
+
+## Number of bases read at once to index sequences which are not packed
+INDEX_CHUNK = 16777216
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class ValidIndex(object):
+    """
+    @class ValidIndex
+    @brief Runs of valid window start positions for a window length and an alphabet. Positions
+    are global coordinates: position p of the sequence i is offsets[i] + p.
+    """
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+    #~~~~~~~FONDAMENTAL METHODS~~~~~~~#
+
+    def __init__(self, window, names, lengths, starts, ends):
+        """
+        @param window Length of the windows (int)
+        @param names Names of the sequences in the global coordinate order (list of string)
+        @param lengths Lengths of the sequences (numpy array)
+        @param starts Global start of each run of valid window starts (numpy array)
+        @param ends Global end (excluded) of each run of valid window starts (numpy array)
+        """
+        self.window = window
+        self.names = names
+        self.lengths = lengths
+        ## Global coordinate of the first base of each sequence
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        self.starts = starts
+        self.ends = ends
+        ## Cumulative number of valid positions at the end of each run
+        self.cum_count = np.cumsum(ends - starts)
+        self.total = int(self.cum_count[-1]) if len(self.cum_count) else 0
+
+    def __repr__(self):
+        return "{}\nWindow : {}\nRuns : {}\nValid positions : {}\n".format(
+            self.__str__(), self.window, len(self.starts), self.total)
+
+    def __str__(self):
+        return "<Instance of {} from {} >".format(self.__class__.__name__, self.__module__)
+
+    #~~~~~~~ACCESS METHODS~~~~~~~#
+
+    def get_window(self):
+        return self.window
+
+    def get_total(self):
+        return self.total
+
+    #~~~~~~~PUBLIC METHODS~~~~~~~#
+
+    def position(self, k):
+        """
+        Convert ranks of valid positions into sequence indices and local start positions
+        @param k Rank(s) of valid positions between 0 and total (int or numpy array)
+        @return Sequence index and start position along the sequence (int or numpy arrays)
+        """
+        run = np.searchsorted(self.cum_count, k, side="right")
+        gpos = self.starts[run] + (k - (self.cum_count[run] - (self.ends[run] - self.starts[run])))
+        seq = np.searchsorted(self.offsets, gpos, side="right") - 1
+        return seq, gpos - self.offsets[seq]
+
+    def draw(self, u, size):
+        """
+        Draw start positions of slices which windows at both ends contain only allowed bases.
+        The first window is valid by construction while the slice boundaries and the last window
+        have to be verified for slices longer than the windows.
+        @param u Uniform random value(s) between 0 and 1 (float or numpy array)
+        @param size Size(s) of the slices (int or numpy array)
+        @return Sequence index(es), start position(s) and True for valid slice(s)
+        """
+        seq, start = self.position(np.minimum(np.int64(np.multiply(u, self.total)), self.total - 1))
+        if np.all(np.equal(size, self.window)):
+            return seq, start, np.ones_like(seq, dtype=bool)
+        end = start + size
+        ok = (end <= self.lengths[seq]) & self.is_valid(seq, np.minimum(end, self.lengths[seq]) - self.window)
+        return seq, start, ok
+
+    def is_valid(self, seq, pos):
+        """
+        @param seq Sequence index(es) (int or numpy array)
+        @param pos Window start position(s) along the sequence (int or numpy array)
+        @return True for window(s) containing only allowed bases (bool or numpy array)
+        """
+        gpos = self.offsets[seq] + pos
+        run = np.searchsorted(self.starts, gpos, side="right") - 1
+        return (run >= 0) & (gpos < self.ends[np.maximum(run, 0)])
+
+    def save(self, fp, fingerprint):
+        """
+        Save the index in a numpy npz file. The file is written under a temporary name and renamed
+        so that concurrent processes never read an incomplete index
+        @param fp Path of the index file (string)
+        @param fingerprint Description of the source fasta file used to invalidate the cache (string)
+        """
+        tmp = "{}.{}.tmp".format(fp, os.getpid())
+        with open(tmp, "wb") as handle:
+            np.savez(handle, window=self.window, names=np.array(self.names), lengths=self.lengths,
+                starts=self.starts, ends=self.ends, fingerprint=fingerprint)
+        os.rename(tmp, fp)
+
+#~~~~~~~FUNCTIONS~~~~~~~#
+
+def index_path(fasta_path, window, alphabet):
+    """
+    @param fasta_path Path of the fasta file (string)
+    @param window Length of the windows (int)
+    @param alphabet String of allowed bases (string)
+    @return Path of the cached index file next to the fasta file (string)
+    """
+    return "{}.valid{}.{}.npz".format(fasta_path, window, md5("".join(sorted(alphabet))).hexdigest()[:8])
+
+def fingerprint(fasta_path):
+    """
+    @param fasta_path Path of the fasta file (string)
+    @return A string made of the size and modification time of the file (string)
+    """
+    return "{}:{}".format(path.getsize(fasta_path), path.getmtime(fasta_path))
+
+def load_index(fasta_path, window, alphabet, names):
+    """
+    Load a cached index if it exists and was created from the current fasta file
+    @param fasta_path Path of the fasta file (string)
+    @param window Length of the windows (int)
+    @param alphabet String of allowed bases (string)
+    @param names Expected names of the sequences in the global coordinate order (list of string)
+    @return A ValidIndex or None if no valid cache was found
+    """
+    fp = index_path(fasta_path, window, alphabet)
+    try:
+        data = np.load(fp)
+        if str(data["fingerprint"]) != fingerprint(fasta_path) or data["names"].tolist() != names:
+            return None
+        return ValidIndex(int(data["window"]), names, data["lengths"], data["starts"], data["ends"])
+    except (IOError, OSError, KeyError, ValueError, BadZipfile):
+        return None
+
+def build_index(fasta_path, records, window, alphabet, names):
+    """
+    Build the index of valid windows of a list of sequences and try to cache it on disk
+    @param fasta_path Path of the source fasta file, None to disable the disk cache (string)
+    @param records List of SeqRecord, PackedRecord or FaidxRecord in the global coordinate order
+    @param window Length of the windows (int)
+    @param alphabet String of allowed bases (string)
+    @param names Names of the sequences in the global coordinate order (list of string)
+    @return A ValidIndex
+    """
+    print("\tIndexing valid windows of {} bases".format(window))
+    lengths = np.array([len(record) for record in records], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    starts_list = []
+    ends_list = []
+
+    for offset, record in zip(offsets, records):
+        inv_starts, inv_ends = _invalid_runs(record, alphabet)
+
+        # Gaps between invalid runs long enough to contain a window
+        gap_starts = np.concatenate(([0], inv_ends))
+        gap_ends = np.concatenate((inv_starts, [len(record)]))
+        keep = gap_ends - gap_starts >= window
+        starts_list.append(gap_starts[keep] + offset)
+        ends_list.append(gap_ends[keep] - window + 1 + offset)
+
+    index = ValidIndex(window, names, lengths, np.concatenate(starts_list).astype(np.int64),
+        np.concatenate(ends_list).astype(np.int64))
+
+    # The cache is facultative if the directory is not writable
+    if fasta_path:
+        try:
+            index.save(index_path(fasta_path, window, alphabet), fingerprint(fasta_path))
+        except (IOError, OSError):
+            pass
+
+    return index
+
+def _invalid_runs(record, alphabet):
+    """
+    Find the runs of bases not allowed by the alphabet in a sequence. For packed records, runs are
+    directly derived from the ambiguous and lowercase runs without decoding the sequence.
+    @param record SeqRecord, PackedRecord or FaidxRecord
+    @param alphabet String of allowed bases (string)
+    @return Sorted and merged arrays of start and end positions of invalid runs
+    """
+    if isinstance(record, PackedRecord):
+        allowed_upper = np.zeros(256, dtype=bool)
+        for base in alphabet:
+            allowed_upper[ord(base.upper())] = True
+        # Ambiguous letters not allowed, and lowercase bases if repeats are not allowed
+        keep = ~allowed_upper[record.amb_letters]
+        starts = record.amb_starts[keep].astype(np.int64)
+        ends = record.amb_ends[keep].astype(np.int64)
+        if not any(base.islower() for base in alphabet):
+            starts = np.concatenate((starts, record.mask_starts.astype(np.int64)))
+            ends = np.concatenate((ends, record.mask_ends.astype(np.int64)))
+        return _merge_runs(starts, ends)
+
+    allowed = np.zeros(256, dtype=bool)
+    for base in alphabet:
+        allowed[ord(base)] = True
+
+    # Sequences are read by chunks to bound the memory used for indexed fasta files
+    starts_list = [np.zeros(0, dtype=np.int64)]
+    ends_list = [np.zeros(0, dtype=np.int64)]
+    for chunk_start in xrange(0, len(record), INDEX_CHUNK):
+        seq = np.frombuffer(str(record.seq[chunk_start:chunk_start+INDEX_CHUNK]), dtype=np.uint8)
+        starts, ends, _ = _runs(~allowed[seq])
+        starts_list.append(starts.astype(np.int64) + chunk_start)
+        ends_list.append(ends.astype(np.int64) + chunk_start)
+
+    # Runs interrupted at chunk boundaries are merged back
+    return _merge_runs(np.concatenate(starts_list), np.concatenate(ends_list))
+
+def _merge_runs(starts, ends):
+    """
+    Sort and merge overlapping or adjacent runs
+    @param starts Start positions of runs (numpy array)
+    @param ends End positions of runs (numpy array)
+    @return Arrays of start and end positions of merged runs
+    """
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="mergesort")
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # A new run begins where the start is after the furthest end of previous runs
+    new = np.concatenate(([True], starts[1:] > ends[:-1]))
+    group_ends = np.concatenate((np.flatnonzero(new)[1:] - 1, [len(starts) - 1]))
+    return starts[new], ends[group_ends]